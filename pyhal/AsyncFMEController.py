@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import time
+
+from pyhal import Protocol
+from pyhal.AsyncPort import AsyncPort
+from pyhal.CommandType import CommandType, CommandTypeBase
+from pyhal.Cancellation import CancellationToken
+from pyhal.Common import AddressSelector, CommandResponse, ErrorCode, PortResponse, TrackState
+from pyhal.CompletionModel import CompletionModel, default_model_path
+from pyhal.Connection import AsyncConnectionManager
+from pyhal.ExecutionOptions import DEFAULT_OPTIONS, ExecutionOptions
+from pyhal.FMEController import FMEController, batch_items, check_arguments
+from pyhal.Metrics import Metrics
+from pyhal.MotionPlan import MotionPlan, execute_plan, reset_running
+from pyhal.RetryPolicy import CircuitBreaker, RetryPolicy
+from pyhal.StatusCache import StatusCondition
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFMEController:
+    """
+    asyncio counterpart of FMEController.
+    Status waits yield to the event loop instead of sleeping, and cancelling a command sends its reset command.
+    """
+
+    port: AsyncPort
+    completion_model: CompletionModel
+    connection: AsyncConnectionManager
+    metrics: Metrics
+    breaker: CircuitBreaker
+    liveness_command: CommandType = CommandType.VERSION_SERIAL
+
+    def __init__(self, port: str = "COM1", baudrate: int = 9600, completion_model_path: str = None):
+        self.port = AsyncPort(port=port, baudrate=baudrate)
+        # learnt timings survive restarts; an empty path keeps them in memory only
+        self.completion_model = CompletionModel(default_model_path(port) if completion_model_path is None else completion_model_path)
+        self.port.framer.validate = self.validate_response
+        self.metrics = self.port.metrics
+        self.breaker = CircuitBreaker()
+        self.connection = AsyncConnectionManager(self.port, self.ping if self.liveness_command is not None else None)
+
+    # framing is identical to the blocking controller
+    validate_response = FMEController.validate_response
+
+    async def set_track(self, track_state: TrackState) -> PortResponse:
+        command = CommandType.TRACK_OPEN if track_state == TrackState.OPEN else CommandType.TRACK_CLOSE
+        return await self.retryable_command(command, retries=2, delay=5000)
+
+    def close(self):
+        """
+        Closes the port and saves the completion-time model.
+        """
+        self.connection.disconnect()
+        self.completion_model.save()
+
+    async def ping(self) -> bool:
+        """
+        Cheap liveness check: sends liveness_command directly, bypassing the connection manager.
+        """
+        command_type = self.liveness_command.value
+        response = await self.port.run(Protocol.exchange(self.port.state, command_type.address, command_type.frame, command_type.command_wait))
+        return response.success
+
+    async def send_command(
+        self, command: CommandType, *args, wait: bool = True, force: bool = False, options: ExecutionOptions = DEFAULT_OPTIONS
+    ) -> CommandResponse:
+        """
+        Executes the command, with options overriding its timeouts for this call and retrying as options.retry allows;
+        see FMEController.send_command.
+        """
+        logger.debug("sending command: %s %s", command.value.address.name, command.name)
+
+        command_type = check_arguments(command, args)
+
+        attempt = 0
+        while True:
+            response = await self.execute_once(command, args, wait, force, options)
+            if not options.retry.should_retry(attempt, response) or self.breaker.is_open(command_type.address):
+                return response
+
+            delay = options.retry.delay(attempt)
+            if options.deadline is not None and time.perf_counter() + delay / 1000 >= options.deadline:  # convert ms to seconds
+                return response
+
+            attempt += 1
+            self.metrics.record_retry(command.name, command_type.address)
+            logger.info("retrying %s after %s in %d ms", command.name, response.error.name, delay)
+            # a cancelled token fails the next attempt straight away
+            await self.port.pause(delay, options.token)
+
+    async def execute_once(self, command: CommandType, args: tuple, wait: bool, force: bool, options: ExecutionOptions) -> CommandResponse:
+        response = CommandResponse()
+
+        command_type: CommandTypeBase = command.value
+        if not self.breaker.allow(command_type.address):
+            logger.warning("%s not sent, %s is not responding", command.name, command_type.address.name)
+            response.error = ErrorCode.ARCUS_UNRESPONSIVE
+            return response
+
+        if not await self.connection.ensure():
+            logger.error("unable to open port")
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return response
+
+        start = time.perf_counter()
+        counters = self.metrics.counters()
+
+        operation = Protocol.execute(
+            self.port.state,
+            command_type,
+            *args,
+            wait=wait,
+            operation_timeout=options.operation_timeout,
+            completion_model=self.completion_model,
+            force=force,
+            wait_pause_time=options.wait_pause_time,
+            read_timeout=options.read_timeout,
+            token=options.token,
+            deadline=options.deadline,
+        )
+        try:
+            response = await self.port.run(operation)
+        except asyncio.CancelledError:
+            # the move may already be running, so stop it before giving up; shielded so a second cancel cannot skip it
+            logger.info("%s cancelled", command.name)
+            await asyncio.shield(self.port.run(Protocol.reset(self.port.state, command_type)))
+            raise
+        except OSError as e:
+            # serial errors included; only failures of the line count against the board
+            logger.error("error sending command %s: %s", command.name, e)
+            self.port.state.invalidate_selection()
+            self.port.state.outputs.invalidate()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+        except Exception:
+            # whatever was under way, the selection can no longer be trusted
+            self.port.state.invalidate_selection()
+            self.port.state.outputs.invalidate()
+            raise
+        self.metrics.record_command(command.name, command_type.address, (time.perf_counter() - start) * 1000, response.error, counters)
+        self.breaker.record(command_type.address, response)
+        await self.connection.report(response)
+
+        # a reset drops every board's selection and status
+        if command == CommandType.RESET:
+            self.port.state.invalidate()
+
+        logger.debug("execution finished; %s returned %s", command_type.command, response)
+        return response
+
+    async def retryable_command(self, command: CommandType, retries: int, delay: int) -> CommandResponse:
+        """
+        Executes the command with an operation timeout of delay ms, making up to retries attempts while it times out.
+        """
+        options = ExecutionOptions(operation_timeout=delay, retry=RetryPolicy(retries=max(0, retries - 1)))
+        return await self.send_command(command, options=options)
+
+    async def send_batch(
+        self,
+        commands: list,
+        pipelined: bool = True,
+        force: bool = False,
+        token: CancellationToken = None,
+        options: ExecutionOptions = DEFAULT_OPTIONS,
+    ) -> list[CommandResponse]:
+        """
+        Sends several commands, selecting each board once, with options overriding every command's timeouts;
+        see FMEController.send_batch.
+        """
+        items = batch_items(commands)
+        if not await self.connection.ensure():
+            logger.error("unable to open port")
+            response = CommandResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return [response] * len(items)
+
+        running = []
+        try:
+            responses = await self.port.run(
+                Protocol.execute_batch(
+                    self.port.state,
+                    items,
+                    pipelined,
+                    self.completion_model,
+                    force,
+                    token or options.token,
+                    options.operation_timeout,
+                    options.wait_pause_time,
+                    options.read_timeout,
+                    options.deadline,
+                    running,
+                )
+            )
+        except asyncio.CancelledError:
+            # shielded so a second cancel cannot skip the reset
+            logger.info("batch cancelled, resetting %d moves", len(running))
+            await asyncio.shield(self.port.run(Protocol.reset_all(self.port.state, running)))
+            raise
+        except Exception as e:
+            logger.error("error sending batch: %s", e)
+            self.port.state.invalidate_selection()
+            self.port.state.outputs.invalidate()
+            response = CommandResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            responses = [response] * len(items)
+
+        # a pipelined failure usually fails every item after it, so one check covers the batch
+        failed = next((response for response in responses if response.comm_error), None)
+        if failed is not None:
+            await self.connection.report(failed)
+
+        # a reset drops every board's selection and status
+        if any(command is CommandType.RESET.value for command, _ in items):
+            self.port.state.invalidate()
+
+        return responses
+
+    async def run_plan(
+        self, plan: MotionPlan, token: CancellationToken = None, deadline: float = None
+    ) -> tuple[ErrorCode, dict[str, CommandResponse]]:
+        """
+        Runs a motion plan, starting independent moves together; see MotionPlan.
+        Cancelling the task resets the moves under way before the cancellation propagates.
+        """
+        if not await self.connection.ensure():
+            logger.error("unable to open port")
+            return ErrorCode.COMMUNICATION_ERROR, {}
+
+        running = {}
+        try:
+            error, responses = await self.port.run(execute_plan(self.port.state, plan, self.completion_model, token, deadline, running))
+        except asyncio.CancelledError:
+            # shielded so a second cancel cannot skip the resets
+            logger.info("plan cancelled, resetting %d moves", len(running))
+            await asyncio.shield(self.port.run(reset_running(self.port.state, running)))
+            raise
+        except Exception as e:
+            logger.error("error running plan: %s", e)
+            self.port.state.invalidate_selection()
+            self.port.state.outputs.invalidate()
+            error, responses = ErrorCode.COMMUNICATION_ERROR, {}
+
+        if error == ErrorCode.COMMUNICATION_ERROR:
+            response = CommandResponse()
+            response.error = error
+            await self.connection.report(response)
+
+        return error, responses
+
+    async def read_status(self, address: AddressSelector, max_age: int = None) -> PortResponse:
+        """
+        Returns the status word of a board, reusing a cached poll younger than max_age ms.
+        """
+        # if this fails the operation reports the closed port as a communication error
+        await self.connection.ensure()
+        return await self.port.run(Protocol.read_status(self.port.state, address, max_age))
+
+    async def wait_for_status(
+        self, conditions: list[StatusCondition], match_all: bool = False, operation_timeout: int = None, wait_pause_time: int = 50
+    ) -> tuple[ErrorCode, list[StatusCondition]]:
+        """
+        Waits until any (or all, with match_all) of the status conditions hold.
+        """
+        await self.connection.ensure()
+        return await self.port.run(Protocol.wait_for_status(self.port.state, conditions, match_all, operation_timeout, wait_pause_time))
@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+
+from pyhal.Cancellation import CancellationToken
+from pyhal.Common import COMMAND_TERMINATOR, ErrorCode, PortResponse
+from pyhal.Metrics import Metrics
+from pyhal.Port import serial_backend
+from pyhal.Protocol import STATUS_FRAME, Operation, ProtocolState, ResponseFramer, Transmit, TransmitBatch
+
+if TYPE_CHECKING:
+    import serial
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPort:
+    """
+    asyncio counterpart of Port: it drives the same protocol operations, but every wait yields to the event loop.
+    """
+
+    port: "serial.Serial"
+    write_terminator: bytes = COMMAND_TERMINATOR
+    frame_gap: int = 0
+    last_frame_time: float = 0.0
+    write_timeout: int = 5000
+    open_pause: int = 3000
+    read_poll_interval: int = 1
+    framer: ResponseFramer
+    state: ProtocolState
+    metrics: Metrics
+
+    def __init__(self, port: str = "COM1", baudrate: int = 9600):
+        self.framer = ResponseFramer()
+        self.state = ProtocolState()
+        self.metrics = Metrics()
+        self.lock = asyncio.Lock()
+        self.readable = asyncio.Event()
+        self.pending = bytearray()
+        self.reader_fd = None
+        self.reader_loop: asyncio.AbstractEventLoop = None
+        # set once open has finished settling; the serial port itself is open from the start of it
+        self.ready = False
+        # reads never block: the port is drained whenever the event loop reports it readable
+        serial = serial_backend()
+        self.port = serial.serial_for_url(
+            port,
+            baudrate=baudrate,
+            bytesize=8,
+            parity=serial.PARITY_NONE,
+            stopbits=1,
+            timeout=0,
+            write_timeout=self.write_timeout / 1000,  # convert ms to seconds
+            do_not_open=True,
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.port is not None and self.port.is_open and self.ready
+
+    async def open(self) -> bool:
+        """
+        Opens the port and waits open_pause ms for the boards to settle. The whole open holds the lock and the port
+        only counts as open once it is done, so no other task sends while the boards are still starting up.
+        """
+        if self.port is None:
+            logger.error("port is not initialized")
+            return False
+
+        async with self.lock:
+            if self.is_open:
+                return True
+
+            # whatever board was selected before, and its status, is unknown after a reopen
+            self.state.invalidate()
+
+            try:
+                if not self.port.is_open:
+                    # set before opening, so devices without modem lines (ptys) don't fail the open
+                    self.port.rts = True  # enable RTS (Request to Send)
+                    self.port.dtr = True  # enable DTR (Data Terminal Ready)
+                    self.port.open()
+            except serial_backend().SerialException as e:
+                logger.error("error opening port %s: %s", self.port.name, e)
+                return False
+
+            await asyncio.sleep(self.open_pause / 1000)  # convert ms to seconds
+            logger.info("port %s opened successfully", self.port.name)
+
+            self.add_reader()
+            self.reset_port_buffers(True)
+            self.ready = True
+        return True
+
+    def close(self) -> bool:
+        if self.port is None or not self.port.is_open:
+            logger.debug("close: port is not open")
+            return False
+
+        self.ready = False
+        self.state.invalidate()
+        self.remove_reader()
+
+        try:
+            try:
+                self.port.rts = True
+                self.port.dtr = False
+            finally:
+                self.port.close()
+            logger.info("port %s closed successfully", self.port.name)
+        except (serial_backend().SerialException, OSError) as e:
+            logger.error("error closing port %s: %s", self.port.name, e)
+            return False
+
+        return True
+
+    def reset_port_buffers(self, reset_out: bool = False):
+        self.pending.clear()
+        self.port.reset_input_buffer()
+        if reset_out:
+            self.port.reset_output_buffer()
+
+    def add_reader(self):
+        """
+        Watches the port's file descriptor so incoming data is drained as soon as it arrives.
+        Transports without one (e.g. loop://) fall back to polling every read_poll_interval ms.
+        """
+        try:
+            fd = self.port.fileno()
+            loop = asyncio.get_running_loop()
+            loop.add_reader(fd, self.on_readable)
+            self.reader_fd = fd
+            self.reader_loop = loop
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            self.reader_fd = None
+
+    def remove_reader(self):
+        # the loop the reader was added to, close() may be called outside it (e.g. after asyncio.run returned)
+        if self.reader_fd is not None:
+            self.reader_loop.remove_reader(self.reader_fd)
+            self.reader_fd = None
+            self.reader_loop = None
+
+    def on_readable(self):
+        # drain the descriptor right away, otherwise the loop keeps reporting it readable
+        try:
+            chunk = self.port.read(max(1, self.port.in_waiting))
+        except serial_backend().SerialException as e:
+            logger.error("error reading port %s: %s", self.port.name, e)
+            self.remove_reader()
+            chunk = b""
+
+        if chunk:
+            self.pending += chunk
+        self.readable.set()
+
+    def take_pending(self) -> bytes:
+        if self.reader_fd is None:
+            waiting = self.port.in_waiting
+            if waiting:
+                self.pending += self.port.read(waiting)
+
+        chunk = bytes(self.pending)
+        self.pending.clear()
+        return chunk
+
+    async def wait_readable(self, timeout: float):
+        if self.reader_fd is None:
+            await asyncio.sleep(min(timeout, self.read_poll_interval / 1000))  # convert ms to seconds
+            return
+
+        self.readable.clear()
+        try:
+            await asyncio.wait_for(self.readable.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def read_inner(self, read_timeout: int = 5000) -> PortResponse:
+        # read until the framer has a complete response or the deadline expires, timeout in ms
+        deadline = time.perf_counter() + read_timeout / 1000  # convert ms to seconds
+        framer = self.framer
+        framer.reset()
+
+        while True:
+            chunk = self.take_pending()
+            if chunk:
+                response = framer.feed(chunk)
+                if response is not None:
+                    return response
+                continue
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return framer.timeout()
+
+            await self.wait_readable(remaining)
+
+    async def send_frame(self, frame: bytes, read_timeout: int = 5000) -> PortResponse:
+        """
+        Sends a pre-encoded, terminated frame and reads the response.
+        """
+        response = PortResponse()
+        if not self.is_open:
+            logger.warning("send/recv: port is not open")
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return response
+
+        self.reset_port_buffers()
+
+        # only wait out whatever part of the inter-frame gap has not already passed since the last response
+        if self.frame_gap > 0:
+            wait = self.frame_gap / 1000 - (time.perf_counter() - self.last_frame_time)  # convert ms to seconds
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        try:
+            self.port.write(frame)
+        except Exception as e:
+            logger.error("error sending command: %s", e)
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return response
+
+        try:
+            response = await self.read_inner(read_timeout)
+        except asyncio.CancelledError:
+            # the board's answer is still in flight, so nothing can be assumed about the selection
+            self.state.invalidate_selection()
+            raise
+        self.last_frame_time = time.perf_counter()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("sent %r, read %s: %r", frame, "ok" if response.success else response.error.name.lower(), response.raw_response)
+
+        return response
+
+    async def send_frames(self, frames: tuple[bytes, ...], read_timeout: int = 5000) -> list[PortResponse]:
+        """
+        Writes several frames in one go and reads one response per frame, stopping at the first timeout.
+        """
+        if not self.is_open:
+            logger.warning("send/recv: port is not open")
+            response = PortResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return [response]
+
+        self.reset_port_buffers()
+
+        if self.frame_gap > 0:
+            wait = self.frame_gap / 1000 - (time.perf_counter() - self.last_frame_time)  # convert ms to seconds
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        try:
+            self.port.write(b"".join(frames))
+        except Exception as e:
+            logger.error("error sending commands: %s", e)
+            response = PortResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return [response]
+
+        framer = self.framer
+        framer.reset()
+        responses = []
+        try:
+            while len(responses) < len(frames):
+                deadline = time.perf_counter() + read_timeout / 1000  # convert ms to seconds
+                while True:
+                    response = framer.next_response()
+                    if response is not None:
+                        break
+
+                    chunk = self.take_pending()
+                    if chunk:
+                        framer.extend(chunk)
+                        continue
+
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        response = framer.timeout()
+                        break
+                    await self.wait_readable(remaining)
+
+                responses.append(response)
+                if not response.success:
+                    break
+        except asyncio.CancelledError:
+            self.state.invalidate_selection()
+            raise
+        self.last_frame_time = time.perf_counter()
+        logger.debug("pipelined %d frames, %d responses", len(frames), len(responses))
+
+        return responses
+
+    async def send_recv(self, data: str, read_timeout: int = 5000) -> PortResponse:
+        return await self.send_frame(data.encode() + self.write_terminator, read_timeout)
+
+    async def pause(self, duration: float, token: CancellationToken = None):
+        """
+        Waits duration ms, returning early once token (which may be cancelled from any thread) is cancelled.
+        """
+        if token is None:
+            await asyncio.sleep(duration / 1000)  # convert ms to seconds
+            return
+
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: cancelled.done() or cancelled.set_result(None))
+
+        token.add_callback(wake)
+        try:
+            await asyncio.wait_for(cancelled, duration / 1000)  # convert ms to seconds
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            token.remove_callback(wake)
+
+    async def run(self, operation: Operation) -> Any:
+        """
+        Drives a protocol operation to completion, returning its result.
+        The operation owns the line except while it pauses, so other tasks' operations interleave between polls.
+        """
+        metrics = self.metrics
+        await self.lock.acquire()
+        held = True
+        try:
+            action = next(operation)
+            while True:
+                action_type = type(action)
+                if action_type is Transmit:
+                    start = time.perf_counter()
+                    result = await self.send_frame(action.frame, action.read_timeout)
+                    metrics.record_frames(
+                        action.address,
+                        (time.perf_counter() - start) * 1000,
+                        1,
+                        len(action.frame),
+                        len(result.raw_response or b""),
+                        action.frame == STATUS_FRAME,
+                        result.error,
+                    )
+                elif action_type is TransmitBatch:
+                    start = time.perf_counter()
+                    result = await self.send_frames(action.frames, action.read_timeout)
+                    metrics.record_frames(
+                        action.address,
+                        (time.perf_counter() - start) * 1000,
+                        len(action.frames),
+                        sum(len(frame) for frame in action.frames),
+                        sum(len(response.raw_response or b"") for response in result),
+                        sum(frame == STATUS_FRAME for frame in action.frames),
+                        next((response.error for response in result if response.error is not None), None),
+                    )
+                else:
+                    self.lock.release()
+                    held = False
+                    await self.pause(action.duration, action.token)
+                    await self.lock.acquire()
+                    held = True
+                    result = None
+                action = operation.send(result)
+        except StopIteration as e:
+            return e.value
+        finally:
+            if held:
+                self.lock.release()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from typing import Callable
+
+from pyhal import Protocol
+from pyhal.CommandType import CommandType
+from pyhal.Common import ErrorCode
+from pyhal.ExecutionOptions import ExecutionOptions
+from pyhal.FMEController import FMEController
+from pyhal.Port import Port
+from pyhal.RetryPolicy import RetryPolicy
+
+RESULTS_VERSION = 1
+
+# ratio to the baseline median above which compare() reports a regression (0.1 = 10% slower)
+DEFAULT_THRESHOLD = 0.1
+
+
+class PreloadedSerial:
+    """
+    Stands in for the serial device in the read benchmarks: every read returns up to chunk bytes of data,
+    as a driver hands over whatever arrived since the last call.
+    """
+
+    def __init__(self, data: bytes, chunk: int):
+        self.data = data
+        self.chunk = chunk
+        self.offset = 0
+        self.timeout = None
+
+    @property
+    def in_waiting(self) -> int:
+        return min(self.chunk, len(self.data) - self.offset)
+
+    def read(self, size: int = 1) -> bytes:
+        size = min(size, self.chunk)
+        data = self.data[self.offset : self.offset + size]
+        self.offset += len(data)
+        return data
+
+
+def measure(operation: Callable[[], object], iterations: int, repeat: int, warmup: int = None) -> dict:
+    """
+    Runs operation iterations times per round for repeat rounds, after a warm-up, and summarises the time per call.
+    """
+    for _ in range(iterations if warmup is None else warmup):
+        operation()
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        rounds.append((time.perf_counter() - start) / iterations * 1e6)  # convert seconds to us
+
+    median = statistics.median(rounds)
+    return {
+        "unit": "us",
+        "median": median,
+        "min": min(rounds),
+        "stdev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "ops_per_second": 1e6 / median if median else None,
+        "iterations": iterations,
+        "repeat": repeat,
+    }
+
+
+def simulated_controller() -> FMEController:
+    # wire=0 leaves out the time the bytes would take at 9600 baud, only pyhal's own overhead is measured
+    controller = FMEController(port="sim://?wire=0&scale=0&seed=7", completion_model_path="")
+    controller.port.open_pause = 0
+    controller.connection.ensure()
+    return controller
+
+
+def bench_send_recv(scale: int) -> dict:
+    controller = simulated_controller()
+    port = controller.port
+    return measure(lambda: port.send_recv("H001"), 500 * scale, 5)
+
+
+def bench_read_inner(scale: int) -> dict:
+    """
+    Throughput of read_inner for responses of increasing size, read in 64 byte chunks.
+    """
+    results = {}
+    port = Port(port="loop://")
+    for size in (16, 256, 4096):
+        data = b"0" * (size - 2) + b"OK"
+        serial = PreloadedSerial(data, 64)
+        port.port = serial
+
+        def read():
+            serial.offset = 0
+            return port.read_inner(1000)
+
+        result = measure(read, 200 * scale, 5)
+        result["megabytes_per_second"] = size / result["median"]
+        results[str(size)] = result
+    return results
+
+
+def bench_validate_response(scale: int) -> dict:
+    status = b"000001000000000000000000OK"
+    partial = b"0" * 4096
+    return {
+        "status": measure(lambda: Protocol.validate_response(status, 20), 5000 * scale, 5),
+        "partial_4096": measure(lambda: Protocol.validate_response(partial, 4032), 5000 * scale, 5),
+    }
+
+
+def bench_execute(scale: int) -> dict:
+    controller = simulated_controller()
+    port = controller.port
+    no_wait = CommandType.RINGLIGHT_ON.value
+    move = CommandType.TRACK_OPEN.value
+    # poll straight away, the simulated move is over as soon as it starts
+    polling = ExecutionOptions(wait_pause_time=0, operation_timeout=1000)
+    return {
+        "no_wait": measure(lambda: no_wait.execute(port, force=True), 300 * scale, 5),
+        "status_wait": measure(lambda: move.execute(port, options=polling), 200 * scale, 5),
+    }
+
+
+def bench_retry(scale: int) -> dict:
+    """
+    send_command with a retry policy on a line that loses 5% of the responses, the path retryable_command takes.
+    """
+    controller = simulated_controller()
+    controller.port.port.line.faults.lose = 0.05
+    # a lost liveness ping would cost its full 8 s timeout; without the check a lost selector just reconnects
+    controller.connection.liveness_check = None
+    # a lost response surfaces as a communication error
+    retry = RetryPolicy(retries=3, retry_on={ErrorCode.TIMEOUT, ErrorCode.COMMUNICATION_ERROR}, backoff_initial=1, jitter=0)
+    options = ExecutionOptions(read_timeout=5, retry=retry)
+    failures = 0
+
+    def send():
+        nonlocal failures
+        # no breaker trips in the middle of the benchmark
+        controller.breaker.reset()
+        if not controller.send_command(CommandType.VERSION_PICKER, options=options).success:
+            failures += 1
+
+    # a lost selector response would otherwise cost the full selector timeout
+    controller.port.state.selector_timeout = 5
+    result = measure(send, 100 * scale, 5, warmup=0)
+
+    result["failure_rate"] = failures / (result["iterations"] * result["repeat"])
+    result["retries"] = controller.metrics.commands["VERSION_PICKER"].retries
+    return result
+
+
+def bench_mixed_sequence(scale: int) -> dict:
+    """
+    A vend-like mix of selectors, outputs, text, moves and status reads, per sequence.
+    """
+    controller = simulated_controller()
+    polling = ExecutionOptions(wait_pause_time=0, operation_timeout=1000)
+    sequence = [
+        (CommandType.RINGLIGHT_ON, ()),
+        (CommandType.SEND_TEXT, ("PLEASE WAIT",)),
+        (CommandType.TRACK_OPEN, ()),
+        (CommandType.VEND_DOOR_OPEN, ()),
+        (CommandType.GRIPPER_EXTEND, ()),
+        (CommandType.STATUS_AUX, ()),
+        (CommandType.READ_PICKER_INPUTS, ()),
+        (CommandType.GRIPPER_RETRACT, ()),
+        (CommandType.TURN_ON_GREEN_BUTTON_LED, ()),
+        (CommandType.RINGLIGT_OFF, ()),
+    ]
+
+    def run():
+        for command, args in sequence:
+            controller.send_command(command, *args, force=True, options=polling)
+
+    result = measure(run, 20 * scale, 5)
+    result["commands_per_second"] = len(sequence) * result["ops_per_second"]
+    return result
+
+
+BENCHMARKS: dict[str, Callable[[int], dict]] = {
+    "send_recv": bench_send_recv,
+    "read_inner": bench_read_inner,
+    "validate_response": bench_validate_response,
+    "execute": bench_execute,
+    "retry": bench_retry,
+    "mixed_sequence": bench_mixed_sequence,
+}
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, dict]:
+    """
+    Maps "benchmark/case" to each measurement in a nested results dict.
+    """
+    flat = {}
+    for name, value in results.items():
+        key = f"{prefix}{name}"
+        if "median" in value:
+            flat[key] = value
+        else:
+            flat.update(flatten(value, key + "/"))
+    return flat
+
+
+def run(names: list[str] = None, scale: int = 1) -> dict:
+    results = {}
+    # logging every frame would dominate the numbers, and the retry benchmark fails on purpose
+    logging.disable(logging.CRITICAL)
+    try:
+        for name in names or BENCHMARKS:
+            results[name] = BENCHMARKS[name](scale)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list[tuple[str, float, float, float, bool]]:
+    """
+    Returns (case, baseline median, current median, ratio, regressed) for every case in both result sets.
+    """
+    old = flatten(baseline["results"])
+    new = flatten(current["results"])
+    rows = []
+    for case in old.keys() & new.keys():
+        ratio = new[case]["median"] / old[case]["median"] if old[case]["median"] else float("inf")
+        rows.append((case, old[case]["median"], new[case]["median"], ratio, ratio > 1 + threshold))
+    return sorted(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyhal benchmarks, run against the simulated boards")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="Baseline JSON file to compare the results against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--only", type=str, action="append", choices=list(BENCHMARKS), help="Run only this benchmark")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplies every iteration count")
+    args = parser.parse_args()
+
+    current = run(args.only, args.scale)
+    for case, result in flatten(current["results"]).items():
+        print(f"{case:32} {result['median']:12.2f} us {result['ops_per_second'] or 0:12.0f} ops/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        print()
+        for case, old, new, ratio, regressed in rows:
+            print(f"{case:32} {old:12.2f} -> {new:12.2f} us {ratio:7.2f}x {'REGRESSION' if regressed else ''}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import threading
+from typing import Callable
+
+
+class CancellationToken:
+    """
+    Shared flag that stops an execution from any thread, e.g. a safety stop or an obstruction reported by
+    another subsystem. Waiting operations notice it within one poll interval, send their reset commands
+    and finish with ErrorCode.CANCELLED.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.reason: str = None
+        self.callbacks: list[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: str = None):
+        """
+        Cancels every execution holding this token; only the first call has any effect.
+        """
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks = list(self.callbacks)
+
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits up to timeout seconds for the token to be cancelled, returning whether it was.
+        """
+        return self.event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]):
+        """
+        Calls callback (from the cancelling thread) once the token is cancelled, straight away if it already is.
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
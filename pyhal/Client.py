@@ -0,0 +1,179 @@
+import argparse
+import json
+import socket
+import sys
+import threading
+
+from pyhal.Common import AddressSelector, PortResponse, TrackState
+from pyhal.Ipc import DEFAULT_SOCKET_PATH, IpcError, decode_response, receive_message, send_message
+from pyhal.StatusWord import status_word_type
+
+
+class DaemonError(Exception):
+    """
+    The daemon rejected a request or failed to run it.
+    """
+
+
+def command_name(command) -> str:
+    # a CommandType member or its name, so callers need not import the command table
+    return command if isinstance(command, str) else command.name
+
+
+class HALClient:
+    """
+    Talks to a running daemon (python -m pyhal) over its Unix-domain socket. The connection is opened on first
+    use and kept; a client may be shared between threads, its requests are sent one at a time.
+    options of send_command are operation_timeout, wait_pause_time and read_timeout in ms, retries, and
+    timeout, the seconds the whole call may take.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, timeout: float = None):
+        self.path = path
+        # seconds to wait for the daemon's answer; None waits as long as the command takes
+        self.timeout = timeout
+        self.sock: socket.socket = None
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        try:
+            self.sock.connect(self.path)
+        except OSError:
+            self.sock.close()
+            self.sock = None
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, op: str, **fields) -> dict:
+        """
+        Sends one request and returns the daemon's reply, raising DaemonError if it failed.
+        """
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+
+            self.next_id += 1
+            try:
+                send_message(self.sock, {"id": self.next_id, "op": op, **fields})
+                reply = receive_message(self.sock)
+            except (IpcError, OSError):
+                # the stream is out of step after a failure part way, the next request reconnects
+                self.close()
+                raise
+
+        if not reply["ok"]:
+            raise DaemonError(reply["error"])
+        return reply
+
+    def ping(self) -> bool:
+        try:
+            self.request("ping")
+        except (IpcError, OSError, DaemonError):
+            return False
+        return True
+
+    def send_command(self, command, *args, wait: bool = True, force: bool = False, **options) -> PortResponse:
+        reply = self.request("send_command", command=command_name(command), args=list(args), wait=wait, force=force, options=options)
+        return decode_response(reply["response"])
+
+    def set_track(self, track_state: TrackState) -> PortResponse:
+        return decode_response(self.request("set_track", state=track_state.name)["response"])
+
+    def send_batch(self, commands: list, pipelined: bool = True, force: bool = False, **options) -> list[PortResponse]:
+        """
+        Sends several commands as FMEController.send_batch does, e.g. ["RINGLIGHT_ON", ("SEND_TEXT", "HELLO")],
+        with the options of send_command applying to every command.
+        """
+        entries = [command_name(entry) if not isinstance(entry, tuple) else [command_name(entry[0]), *entry[1:]] for entry in commands]
+        reply = self.request("send_batch", commands=entries, pipelined=pipelined, force=force, options=options)
+        return [decode_response(response) for response in reply["responses"]]
+
+    def read_status(self, address: AddressSelector, max_age: int = None) -> PortResponse:
+        """
+        Returns the status word of a board; its status_word() has the bits the daemon read.
+        """
+        reply = self.request("read_status", board=address.name, max_age=max_age)
+        response = decode_response(reply["response"])
+        response.status = status_word_type(address)(reply["bits"])
+        return response
+
+    def metrics(self) -> dict:
+        return self.request("metrics")["metrics"]
+
+
+def print_response(response: PortResponse):
+    print(response.response if response.success else f"failed: {response.error.name if response.error else 'invalid response'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send commands to a running pyhal daemon")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Socket the daemon listens on")
+    commands = parser.add_subparsers(dest="action", required=True)
+
+    send = commands.add_parser("send", help="Send one command")
+    send.add_argument("command", type=str, help="Command name, e.g. RINGLIGHT_ON")
+    send.add_argument("args", nargs="*", help="Command arguments, e.g. the text of SEND_TEXT")
+    send.add_argument("--no-wait", action="store_true", help="Do not wait for the command to complete")
+    send.add_argument("--force", action="store_true", help="Send output commands even if they change nothing")
+    send.add_argument("--timeout", type=float, help="Seconds the whole call may take")
+
+    status = commands.add_parser("status", help="Read the status word of a board")
+    status.add_argument("board", type=str, choices=[address.name for address in AddressSelector])
+    status.add_argument("--max-age", type=int, help="Reuse a status read at most this many ms ago")
+
+    track = commands.add_parser("track", help="Open or close the track")
+    track.add_argument("state", type=str, choices=[state.name for state in TrackState])
+
+    batch = commands.add_parser("batch", help="Send several commands, e.g. RINGLIGHT_ON 'SEND_TEXT HELLO'")
+    batch.add_argument("commands", nargs="+", help="A command name, followed by its arguments if any")
+
+    commands.add_parser("metrics", help="Print the daemon's metrics")
+    commands.add_parser("ping", help="Check that the daemon is running")
+
+    args = parser.parse_args()
+    try:
+        with HALClient(args.socket) as client:
+            if args.action == "send":
+                options = {"timeout": args.timeout} if args.timeout is not None else {}
+                print_response(client.send_command(args.command, *args.args, wait=not args.no_wait, force=args.force, **options))
+            elif args.action == "status":
+                # the bit names come with the reply, the client does not load the command table
+                reply = client.request("read_status", board=args.board, max_age=args.max_age)
+                print_response(decode_response(reply["response"]))
+                if reply["response"]["error"] is None:
+                    print(", ".join(reply["names"]) or "no bits set")
+            elif args.action == "track":
+                print_response(client.set_track(TrackState[args.state]))
+            elif args.action == "batch":
+                entries = [tuple(entry.split()) if " " in entry else entry for entry in args.commands]
+                for entry, response in zip(args.commands, client.send_batch(entries)):
+                    print(f"{entry}: ", end="")
+                    print_response(response)
+            elif args.action == "metrics":
+                print(json.dumps(client.metrics(), indent=2))
+            elif args.action == "ping":
+                client.request("ping")
+                print("ok")
+    except (OSError, IpcError) as e:
+        print(f"cannot reach the daemon on {args.socket}: {e}", file=sys.stderr)
+        sys.exit(2)
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
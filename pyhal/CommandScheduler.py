@@ -0,0 +1,239 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from enum import Enum
+
+from pyhal.Cancellation import CancellationToken
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector, CommandResponse
+from pyhal.ExecutionOptions import DEFAULT_OPTIONS, ExecutionOptions
+from pyhal.FMEController import FMEController
+
+
+class Priority(Enum):
+    """
+    Scheduling priority, lower values run first.
+    URGENT commands may also run inside the status-poll pauses of a command that is already executing.
+    """
+
+    URGENT = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
+
+
+# commands that stop motion always jump the queue
+URGENT_COMMANDS = frozenset(
+    {
+        CommandType.QLM_HALT,
+        CommandType.GRIPPER_EXTEND_HALT,
+        CommandType.VEND_DOOR_KILL,
+        CommandType.ROLLER_STOP,
+    }
+)
+
+
+class ScheduledCommand:
+    __slots__ = ("priority", "sequence", "command", "args", "wait", "options", "future")
+
+    def __init__(self, priority: Priority, sequence: int, command: CommandType, args: tuple, wait: bool, options: ExecutionOptions):
+        self.priority = priority
+        self.sequence = sequence
+        self.command = command
+        self.args = args
+        self.wait = wait
+        self.options = options
+        self.future = Future()
+
+    @property
+    def address(self) -> AddressSelector:
+        return self.command.value.address
+
+
+class CommandScheduler:
+    """
+    Owns an FMEController and executes commands submitted from any thread, one at a time, on a worker thread.
+    Commands run by priority, preferring the currently selected board among equal priorities so consecutive
+    commands share one selector. URGENT commands also cut into the poll pauses of a running command; a halt
+    cutting into a move on its own board cancels that move, which then finishes with CANCELLED.
+    """
+
+    max_batch: int = 8
+
+    def __init__(self, controller: FMEController):
+        self.controller = controller
+        self.queue: list[ScheduledCommand] = []
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.batch = 0
+        self.running = True
+        self.preempting = False
+        # the job the worker is executing and the token that cancels it
+        self.current: ScheduledCommand = None
+        self.current_token: CancellationToken = None
+
+        # the port's idle time between polls is handed to urgent commands
+        self.port_pause = controller.port.pause
+        controller.port.pause = self.pause
+
+        self.worker = threading.Thread(target=self.run, name="pyhal-scheduler", daemon=True)
+        self.worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def default_priority(self, command: CommandType) -> Priority:
+        if command in URGENT_COMMANDS:
+            return Priority.URGENT
+
+        # display and button traffic is cosmetic next to motion control
+        if command.value.address == AddressSelector.QR:
+            return Priority.LOW
+
+        return Priority.NORMAL
+
+    def submit(
+        self, command: CommandType, *args, priority: Priority = None, wait: bool = True, options: ExecutionOptions = DEFAULT_OPTIONS
+    ) -> Future:
+        """
+        Queues the command and returns a Future resolving to its CommandResponse.
+        """
+        priority = self.default_priority(command) if priority is None else priority
+        job = ScheduledCommand(priority, next(self.sequence), command, args, wait, options)
+
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("scheduler is closed")
+            self.queue.append(job)
+            self.condition.notify_all()
+
+        return job.future
+
+    def send_command(
+        self, command: CommandType, *args, priority: Priority = None, wait: bool = True, options: ExecutionOptions = DEFAULT_OPTIONS
+    ) -> CommandResponse:
+        """
+        Queues the command and blocks until it has been executed.
+        """
+        return self.submit(command, *args, priority=priority, wait=wait, options=options).result()
+
+    def close(self, wait: bool = True):
+        """
+        Stops accepting commands, cancels the queued ones and stops the worker once the current command finishes.
+        """
+        with self.condition:
+            self.running = False
+            for job in self.queue:
+                job.future.cancel()
+            self.queue.clear()
+            self.condition.notify_all()
+
+        if wait and threading.current_thread() is not self.worker:
+            self.worker.join()
+
+        self.controller.port.pause = self.port_pause
+
+    def take(self, max_priority: Priority = None) -> ScheduledCommand:
+        """
+        Removes and returns the next job to run (at or above max_priority), or None; the condition must be held.
+        """
+        selected = self.controller.port.state.selected_address
+        prefer_board = self.batch < self.max_batch
+
+        best = None
+        best_key = None
+        for job in self.queue:
+            if max_priority is not None and job.priority.value > max_priority.value:
+                continue
+            key = (job.priority.value, not (prefer_board and job.address == selected), job.sequence)
+            if best_key is None or key < best_key:
+                best, best_key = job, key
+
+        if best is not None:
+            self.queue.remove(best)
+            self.batch = self.batch + 1 if best.address == selected else 0
+
+        return best
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                job = self.take()
+
+            self.execute_current(job)
+
+    def execute_current(self, job: ScheduledCommand):
+        # every job gets its own token, so a halt can cancel it without touching a token the caller shares
+        token = CancellationToken()
+        caller_token = job.options.token
+
+        def cancel():
+            token.cancel(caller_token.reason)
+
+        if caller_token is not None:
+            caller_token.add_callback(cancel)
+        self.current, self.current_token = job, token
+        try:
+            self.execute(job, job.options.replace(token=token))
+        finally:
+            self.current, self.current_token = None, None
+            if caller_token is not None:
+                caller_token.remove_callback(cancel)
+
+    def execute(self, job: ScheduledCommand, options: ExecutionOptions = None):
+        if not job.future.set_running_or_notify_cancel():
+            return
+
+        try:
+            response = self.controller.send_command(job.command, *job.args, wait=job.wait, options=job.options if options is None else options)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(response)
+
+    def pause(self, duration: float, token: CancellationToken = None):
+        """
+        Replaces the port's pause: waits duration ms, running any urgent command that arrives in the meantime.
+        Returns early once token is cancelled.
+        """
+        deadline = time.perf_counter() + duration / 1000  # convert ms to seconds
+        if token is not None:
+            token.add_callback(self.wake)
+
+        try:
+            while True:
+                with self.condition:
+                    job = None if self.preempting else self.take(Priority.URGENT)
+                    if job is None:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0 or (token is not None and token.cancelled):
+                            return
+                        self.condition.wait(remaining)
+                        continue
+
+                # the interrupted operation re-selects its board on its next poll if this changes it
+                self.preempting = True
+                try:
+                    self.execute(job)
+                finally:
+                    self.preempting = False
+
+                # a halted move did not complete, so it must not end as a success (nor teach the completion model)
+                current = self.current
+                if current is not None and job.command in URGENT_COMMANDS and job.address == current.address:
+                    self.current_token.cancel(f"{job.command.name} cut in")
+        finally:
+            if token is not None:
+                token.remove_callback(self.wake)
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
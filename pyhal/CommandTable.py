@@ -0,0 +1,194 @@
+from types import MappingProxyType
+from typing import NamedTuple
+
+from pyhal.Common import COMMAND_TERMINATOR, AddressSelector
+from pyhal.StatusWord import define_status_bits
+
+PICKER = AddressSelector.PICKER
+AUX = AddressSelector.AUX
+SERIAL = AddressSelector.SERIAL
+QR = AddressSelector.QR
+
+
+class CommandSpec(NamedTuple):
+    """
+    One row of the command table. command is the wire command, "{0}" marking where a parameter goes (e.g. "S{0}");
+    a command with a status_bit is a move, pending while the bit is set and stopped by the reset_command frames
+    (comma separated). Times are in ms; a move with an operation_timeout of 0 gets Protocol.DEFAULT_OPERATION_TIMEOUT,
+    shortened by the completion model once it has learnt the move's duration.
+    """
+
+    name: str
+    address: AddressSelector
+    command: str
+    command_wait: int = 8000
+    status_bit: int = None
+    reset_command: str = None
+    wait_pause_time: int = 0
+    operation_timeout: int = 0
+
+    @property
+    def parameterised(self) -> bool:
+        return "{" in self.command
+
+    @property
+    def prefix(self) -> str:
+        """
+        The wire command up to its parameter, the whole command if it takes none.
+        """
+        return self.command.split("{", 1)[0]
+
+
+# fmt: off
+COMMANDS: tuple[CommandSpec, ...] = (
+    CommandSpec("RESET", SERIAL, "X", command_wait=60000),
+    CommandSpec("QLM_ENGAGE", AUX, "M1", status_bit=6, reset_command="K1", wait_pause_time=500),
+    CommandSpec("QLM_DISENGAGE", AUX, "L1", status_bit=5, reset_command="K1", wait_pause_time=500),
+    CommandSpec("QLM_HALT", AUX, "K1"),
+    CommandSpec("QLM_DOOR_LOCK", AUX, "P2"),
+    CommandSpec("QLM_DOOR_UNLOCK", AUX, "O2"),
+    CommandSpec("SENSOR_BAR_ON", PICKER, "O1"),
+    CommandSpec("SENSOR_BAR_OFF", PICKER, "P1"),
+    CommandSpec("AUDIO_ON", SERIAL, "I"),
+    CommandSpec("AUDIO_OFF", SERIAL, "J"),
+    CommandSpec("ROLLER_IN", PICKER, "J4"),
+    CommandSpec("ROLLER_OUT", PICKER, "I4"),
+    CommandSpec("ROLLER_STOP", PICKER, "K4"),
+    CommandSpec("ROLLER_TO_POS_1", PICKER, "U1", status_bit=18, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("ROLLER_TO_POS_2", PICKER, "U2", status_bit=19, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("ROLLER_TO_POS_3", PICKER, "U3", status_bit=20, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("ROLLER_TO_POS_4", PICKER, "T4", status_bit=15, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("ROLLER_TO_POS_5", PICKER, "T5", status_bit=16, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("ROLLER_TO_POS_6", PICKER, "T6", status_bit=17, reset_command="K4,P1", wait_pause_time=20),
+    CommandSpec("FRUAD_SENSOR_ENABLE_POWER_TRANSISTOR", PICKER, "O4"),
+    CommandSpec("FRUAD_SENSOR_DISABLE_POWER_TRANSISTOR", PICKER, "P4"),
+    CommandSpec("FRUAD_SENSOR_ENABLE_TRANSISTOR", PICKER, "O3"),
+    CommandSpec("FRUAD_SENSOR_DISABLE_TRANSISTOR", PICKER, "P4"),
+    CommandSpec("RINGLIGHT_ON", PICKER, "O2"),
+    CommandSpec("RINGLIGT_OFF", PICKER, "P2"),
+    CommandSpec("JUNCTION_4_ON", PICKER, "O1"),
+    CommandSpec("JUNCTION_4_OFF", PICKER, "P1"),
+    CommandSpec("AUX_SENSORS_ON", AUX, "O1"),
+    CommandSpec("AUX_SENSORS_OFF", AUX, "P1"),
+    CommandSpec("AUX_SENSORS_READ", AUX, "R"),
+    CommandSpec("VEND_DOOR_OPEN", AUX, "M2", status_bit=8, reset_command="K2", wait_pause_time=60),
+    CommandSpec("VEND_DOOR_RENT", AUX, "V", status_bit=10, reset_command="K2", wait_pause_time=60),
+    CommandSpec("VEND_DOOR_CLOSE", AUX, "L2", status_bit=7, reset_command="K2", wait_pause_time=60),
+    CommandSpec("READ_PICKER_INPUTS", PICKER, "R"),
+    CommandSpec("GRIPPER_EXTEND_HALT", PICKER, "K1"),
+    CommandSpec("EXTEND_GRIPPER_ARM_FOR_TIME", PICKER, "I1"),
+    CommandSpec("GRIPPER_EXTEND", PICKER, "L1", status_bit=5, reset_command="K1", wait_pause_time=50),
+    CommandSpec("GRIPPER_RETRACT", PICKER, "M1", status_bit=6, reset_command="K1", wait_pause_time=50),
+    CommandSpec("GRIPPER_OPEN", PICKER, "M3", status_bit=10, reset_command="K3", wait_pause_time=50),
+    CommandSpec("GRIPPER_RENT", PICKER, "V", status_bit=12, reset_command="K3", wait_pause_time=50),
+    CommandSpec("GRIPPER_CLOSE", PICKER, "L3", status_bit=9, reset_command="K3", wait_pause_time=50),
+    CommandSpec("TRACK_OPEN", PICKER, "M2", status_bit=8, reset_command="K2", wait_pause_time=50),
+    CommandSpec("TRACK_CLOSE", PICKER, "L2", status_bit=7, reset_command="K2", wait_pause_time=50),
+    CommandSpec("VERSION_SERIAL", SERIAL, "Y"),
+    CommandSpec("VERSION_PICKER", PICKER, "W"),
+    CommandSpec("VERSION_AUX", AUX, "W"),
+    CommandSpec("STATUS_PICKER", PICKER, "S"),
+    CommandSpec("STATUS_AUX", AUX, "S"),
+    CommandSpec("TURN_ON_GREEN_BUTTON_LED", QR, "I1"),
+    CommandSpec("TURN_OFF_GREEN_BUTTON_LED", QR, "I3"),
+    CommandSpec("BLINK_GREEN_BUTTON_LED", QR, "I2"),
+    CommandSpec("TURN_ON_RED_BUTTON_LED", QR, "R1"),
+    CommandSpec("TURN_OFF_RED_BUTTON_LED", QR, "R3"),
+    CommandSpec("BLINK_RED_BUTTON_LED", QR, "R2"),
+    CommandSpec("TURN_ON_GREEN_ARROW_LED", QR, "T1"),
+    CommandSpec("TURN_OFF_GREEN_ARROW_LED", QR, "T3"),
+    CommandSpec("BLINK_GREEN_ARROW_LED", QR, "T2"),
+    CommandSpec("TURN_ON_RED_ARROW_LED", QR, "Z1"),
+    CommandSpec("TURN_OFF_RED_ARROW_LED", QR, "Z3"),
+    CommandSpec("BLINK_RED_ARROW_LED", QR, "Z2"),
+    CommandSpec("TURN_ON_BACK_LIGHT", QR, "W1"),
+    CommandSpec("TURN_OFF_BACK_LIGHT", QR, "W3"),
+    CommandSpec("BLINK_BACK_LIGHT", QR, "W2"),
+    CommandSpec("SEND_TEXT", QR, "S{0}"),
+    CommandSpec("CLEAR_DISPLAY_MEMORY", QR, "X{0}"),
+    CommandSpec("SIDE_TERMINAL_VERSION", QR, "Y"),
+    CommandSpec("READ_QR_BUTTON", QR, "J"),
+    CommandSpec("CLEAR_QR_BUTTON_STATUS", QR, "K"),
+    CommandSpec("TURN_OFF_PIXELS", QR, "U90"),
+    CommandSpec("SET_TEXT_ONLY_DISPLAY_MODE", QR, "U94"),
+    CommandSpec("SET_GRAPHICS_ONLY_DISPLAY_MODE", QR, "U98"),
+    CommandSpec("DISPLAY_SETTING_QR", QR, "U80"),
+    CommandSpec("DISPLAY_SETTING_EXOR", QR, "U81"),
+    CommandSpec("DISPLAY_SETTING_AND", QR, "U83"),
+    CommandSpec("SET_START_TEXT_PAGE_POINTER", QR, "M{0}"),
+    CommandSpec("SET_START_GRAPHICS_PAGE_POINTER", QR, "L{0}"),
+    CommandSpec("SET_MEMORY_WRITE_POINTER", QR, "V{0}"),
+    CommandSpec("SET_TEXT_COLUMNS", QR, "O{0}"),
+    CommandSpec("SET_GRAPHICS_COLUMNS", QR, "N{0}"),
+    CommandSpec("WRITE_GRAPHIC_DATA", QR, "g{0}"),
+    CommandSpec("WRITE_GRAPHIC_DATA_TO_EEPROM", QR, "l{0}"),
+    CommandSpec("SET_EEPROM_POINTER", QR, "d{0}"),
+    CommandSpec("LOAD_FROM_EEPROM_TO_DISPLAY_MEMORY", QR, "m"),
+    CommandSpec("TERMINAL_REVISION", QR, "c"),
+    CommandSpec("UNKNOWN_VEND_DOOR_CLOSE", AUX, "J2"),
+    CommandSpec("UNKNOWN_VEND_DOOR_OPEN", AUX, "I2"),
+    CommandSpec("VEND_DOOR_KILL", AUX, "K2"),
+    CommandSpec("POWER_AUX_20", AUX, "O3"),
+    CommandSpec("DISABLE_AUX_20", AUX, "P3"),
+    CommandSpec("POWER_AUX_21", AUX, "O4"),
+    CommandSpec("DISABLE_AUX_21", AUX, "P4"),
+    CommandSpec("QLM_LIFT", AUX, "M1"),
+    CommandSpec("QLM_DROP", AUX, "L1"),
+)
+# fmt: on
+
+
+def build_indexes():
+    by_name: dict[str, CommandSpec] = {}
+    by_board: dict[AddressSelector, list[CommandSpec]] = {address: [] for address in AddressSelector}
+    # several names may share a wire command (e.g. SENSOR_BAR_ON and JUNCTION_4_ON), so each maps to all of them
+    by_wire: dict[tuple[AddressSelector, str], list[CommandSpec]] = {}
+    by_prefix: dict[tuple[AddressSelector, str], list[CommandSpec]] = {}
+    by_status_bit: dict[tuple[AddressSelector, int], CommandSpec] = {}
+
+    for spec in COMMANDS:
+        if spec.name in by_name:
+            raise ValueError(f"command {spec.name} is defined twice")
+        by_name[spec.name] = spec
+        by_board[spec.address].append(spec)
+        (by_prefix if spec.parameterised else by_wire).setdefault((spec.address, spec.prefix), []).append(spec)
+        if spec.status_bit is not None:
+            other = by_status_bit.setdefault((spec.address, spec.status_bit), spec)
+            if other is not spec:
+                raise ValueError(f"{spec.name} and {other.name} share status bit {spec.status_bit} of {spec.address.name}")
+
+    def freeze(index: dict) -> MappingProxyType:
+        return MappingProxyType({key: tuple(value) if isinstance(value, list) else value for key, value in index.items()})
+
+    return freeze(by_name), freeze(by_board), freeze(by_wire), freeze(by_prefix), freeze(by_status_bit)
+
+
+BY_NAME, BY_BOARD, BY_WIRE, BY_PREFIX, BY_STATUS_BIT = build_indexes()
+# lengths of the parameterised commands' prefixes, longest first, so decode_frame tries the most specific one first
+PREFIX_LENGTHS = tuple(sorted({len(prefix) for _, prefix in BY_PREFIX}, reverse=True))
+
+
+def decode_frame(address: AddressSelector, frame) -> tuple[CommandSpec, ...]:
+    """
+    Returns the commands a frame sent to the board at address could be (empty if none), e.g. for decoding traces.
+    frame is the wire command as str or bytes, with or without its terminator.
+    """
+    if isinstance(frame, (bytes, bytearray)):
+        frame = bytes(frame).removesuffix(COMMAND_TERMINATOR).decode(errors="replace")
+
+    specs = BY_WIRE.get((address, frame))
+    if specs is not None:
+        return specs
+
+    for length in PREFIX_LENGTHS:
+        specs = BY_PREFIX.get((address, frame[:length]))
+        if specs is not None:
+            return specs
+    return ()
+
+
+# give each board's status words a named accessor per status bit, e.g. word.gripper_extend
+for _address in AddressSelector:
+    _bits = {spec.name: bit for (address, bit), spec in BY_STATUS_BIT.items() if address == _address}
+    if _bits:
+        define_status_bits(_address, _bits)
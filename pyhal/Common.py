@@ -1,6 +1,18 @@
 from enum import Enum
 from time import perf_counter
 
+from pyhal.StatusWord import StatusWord, status_word_type
+
+# every frame written to the boards is terminated by a carriage return
+COMMAND_TERMINATOR = bytes([13])
+
+
+def encode_frame(command: str) -> bytes:
+    """
+    Encodes a command into the bytes written to the port, terminator included.
+    """
+    return command.encode() + COMMAND_TERMINATOR
+
 
 class ControlBoard(Enum):
     NONE = 0
@@ -16,6 +28,10 @@ class AddressSelector(Enum):
     SERIAL = "H101"
     QR = "H555"
 
+    def __init__(self, selector: str):
+        # pre-encoded selector frame, so selecting a board never re-encodes
+        self.frame = encode_frame(selector)
+
     def __str__(self):
         return self.name.lower()
 
@@ -96,13 +112,29 @@ class ErrorCode(Enum):
     UPPER_LIMIT_ERROR = 46
     SERVICE_CHANNEL_ERROR = 47
     STORE_ERROR = 48
+    CANCELLED = 49
 
 
 class PortResponse:
-    response_valid: bool = False
-    response: str = None
-    raw_response: bytes = None
-    error: ErrorCode = None
+    __slots__ = ("response_valid", "response", "raw_response", "error", "status")
+
+    def __init__(self, response_valid: bool = False, response: str = None, raw_response: bytes = None, error: ErrorCode = None):
+        self.response_valid = response_valid
+        self.response = response
+        self.raw_response = raw_response
+        self.error = error
+        # parsed on first use, see status_word
+        self.status: StatusWord = None
+
+    def status_word(self, address: AddressSelector = None) -> StatusWord:
+        """
+        The response parsed as a status word, with the named bits of the board at address; parsed only once.
+        A failed response reads as every bit cleared.
+        """
+        if self.status is None:
+            word_type = status_word_type(address)
+            self.status = word_type() if self.error is not None else word_type.parse(self.raw_response)
+        return self.status
 
     def is_bit_set(self, bit: int) -> bool:
         """
@@ -111,11 +143,7 @@ class PortResponse:
         if self.error is not None:
             return False
 
-        if len(self.response) < bit + 1:
-            print(f"[PortResponse] is_bit_set: response is {self.response}; too short")
-            return False
-
-        return self.response[bit] == "1"
+        return self.status_word().is_set(bit)
 
     # getter
     @property
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# where each port's model is kept unless a path is given
+MODEL_DIRECTORY = os.path.join(os.path.expanduser("~"), ".pyhal")
+
+
+def default_model_path(port: str) -> str:
+    """
+    The model file for port in MODEL_DIRECTORY, e.g. completion-COM1.json; every kiosk line learns its own timings.
+    """
+    return os.path.join(MODEL_DIRECTORY, f"completion-{re.sub(r'[^A-Za-z0-9.-]+', '_', port).strip('_')}.json")
+
+
+class CompletionModel:
+    """
+    Records how long status-bit commands take to complete on this kiosk and uses the observed
+    distribution to schedule status polls and derive timeouts. Moves that timed out are kept as censored samples,
+    known to take at least that long, so a derived timeout that proved too short grows again.
+    Without a path the model lives in memory only.
+    """
+
+    max_samples: int = 200
+    min_samples: int = 10
+    timeout_margin: float = 2.0
+    min_poll_interval: int = 10
+    autosave_every: int = 20
+
+    def __init__(self, path: str = None):
+        self.path = path or None
+        self.samples: dict[str, list[float]] = {}
+        # ms after which a move timed out while still running
+        self.censored: dict[str, list[float]] = {}
+        self.sorted_samples: dict[str, list[float]] = {}
+        self.unsaved = 0
+        # samples are recorded on the line's thread while an autosave may be writing them out on its own
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.autosaving = False
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        """
+        Loads the recorded durations from the model file.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            samples = {name: [float(sample) for sample in samples][-self.max_samples :] for name, samples in data.get("commands", {}).items()}
+            # version 1 files have no censored samples
+            censored = {name: [float(sample) for sample in samples][-self.max_samples :] for name, samples in data.get("timeouts", {}).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # valid JSON of the wrong shape is as unusable as a corrupt file
+            logger.warning("unable to load %s: %s", self.path, e)
+            return
+
+        with self.lock:
+            self.samples, self.censored = samples, censored
+            self.sorted_samples.clear()
+
+    def save(self):
+        """
+        Writes the recorded durations to the model file, replacing it atomically.
+        Nothing is written if nothing was recorded since the last load or save.
+        """
+        if self.path is None:
+            return
+
+        with self.save_lock:
+            with self.lock:
+                if self.unsaved == 0:
+                    return
+                data = {
+                    "version": 2,
+                    "commands": {name: list(samples) for name, samples in self.samples.items()},
+                    "timeouts": {name: list(samples) for name, samples in self.censored.items()},
+                }
+                unsaved, self.unsaved = self.unsaved, 0
+
+            tmp_path = f"{self.path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("unable to save %s: %s", self.path, e)
+                with self.lock:
+                    self.unsaved += unsaved
+
+    def autosave(self):
+        try:
+            self.save()
+        finally:
+            self.autosaving = False
+
+    def record(self, name: str, elapsed: float):
+        """
+        Records that the named command completed after elapsed ms.
+        """
+        self.add_sample(self.samples, name, elapsed)
+
+    def record_timeout(self, name: str, elapsed: float):
+        """
+        Records that the named command was still running after elapsed ms, when it timed out.
+        Cancelled moves are not recorded at all: they were stopped on purpose, often well before they would have finished.
+        """
+        self.add_sample(self.censored, name, elapsed)
+
+    def add_sample(self, store: dict[str, list[float]], name: str, elapsed: float):
+        with self.lock:
+            samples = store.setdefault(name, [])
+            samples.append(round(elapsed, 1))
+            if len(samples) > self.max_samples:
+                del samples[0]
+            self.sorted_samples.pop(name, None)
+
+            self.unsaved += 1
+            # written on a thread of its own, samples are recorded while the caller still holds the line
+            start_autosave = self.path is not None and self.unsaved >= self.autosave_every and not self.autosaving
+            if start_autosave:
+                self.autosaving = True
+
+        if start_autosave:
+            threading.Thread(target=self.autosave, name="pyhal-model-save", daemon=True).start()
+
+    def percentile(self, name: str, p: float) -> float:
+        """
+        Returns the p-th percentile (0-100) of the recorded durations in ms, or None without enough samples.
+        Censored samples count at the time they were cut off, which underestimates them only.
+        """
+        samples = self.sorted_samples.get(name)
+        if samples is None:
+            samples = self.samples.get(name, []) + self.censored.get(name, [])
+            if len(samples) < self.min_samples:
+                return None
+            samples = self.sorted_samples[name] = sorted(samples)
+
+        index = min(len(samples) - 1, max(0, round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def timeout(self, name: str, operation_timeout: int) -> int:
+        """
+        Derives the operation timeout from the observed tail, never exceeding a configured timeout.
+        A move that timed out is known to take longer, so the timeout also allows the margin beyond the longest
+        censored sample.
+        """
+        p99 = self.percentile(name, 99)
+        if p99 is None:
+            return operation_timeout
+
+        derived = int(max(p99, max(self.censored.get(name, ()), default=0)) * self.timeout_margin)
+        return derived if operation_timeout <= 0 else min(operation_timeout, derived)
+
+    def schedule(self, name: str, wait_pause_time: int) -> Callable[[float], float]:
+        """
+        Returns a function mapping the elapsed ms since the command was sent to the pause before the next poll,
+        or None if there is not enough data yet.
+        The first poll lands on the earliest typical completion, after which polls are dense: the move is most
+        likely to finish in the usual completion window, and one running into the tail should be caught just as fast.
+        """
+        p10 = self.percentile(name, 10)
+        p90 = self.percentile(name, 90)
+        if p10 is None or p90 is None:
+            return None
+
+        dense = max(self.min_poll_interval, min(wait_pause_time, (p90 - p10) / 8))
+
+        def next_pause(elapsed: float) -> float:
+            if elapsed < p10:
+                return p10 - elapsed
+            return dense
+
+        return next_pause
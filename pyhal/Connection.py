@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from enum import Enum
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from pyhal.Common import PortResponse
+from pyhal.Port import Port
+
+if TYPE_CHECKING:
+    from pyhal.AsyncPort import AsyncPort
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionState(Enum):
+    DISCONNECTED = 0
+    CONNECTING = 1
+    CONNECTED = 2
+    FAILED = 3
+
+    def __str__(self):
+        return self.name.lower()
+
+
+class ConnectionManager:
+    """
+    Opens the port once, confirms the boards answer, and only reconnects (with exponential backoff)
+    after a communication error that a liveness check confirms.
+    Once connected, ensure() is a single state comparison.
+    """
+
+    backoff_initial: int = 500
+    backoff_max: int = 30000
+    backoff_multiplier: float = 2.0
+
+    def __init__(self, port: Port, liveness_check: Callable[[], bool] = None):
+        self.port = port
+        self.liveness_check = liveness_check
+        self.state = ConnectionState.DISCONNECTED
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.failed_attempts = 0
+        self.next_attempt = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.state == ConnectionState.CONNECTED
+
+    @property
+    def backoff(self) -> int:
+        """
+        The delay in ms before the next attempt after the failed ones so far.
+        """
+        if self.failed_attempts == 0:
+            return 0
+
+        return int(min(self.backoff_max, self.backoff_initial * self.backoff_multiplier ** (self.failed_attempts - 1)))
+
+    @property
+    def backing_off(self) -> bool:
+        return time.monotonic() < self.next_attempt
+
+    def ensure(self) -> bool:
+        """
+        Returns True if the port is usable, connecting first if needed.
+        While backing off after a failed attempt it fails fast instead of retrying.
+        """
+        if self.state == ConnectionState.CONNECTED:
+            return True
+
+        if self.backing_off:
+            return False
+
+        return self.connect()
+
+    def connect(self) -> bool:
+        self.start_attempt()
+        return self.finish_attempt(self.port.open() and (self.liveness_check is None or self.liveness_check()))
+
+    def start_attempt(self):
+        self.state = ConnectionState.CONNECTING
+        if self.connect_count > 0:
+            self.reconnect_count += 1
+        self.connect_count += 1
+
+    def finish_attempt(self, connected: bool) -> bool:
+        """
+        Records the outcome of a connection attempt, closing the port and backing off if it failed.
+        """
+        if connected:
+            logger.info("connected (reconnects: %d)", self.reconnect_count)
+            self.state = ConnectionState.CONNECTED
+            self.failed_attempts = 0
+            self.next_attempt = 0.0
+            return True
+
+        if self.port.is_open:
+            self.port.close()
+
+        self.failed_attempts += 1
+        self.next_attempt = time.monotonic() + self.backoff / 1000  # convert ms to seconds
+        self.state = ConnectionState.FAILED
+        logger.warning("connection failed, next attempt in %d ms", self.backoff)
+        return False
+
+    def should_check(self, response: PortResponse) -> bool:
+        # only a communication error on an established connection can mean the line is gone
+        return response.comm_error and self.state == ConnectionState.CONNECTED
+
+    def report(self, response: PortResponse):
+        """
+        Inspects a finished command; a communication error that the liveness check confirms drops the connection,
+        so the next command reconnects. An error on one board that the line survives is left alone.
+        """
+        if not self.should_check(response):
+            return
+
+        if self.port.is_open and self.liveness_check is not None and self.liveness_check():
+            return
+
+        self.lost()
+
+    def lost(self):
+        logger.warning("connection lost")
+        self.disconnect()
+        self.state = ConnectionState.FAILED
+
+    def disconnect(self):
+        if self.port.is_open:
+            self.port.close()
+        self.state = ConnectionState.DISCONNECTED
+
+
+class AsyncConnectionManager(ConnectionManager):
+    """
+    asyncio counterpart of ConnectionManager for an AsyncPort, with an async liveness check.
+    Tasks that find the port disconnected wait for one connection attempt instead of each making their own.
+    """
+
+    def __init__(self, port: "AsyncPort", liveness_check: Callable[[], Awaitable[bool]] = None):
+        super().__init__(port, liveness_check)
+        self.connecting = asyncio.Lock()
+
+    async def ensure(self) -> bool:
+        if self.state == ConnectionState.CONNECTED:
+            return True
+
+        async with self.connecting:
+            # another task may have connected, or failed and started backing off, while this one waited
+            if self.state == ConnectionState.CONNECTED:
+                return True
+
+            if self.backing_off:
+                return False
+
+            return await self.connect()
+
+    async def connect(self) -> bool:
+        self.start_attempt()
+        return self.finish_attempt(await self.port.open() and (self.liveness_check is None or await self.liveness_check()))
+
+    async def report(self, response: PortResponse):
+        if not self.should_check(response):
+            return
+
+        if self.port.is_open and self.liveness_check is not None and await self.liveness_check():
+            return
+
+        self.lost()
@@ -0,0 +1,198 @@
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector, TrackState
+from pyhal.ExecutionOptions import ExecutionOptions
+from pyhal.FMEController import FMEController
+from pyhal.Ipc import DEFAULT_SOCKET_PATH, SOCKET_DIRECTORY, IpcError, encode_response, receive_message, send_message
+from pyhal.RetryPolicy import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+def execution_options(request: dict) -> ExecutionOptions:
+    """
+    Builds the options of a request: operation_timeout, wait_pause_time and read_timeout in ms, retries,
+    and timeout, the seconds the whole call may take (a deadline would mean nothing across processes).
+    """
+    options = request.get("options") or {}
+    return ExecutionOptions(
+        operation_timeout=options.get("operation_timeout"),
+        wait_pause_time=options.get("wait_pause_time"),
+        read_timeout=options.get("read_timeout"),
+        retry=RetryPolicy(retries=options["retries"]) if options.get("retries") else ExecutionOptions().retry,
+        deadline=time.perf_counter() + options["timeout"] if options.get("timeout") is not None else None,
+    )
+
+
+def batch_entry(entry) -> object:
+    # "NAME" or ["NAME", arg, ...], as send_batch takes them
+    if isinstance(entry, str):
+        return CommandType[entry]
+    return (CommandType[entry[0]], *entry[1:])
+
+
+def handle_request(controller: FMEController, request: dict) -> dict:
+    """
+    Runs one request on the controller and returns the result to send back.
+    """
+    op = request.get("op")
+    if op == "ping":
+        return {}
+
+    if op == "send_command":
+        response = controller.send_command(
+            CommandType[request["command"]],
+            *request.get("args", ()),
+            wait=request.get("wait", True),
+            force=request.get("force", False),
+            options=execution_options(request),
+        )
+        return {"response": encode_response(response)}
+
+    if op == "set_track":
+        return {"response": encode_response(controller.set_track(TrackState[request["state"]]))}
+
+    if op == "send_batch":
+        responses = controller.send_batch(
+            [batch_entry(entry) for entry in request["commands"]],
+            pipelined=request.get("pipelined", True),
+            force=request.get("force", False),
+            options=execution_options(request),
+        )
+        return {"responses": [encode_response(response) for response in responses]}
+
+    if op == "read_status":
+        address = AddressSelector[request["board"]]
+        response = controller.read_status(address, request.get("max_age"))
+        word = response.status_word(address)
+        return {"response": encode_response(response), "bits": word.bits, "names": word.names()}
+
+    if op == "metrics":
+        return {"metrics": controller.metrics.to_dict()}
+
+    raise ValueError(f"unknown op: {op}")
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves one client connection: requests are answered in order until the client hangs up.
+    Every client shares the daemon's controller, whose lock keeps their commands apart on the line.
+    """
+
+    server: "HALDaemon"
+
+    def handle(self):
+        while True:
+            try:
+                request = receive_message(self.request)
+            except (IpcError, OSError, ValueError):
+                return
+
+            try:
+                reply = {"id": request.get("id"), "ok": True, **handle_request(self.server.controller, request)}
+            except (KeyError, ValueError, TypeError) as e:
+                reply = {"id": request.get("id"), "ok": False, "error": f"bad request: {e}"}
+            except Exception as e:
+                logger.error("error handling %s: %s", request.get("op"), e)
+                reply = {"id": request.get("id"), "ok": False, "error": str(e)}
+
+            try:
+                send_message(self.request, reply)
+            except OSError:
+                return
+
+
+def prepare_socket_path(path: str):
+    """
+    Makes path free to bind: creates its directory (only its owner may enter a new one) and removes a socket left
+    over from a daemon that did not shut down cleanly. Raises IpcError if a daemon still answers on path, if path is
+    not a socket, or if the default directory is not private to this user.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if directory == os.path.abspath(SOCKET_DIRECTORY):
+        info = os.stat(directory)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise IpcError(f"{directory} is not private to this user")
+
+    if not os.path.lexists(path):
+        return
+    if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        raise IpcError(f"{path} exists and is not a socket")
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        logger.info("removing stale socket %s", path)
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise IpcError(f"another daemon is listening on {path}")
+
+
+class HALDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Owns the controller (and with it the port) and serves it on a Unix-domain socket, see Client.HALClient.
+    Only the daemon's user may connect: whoever can, can move the kiosk's hardware.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, controller: FMEController, path: str = DEFAULT_SOCKET_PATH):
+        self.controller = controller
+        self.path = path
+        prepare_socket_path(path)
+        super().__init__(path, RequestHandler)
+
+    def server_bind(self):
+        # the socket is created 0600, there is no moment in which others could connect
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def serve(controller: FMEController, path: str = DEFAULT_SOCKET_PATH):
+    """
+    Connects the controller, then serves it on path until interrupted, closing both afterwards.
+    Raises IpcError, having closed the controller, if the socket cannot be set up, e.g. another daemon is serving it.
+    """
+    if not controller.connection.ensure():
+        # the first command reconnects, so a kiosk that is still powering up is not fatal
+        logger.warning("port not connected yet")
+
+    try:
+        daemon = HALDaemon(controller, path)
+    except (IpcError, OSError):
+        controller.close()
+        raise
+
+    if threading.current_thread() is threading.main_thread():
+        # stop like on Ctrl+C when the service manager asks; shutdown() waits for serve_forever, so not on this thread
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.shutdown).start())
+
+    logger.info("serving on %s", path)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+        controller.close()
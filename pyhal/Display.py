@@ -0,0 +1,172 @@
+import hashlib
+import logging
+from typing import Iterable
+
+from pyhal.CommandType import CommandType
+from pyhal.FMEController import FMEController
+
+logger = logging.getLogger(__name__)
+
+# pixel values from_pixels treats as unlit, so rows can be given as strings like "#..#"
+UNLIT_PIXELS = (0, None, "", ".", " ")
+
+
+def encode_payload(data: bytes) -> str:
+    """
+    Encodes display bytes as the text argument of WRITE_GRAPHIC_DATA ("g{0}") and WRITE_GRAPHIC_DATA_TO_EEPROM ("l{0}").
+    """
+    return data.hex().upper()
+
+
+class Bitmap:
+    """
+    Monochrome image, one bit per pixel, most significant bit first, each row padded to whole bytes.
+    """
+
+    __slots__ = ("width", "height", "data")
+
+    def __init__(self, width: int, height: int, data: bytes = None):
+        self.width = width
+        self.height = height
+        self.data = bytes(data) if data is not None else bytes(self.row_bytes * height)
+        if len(self.data) != self.row_bytes * height:
+            raise ValueError(f"Bitmap data must be {self.row_bytes * height} bytes, got {len(self.data)}")
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.width + 7) // 8
+
+    @classmethod
+    def from_pixels(cls, rows: Iterable[Iterable]) -> "Bitmap":
+        """
+        Builds a bitmap from rows of pixels, e.g. from_pixels(["#..#", ".##."]) or rows of 0/1.
+        """
+        rows = [[pixel not in UNLIT_PIXELS for pixel in row] for row in rows]
+        width = max((len(row) for row in rows), default=0)
+        row_bytes = (width + 7) // 8
+        data = bytearray(row_bytes * len(rows))
+        for y, row in enumerate(rows):
+            for x, pixel in enumerate(row):
+                if pixel:
+                    data[y * row_bytes + x // 8] |= 0x80 >> (x % 8)
+        return cls(width, len(rows), data)
+
+
+class Display:
+    """
+    Uploads bitmaps to the side terminal's graphics memory, sending only the chunks that differ from the image
+    already shown. Images stored in the terminal's EEPROM are shown again with a single load instead of an upload.
+    The image in display memory is forgotten whenever the controller forgets its output states (RESET, reopen,
+    communication error); the EEPROM index only lasts as long as this object.
+    """
+
+    # bytes per WRITE_GRAPHIC_DATA frame
+    chunk_size: int = 16
+    # frames per send_batch call, so motion commands can get the line in between
+    batch_size: int = 8
+    # display memory address of the graphics page
+    graphics_address: int = 0
+    eeprom_size: int = 32768
+
+    def __init__(self, controller: FMEController):
+        self.controller = controller
+        self.shown: bytes = None
+        self.columns: int = None
+        self.generation = None
+        self.eeprom: dict[bytes, int] = {}
+        self.eeprom_next = 0
+
+    def forget(self):
+        """
+        Forgets what display memory holds, so the next show() uploads the whole image.
+        """
+        self.shown = None
+        self.columns = None
+
+    def forget_eeprom(self):
+        self.eeprom.clear()
+        self.eeprom_next = 0
+
+    def show(self, bitmap: Bitmap, store: bool = False) -> bool:
+        """
+        Shows the bitmap, uploading only what changed since the last image, or loading it from EEPROM if it is stored there.
+        With store the image is also written to EEPROM (if it fits) so it can be shown again without an upload.
+        Returns False if any command failed, in which case display memory is treated as unknown.
+        """
+        outputs = self.controller.port.state.outputs
+        if self.generation != outputs.generation:
+            self.forget()
+            self.generation = outputs.generation
+
+        data = bitmap.data
+        digest = hashlib.sha1(data).digest()
+        commands = []
+        if self.columns != bitmap.row_bytes:
+            commands.append((CommandType.SET_GRAPHICS_COLUMNS, bitmap.row_bytes))
+
+        if data != self.shown and digest in self.eeprom:
+            logger.debug("loading image from EEPROM at %d", self.eeprom[digest])
+            commands += [
+                (CommandType.SET_EEPROM_POINTER, self.eeprom[digest]),
+                (CommandType.SET_MEMORY_WRITE_POINTER, self.graphics_address),
+                CommandType.LOAD_FROM_EEPROM_TO_DISPLAY_MEMORY,
+            ]
+        elif data != self.shown:
+            commands += self.upload_commands(data)
+
+        store_commands = self.store_commands(data) if store and digest not in self.eeprom else []
+        commands += store_commands
+
+        if not self.send(commands):
+            self.forget()
+            return False
+
+        # the EEPROM space is only taken once the image is known to be written there
+        if store_commands:
+            self.eeprom[digest] = self.eeprom_next
+            self.eeprom_next += len(data)
+
+        self.shown = data
+        self.columns = bitmap.row_bytes
+        return True
+
+    def upload_commands(self, data: bytes) -> list:
+        """
+        Returns the commands writing the chunks of data that differ from the image shown, moving the write pointer
+        only where a changed chunk does not follow on from the previous one.
+        """
+        shown = self.shown if self.shown is not None and len(self.shown) == len(data) else None
+        commands = []
+        next_offset = None
+        for offset in range(0, len(data), self.chunk_size):
+            chunk = data[offset : offset + self.chunk_size]
+            if shown is not None and shown[offset : offset + self.chunk_size] == chunk:
+                continue
+
+            if offset != next_offset:
+                commands.append((CommandType.SET_MEMORY_WRITE_POINTER, self.graphics_address + offset))
+            commands.append((CommandType.WRITE_GRAPHIC_DATA, encode_payload(chunk)))
+            next_offset = offset + len(chunk)
+
+        return commands
+
+    def store_commands(self, data: bytes) -> list:
+        """
+        Returns the commands writing data to the free EEPROM space, or none if it does not fit.
+        """
+        if self.eeprom_next + len(data) > self.eeprom_size:
+            logger.warning("EEPROM full, image of %d bytes not stored", len(data))
+            return []
+
+        commands = [(CommandType.SET_EEPROM_POINTER, self.eeprom_next)]
+        for offset in range(0, len(data), self.chunk_size):
+            commands.append((CommandType.WRITE_GRAPHIC_DATA_TO_EEPROM, encode_payload(data[offset : offset + self.chunk_size])))
+        return commands
+
+    def send(self, commands: list) -> bool:
+        for i in range(0, len(commands), self.batch_size):
+            responses = self.controller.send_batch(commands[i : i + self.batch_size])
+            if not all(response.success and b"ERR" not in response.raw_response for response in responses):
+                logger.warning("display upload failed")
+                return False
+        return True
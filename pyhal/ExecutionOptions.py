@@ -0,0 +1,46 @@
+from pyhal.Cancellation import CancellationToken
+from pyhal.RetryPolicy import NO_RETRY, RetryPolicy
+
+
+class ExecutionOptions:
+    """
+    Per-call overrides for executing a command, kept apart from the shared CommandType definitions.
+    None leaves the command's own value: operation_timeout, wait_pause_time and read_timeout are in ms.
+    deadline is a time.perf_counter() value no attempt or retry may run past; cancelling token stops the call.
+    """
+
+    __slots__ = ("operation_timeout", "wait_pause_time", "read_timeout", "retry", "deadline", "token")
+
+    def __init__(
+        self,
+        operation_timeout: int = None,
+        wait_pause_time: int = None,
+        read_timeout: int = None,
+        retry: RetryPolicy = NO_RETRY,
+        deadline: float = None,
+        token: CancellationToken = None,
+    ):
+        object.__setattr__(self, "operation_timeout", operation_timeout)
+        object.__setattr__(self, "wait_pause_time", wait_pause_time)
+        object.__setattr__(self, "read_timeout", read_timeout)
+        object.__setattr__(self, "retry", retry)
+        object.__setattr__(self, "deadline", deadline)
+        object.__setattr__(self, "token", token)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ExecutionOptions is immutable, use replace()")
+
+    def replace(self, **changes) -> "ExecutionOptions":
+        """
+        Returns a copy with the given fields changed.
+        """
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return ExecutionOptions(**fields)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ExecutionOptions({fields})"
+
+
+DEFAULT_OPTIONS = ExecutionOptions()
@@ -1,58 +1,291 @@
+import logging
+import threading
 import time
 
-import serial
-
+from pyhal import Protocol
 from pyhal.CommandType import CommandType, CommandTypeBase
-from pyhal.Common import CommandResponse, ErrorCode, PortResponse, TrackState, string_index
+from pyhal.Cancellation import CancellationToken
+from pyhal.Common import AddressSelector, CommandResponse, ErrorCode, PortResponse, TrackState
+from pyhal.CompletionModel import CompletionModel, default_model_path
+from pyhal.Connection import ConnectionManager
+from pyhal.ExecutionOptions import DEFAULT_OPTIONS, ExecutionOptions
+from pyhal.Metrics import Metrics
+from pyhal.MotionPlan import MotionPlan, execute_plan
 from pyhal.Port import Port
+from pyhal.RetryPolicy import CircuitBreaker, RetryPolicy
+from pyhal.StatusCache import StatusCondition
+
+logger = logging.getLogger(__name__)
+
+
+def check_arguments(command: CommandType, args: tuple) -> CommandTypeBase:
+    """
+    Returns the command's definition once its arguments are known to encode, raising ValueError otherwise,
+    so a caller's mistake fails before the line is touched instead of counting as a communication error.
+    """
+    command_type = command.value
+    if command_type.command is None:
+        raise ValueError("Command cannot be None")
+    try:
+        command_type.encode(*args)
+    except (IndexError, KeyError, ValueError) as e:
+        raise ValueError(f"invalid arguments for {command.name}: {args!r}") from e
+    return command_type
+
+
+def batch_items(commands: list) -> list[tuple[CommandTypeBase, tuple]]:
+    """
+    Normalises batch entries, either a CommandType or a (CommandType, *args) tuple, to (CommandTypeBase, args).
+    """
+    items = []
+    for entry in commands:
+        command, *args = entry if isinstance(entry, tuple) else (entry,)
+        items.append((check_arguments(command, tuple(args)), tuple(args)))
+    return items
 
 
 class FMEController:
     port: Port
+    completion_model: CompletionModel
+    connection: ConnectionManager
+    metrics: Metrics
+    breaker: CircuitBreaker
+    liveness_command: CommandType = CommandType.VERSION_SERIAL
 
-    def __init__(self, port: str = "COM1", baudrate: int = 9600):
+    def __init__(self, port: str = "COM1", baudrate: int = 9600, completion_model_path: str = None):
         self.port = Port(port=port, baudrate=baudrate)
-        self.port.write_terminator = bytes([13])
-        self.port.validate_response = self.validate_response
+        # learnt timings survive restarts; an empty path keeps them in memory only
+        self.completion_model = CompletionModel(default_model_path(port) if completion_model_path is None else completion_model_path)
+        self.port.framer.validate = self.validate_response
+        self.metrics = self.port.metrics
+        self.breaker = CircuitBreaker()
+        # one operation on the line at a time, whichever thread it comes from
+        self.lock = threading.RLock()
+        self.connection = ConnectionManager(self.port, self.ping if self.liveness_command is not None else None)
 
     def set_track(self, track_state: TrackState) -> PortResponse:
         command = CommandType.TRACK_OPEN if track_state == TrackState.OPEN else CommandType.TRACK_CLOSE
         return self.retryable_command(command, retries=2, delay=5000)
 
-    def validate_response(self, response: bytes) -> bool:
-        string = response.decode()
-        return (
-            string != None and string != "" and (string_index(string, "OK") != -1 or string_index(string, "ERR") != -1)
-        )
+    def close(self):
+        """
+        Closes the port and saves the completion-time model.
+        """
+        with self.lock:
+            self.connection.disconnect()
+        self.completion_model.save()
 
-    def send_command(self, command: CommandType) -> CommandResponse:
-        print(f"[FMEController] Sending command: {command.value.address.name} {command.name}")
+    def ping(self) -> bool:
+        """
+        Cheap liveness check: sends liveness_command directly, bypassing the connection manager.
+        """
+        command_type = self.liveness_command.value
+        response = self.port.run(Protocol.exchange(self.port.state, command_type.address, command_type.frame, command_type.command_wait))
+        return response.success
 
-        response = CommandResponse()
+    def validate_response(self, response: bytes, start: int = 0) -> bool:
+        """
+        Checks whether the response contains a terminator ("OK" or "ERR").
+        Only the bytes from start onwards are scanned, backing up far enough to catch a terminator split across reads.
+        """
+        return Protocol.validate_response(response, start)
 
-        command: CommandTypeBase = command.value
-        if not self.port or not self.port.open():
-            print("[FMEController] unable to open port")
-            response.error = ErrorCode.COMMUNICATION_ERROR
-            return response
+    def send_command(
+        self, command: CommandType, *args, wait: bool = True, force: bool = False, options: ExecutionOptions = DEFAULT_OPTIONS
+    ) -> CommandResponse:
+        """
+        Executes the command, with options overriding its timeouts and poll interval for this call and retrying
+        as options.retry allows. Output commands (LEDs, lights, audio, text) that would leave the output as it is
+        are skipped and return the response that set it, unless force is set.
+        While the board's circuit breaker is open the command fails at once with ARCUS_UNRESPONSIVE.
+        Raises ValueError if args do not fit the command.
+        """
+        logger.debug("sending command: %s %s", command.value.address.name, command.name)
 
-        try:
-            response = command.execute(self.port)
-        except Exception as e:
-            print(f"[FMEController] error sending command: {e}")
-            response.error = ErrorCode.COMMUNICATION_ERROR
+        address = check_arguments(command, args).address
+        attempt = 0
+        while True:
+            response = self.execute_once(command, args, wait, force, options)
+            if not options.retry.should_retry(attempt, response) or self.breaker.is_open(address):
+                return response
 
-        return response
+            delay = options.retry.delay(attempt)
+            if options.deadline is not None and time.perf_counter() + delay / 1000 >= options.deadline:  # convert ms to seconds
+                return response
+
+            attempt += 1
+            self.metrics.record_retry(command.name, address)
+            logger.info("retrying %s after %s in %d ms", command.name, response.error.name, delay)
+            # the lock is not held while backing off, so other callers can use the line;
+            # a cancelled token fails the next attempt straight away
+            if options.token is None:
+                time.sleep(delay / 1000)  # convert ms to seconds
+            else:
+                options.token.wait(delay / 1000)
 
-    def retryable_command(self, command: CommandType, retries: int, delay: int):
+    def execute_once(self, command: CommandType, args: tuple, wait: bool, force: bool, options: ExecutionOptions) -> CommandResponse:
         response = CommandResponse()
-        command.value.operation_timeout = delay
 
-        for i in range(retries):
-            response = self.send_command(command)
-            if response.success or response.comm_error:
+        command_type: CommandTypeBase = command.value
+        if not self.breaker.allow(command_type.address):
+            logger.warning("%s not sent, %s is not responding", command.name, command_type.address.name)
+            response.error = ErrorCode.ARCUS_UNRESPONSIVE
+            return response
+
+        with self.lock:
+            if not self.connection.ensure():
+                logger.error("unable to open port")
+                response.error = ErrorCode.COMMUNICATION_ERROR
                 return response
 
+            start = time.perf_counter()
+            counters = self.metrics.counters()
+            try:
+                response = command_type.execute(self.port, *args, wait=wait, completion_model=self.completion_model, force=force, options=options)
+            except OSError as e:
+                # serial errors included; only failures of the line count against the board
+                logger.error("error sending command %s: %s", command.name, e)
+                self.port.state.invalidate_selection()
+                self.port.state.outputs.invalidate()
+                response.error = ErrorCode.COMMUNICATION_ERROR
+            except Exception:
+                # whatever was under way, the selection can no longer be trusted
+                self.port.state.invalidate_selection()
+                self.port.state.outputs.invalidate()
+                raise
+            self.metrics.record_command(command.name, command_type.address, (time.perf_counter() - start) * 1000, response.error, counters)
+            self.breaker.record(command_type.address, response)
+            self.connection.report(response)
+
+            # a reset drops every board's selection and status
+            if command == CommandType.RESET:
+                self.port.state.invalidate()
+
         return response
-        return response
-        return response
+
+    def send_batch(
+        self,
+        commands: list,
+        pipelined: bool = True,
+        force: bool = False,
+        token: CancellationToken = None,
+        options: ExecutionOptions = DEFAULT_OPTIONS,
+    ) -> list[CommandResponse]:
+        """
+        Sends several commands, e.g. [CommandType.RINGLIGHT_ON, (CommandType.SEND_TEXT, "HELLO")], selecting each board once.
+        Commands are grouped by board (keeping their order within a board) and, with pipelined, runs of commands
+        without a status bit are written back to back. Output commands that would not change anything are skipped
+        unless force is set. options override the timeouts and poll interval of every command, as in send_command;
+        the batch is not retried. Returns one response per command, in the order given.
+        """
+        logger.debug("sending batch of %d commands", len(commands))
+
+        items = batch_items(commands)
+        with self.lock:
+            if not self.connection.ensure():
+                logger.error("unable to open port")
+                response = CommandResponse()
+                response.error = ErrorCode.COMMUNICATION_ERROR
+                return [response] * len(items)
+
+            try:
+                responses = self.port.run(
+                    Protocol.execute_batch(
+                        self.port.state,
+                        items,
+                        pipelined,
+                        self.completion_model,
+                        force,
+                        token or options.token,
+                        options.operation_timeout,
+                        options.wait_pause_time,
+                        options.read_timeout,
+                        options.deadline,
+                    )
+                )
+            except Exception as e:
+                logger.error("error sending batch: %s", e)
+                self.port.state.invalidate_selection()
+                self.port.state.outputs.invalidate()
+                response = CommandResponse()
+                response.error = ErrorCode.COMMUNICATION_ERROR
+                responses = [response] * len(items)
+
+            # a pipelined failure usually fails every item after it, so one check covers the batch
+            failed = next((response for response in responses if response.comm_error), None)
+            if failed is not None:
+                self.connection.report(failed)
+
+            # a reset drops every board's selection and status
+            if any(command is CommandType.RESET.value for command, _ in items):
+                self.port.state.invalidate()
+
+        return responses
+
+    def run_plan(self, plan: MotionPlan, token: CancellationToken = None, deadline: float = None) -> tuple[ErrorCode, dict[str, CommandResponse]]:
+        """
+        Runs a motion plan, starting independent moves together; see MotionPlan.
+        Returns the error code (None on success) and the response of every step that was started, by name.
+        """
+        with self.lock:
+            if not self.connection.ensure():
+                logger.error("unable to open port")
+                return ErrorCode.COMMUNICATION_ERROR, {}
+
+            try:
+                error, responses = self.port.run(execute_plan(self.port.state, plan, self.completion_model, token, deadline))
+            except Exception as e:
+                logger.error("error running plan: %s", e)
+                self.port.state.invalidate_selection()
+                self.port.state.outputs.invalidate()
+                error, responses = ErrorCode.COMMUNICATION_ERROR, {}
+
+            if error == ErrorCode.COMMUNICATION_ERROR:
+                response = CommandResponse()
+                response.error = error
+                self.connection.report(response)
+
+        return error, responses
+
+    def read_status(self, address: AddressSelector, max_age: int = None) -> PortResponse:
+        """
+        Returns the status word of a board, reusing a cached poll younger than max_age ms.
+        """
+        with self.lock:
+            # if this fails the operation reports the closed port as a communication error
+            self.connection.ensure()
+            return self.port.run(Protocol.read_status(self.port.state, address, max_age))
+
+    def wait_for_status(
+        self, conditions: list[StatusCondition], match_all: bool = False, operation_timeout: int = None, wait_pause_time: int = 50
+    ) -> tuple[ErrorCode, list[StatusCondition]]:
+        """
+        Waits until any (or all, with match_all) of the status conditions hold, e.g. "bit 5 cleared OR bit 9 cleared".
+        operation_timeout (ms) defaults to Protocol.DEFAULT_OPERATION_TIMEOUT.
+        """
+        with self.lock:
+            # if this fails the operation reports the closed port as a communication error
+            self.connection.ensure()
+            return self.port.run(Protocol.wait_for_status(self.port.state, conditions, match_all, operation_timeout, wait_pause_time))
+
+    def wait_for_commands(
+        self, commands: list[CommandType], operation_timeout: int = None, token: CancellationToken = None, deadline: float = None
+    ) -> ErrorCode:
+        """
+        Waits for several commands started with send_command(..., wait=False) to finish, polling each board once per iteration.
+        On timeout or cancellation the reset commands of the moves that did not finish are sent.
+        operation_timeout (ms) defaults to the longest of the commands' timeouts, see Protocol.move_timeout.
+        """
+        with self.lock:
+            # if this fails the operation reports the closed port as a communication error
+            self.connection.ensure()
+            return self.port.run(
+                Protocol.wait_for_commands(self.port.state, [command.value for command in commands], operation_timeout, token, deadline)
+            )
+
+    def retryable_command(self, command: CommandType, retries: int, delay: int) -> CommandResponse:
+        """
+        Executes the command with an operation timeout of delay ms, making up to retries attempts while it times out.
+        """
+        options = ExecutionOptions(operation_timeout=delay, retry=RetryPolicy(retries=max(0, retries - 1)))
+        return self.send_command(command, options=options)
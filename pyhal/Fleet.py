@@ -0,0 +1,171 @@
+import logging
+import shlex
+import statistics
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from pyhal.CommandType import CommandType
+from pyhal.FMEController import FMEController
+
+logger = logging.getLogger(__name__)
+
+# answers from every board and both status words: the boards are powered, wired and responding
+HEALTH_CHECK = [
+    CommandType.VERSION_SERIAL,
+    CommandType.VERSION_PICKER,
+    CommandType.VERSION_AUX,
+    CommandType.STATUS_PICKER,
+    CommandType.STATUS_AUX,
+]
+
+
+def parse_target(spec: str, baudrate: int = 9600) -> tuple[str, int]:
+    """
+    Splits "PORT" or "PORT@BAUDRATE", e.g. "/dev/ttyUSB1@19200", into the port and its baud rate.
+    """
+    port, _, rate = spec.rpartition("@")
+    if port and rate.isdigit():
+        return port, int(rate)
+    return spec, baudrate
+
+
+def load_script(path: str) -> list:
+    """
+    Reads a command script: one command per line, its name followed by any arguments (quoted if they contain
+    spaces), e.g. SEND_TEXT "PLEASE WAIT". Blank lines and lines starting with # are skipped.
+    """
+    script = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            if words[0] not in CommandType.__members__:
+                raise ValueError(f"{path}:{number}: unknown command {words[0]}")
+            script.append((CommandType[words[0]], *words[1:]) if len(words) > 1 else CommandType[words[0]])
+    return script
+
+
+class StepResult:
+    __slots__ = ("command", "elapsed", "error", "response")
+
+    def __init__(self, command: str, elapsed: float, error: str = None, response: str = None):
+        self.command = command
+        # ms, the command including any status polling
+        self.elapsed = elapsed
+        self.error = error
+        self.response = response
+
+
+class PortReport:
+    """
+    The outcome of a script on one port. error is set when the run itself failed (e.g. the controller could not
+    be created), the steps run until then are kept.
+    """
+
+    def __init__(self, port: str, baudrate: int):
+        self.port = port
+        self.baudrate = baudrate
+        self.steps: list[StepResult] = []
+        self.error: str = None
+        # ms, the whole run from creating the controller to closing it
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(step.error is None for step in self.steps)
+
+    def summary(self) -> dict:
+        latencies = sorted(step.elapsed for step in self.steps)
+        errors: dict[str, int] = {}
+        for step in self.steps:
+            if step.error is not None:
+                errors[step.error] = errors.get(step.error, 0) + 1
+
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "ok": self.ok,
+            "error": self.error,
+            "elapsed": self.elapsed,
+            "commands": len(self.steps),
+            "failed": sum(errors.values()),
+            "errors": errors,
+            "latency": {
+                "mean": statistics.fmean(latencies) if latencies else None,
+                "median": statistics.median(latencies) if latencies else None,
+                "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+
+def run_script(port: str, baudrate: int, script: list, stop_on_error: bool = False) -> PortReport:
+    """
+    Runs script (commands as send_batch takes them, or their names) on its own controller for port, one command
+    at a time. Never raises, whatever goes wrong ends up in the report, so one bad port cannot take the fleet down.
+    """
+    report = PortReport(port, baudrate)
+    start = time.perf_counter()
+    controller = None
+    try:
+        controller = FMEController(port=port, baudrate=baudrate)
+        for step in script:
+            command, *args = step if isinstance(step, tuple) else (step,)
+            if isinstance(command, str):
+                command = CommandType[command]
+            step_start = time.perf_counter()
+            response = controller.send_command(command, *args)
+            elapsed = (time.perf_counter() - step_start) * 1000  # convert seconds to ms
+            error = response.error.name if response.error is not None else None if response.response_valid else "INVALID_RESPONSE"
+            report.steps.append(StepResult(command.name, elapsed, error, response.response))
+            if error is not None and stop_on_error:
+                break
+    except Exception as e:
+        logger.error("%s: %s", port, e)
+        report.error = f"{type(e).__name__}: {e}"
+    finally:
+        if controller is not None:
+            try:
+                controller.close()
+            except Exception as e:
+                logger.warning("%s: error closing: %s", port, e)
+        report.elapsed = (time.perf_counter() - start) * 1000  # convert seconds to ms
+
+    return report
+
+
+class Fleet:
+    """
+    Runs the same script on several ports at once, one controller per port, so checking N kiosks takes as long as
+    the slowest one. Threads suit the blocking serial I/O; processes also keep a crashing driver or a stuck
+    interpreter to its own port.
+    """
+
+    def __init__(self, targets: list[tuple[str, int]], processes: bool = False, max_workers: int = None):
+        self.targets = targets
+        self.processes = processes
+        self.max_workers = max_workers or len(targets)
+
+    def executor(self) -> Executor:
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pyhal-fleet")
+
+    def run(self, script: list = HEALTH_CHECK, stop_on_error: bool = False) -> list[PortReport]:
+        """
+        Returns one report per target, in the order of targets.
+        """
+        with self.executor() as executor:
+            futures = [executor.submit(run_script, port, baudrate, script, stop_on_error) for port, baudrate in self.targets]
+
+        reports = []
+        for (port, baudrate), future in zip(self.targets, futures):
+            try:
+                reports.append(future.result())
+            except Exception as e:
+                # only a worker process dying gets here, run_script catches everything else
+                report = PortReport(port, baudrate)
+                report.error = f"{type(e).__name__}: {e}"
+                reports.append(report)
+        return reports
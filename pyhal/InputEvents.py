@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import AsyncIterator, Callable
+
+from pyhal.CommandType import CommandType
+from pyhal.Common import CommandResponse
+
+logger = logging.getLogger(__name__)
+
+ALL_BITS = -1
+
+
+class InputEvent:
+    """
+    An input bit of a board that changed, or (command READ_QR_BUTTON, bit 0, value True) for a button press.
+    timestamp is the time.time() of the read that confirmed it.
+    """
+
+    __slots__ = ("command", "bit", "value", "timestamp")
+
+    def __init__(self, command: CommandType, bit: int, value: bool, timestamp: float):
+        self.command = command
+        self.bit = bit
+        self.value = value
+        self.timestamp = timestamp
+
+    @property
+    def button_pressed(self) -> bool:
+        return self.command == CommandType.READ_QR_BUTTON
+
+    def __repr__(self):
+        return f"InputEvent({self.command.name}, bit {self.bit} {'rose' if self.value else 'fell'})"
+
+
+class Subscription:
+    __slots__ = ("callback", "command", "mask")
+
+    def __init__(self, callback: Callable[[InputEvent], None], command: CommandType, mask: int):
+        self.callback = callback
+        self.command = command
+        self.mask = mask
+
+    def wants(self, event: InputEvent) -> bool:
+        return (self.command is None or self.command == event.command) and (self.mask >> event.bit) & 1 == 1
+
+
+class InputState:
+    __slots__ = ("stable", "candidate", "count")
+
+    def __init__(self):
+        # the debounced bits, None until the first read
+        self.stable: int = None
+        # bits that differ from stable and how many reads in a row have returned them
+        self.candidate: int = None
+        self.count = 0
+
+
+class InputWatcher:
+    """
+    One background poller for the QR button and the picker and aux inputs, replacing application polling loops:
+
+        watcher = InputWatcher(controller)
+        watcher.on_button(lambda event: print("pressed"))
+        inputs = watcher.queue(CommandType.READ_PICKER_INPUTS, mask=1 << 3)
+        watcher.start()
+
+        async for event in watcher.events(CommandType.AUX_SENSORS_READ):
+            ...
+
+    Only sources someone has subscribed to are read. Polling runs every fast_interval ms after activity and slows
+    down by backoff per quiet poll up to idle_interval ms. An input change is reported once debounce reads in a row
+    agree on it; a button press is acknowledged with CLEAR_QR_BUTTON_STATUS straight away and presses within
+    button_debounce ms of the previous one are dropped. Callbacks run on the poller thread and should return quickly.
+    Like the telemetry sampler, the poller never queues behind a command: while the line is busy it tries again shortly.
+    """
+
+    fast_interval: int = 50
+    idle_interval: int = 500
+    backoff: float = 1.5
+    debounce: int = 2
+    button_debounce: int = 300
+    busy_retry: int = 10
+    # a pressed button reads "1" as the first character
+    button_bit: int = 0
+
+    sources = (CommandType.READ_QR_BUTTON, CommandType.READ_PICKER_INPUTS, CommandType.AUX_SENSORS_READ)
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.lock = threading.Lock()
+        self.subscriptions: list[Subscription] = []
+        self.states = {command: InputState() for command in self.sources}
+        self.last_press = 0.0
+        self.interval = self.idle_interval
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+
+    def subscribe(self, callback: Callable[[InputEvent], None], command: CommandType = None, mask: int = ALL_BITS) -> Subscription:
+        """
+        Calls callback with every event of command (any source without) on a bit in mask.
+        """
+        if command is not None and command not in self.sources:
+            raise ValueError(f"{command.name} is not an input source")
+        subscription = Subscription(callback, command, mask)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def on_button(self, callback: Callable[[InputEvent], None]) -> Subscription:
+        return self.subscribe(callback, CommandType.READ_QR_BUTTON)
+
+    def queue(self, command: CommandType = None, mask: int = ALL_BITS, maxsize: int = 0) -> queue.Queue:
+        """
+        Returns a queue.Queue that receives the events; when it is full further events are dropped.
+        """
+        events = queue.Queue(maxsize)
+
+        def put(event: InputEvent):
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                logger.warning("input event queue full, dropping %r", event)
+
+        self.subscribe(put, command, mask)
+        return events
+
+    async def events(self, command: CommandType = None, mask: int = ALL_BITS) -> AsyncIterator[InputEvent]:
+        """
+        Yields the events in the running event loop until the iteration is stopped.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue[InputEvent] = asyncio.Queue()
+        subscription = self.subscribe(lambda event: loop.call_soon_threadsafe(events.put_nowait, event), command, mask)
+        try:
+            while True:
+                yield await events.get()
+        finally:
+            self.unsubscribe(subscription)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="pyhal-inputs", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def __enter__(self) -> "InputWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def watched(self) -> list[CommandType]:
+        with self.lock:
+            if any(subscription.command is None for subscription in self.subscriptions):
+                return list(self.sources)
+            return [command for command in self.sources if any(subscription.command == command for subscription in self.subscriptions)]
+
+    def run(self):
+        while not self.stopping.wait(self.interval / 1000):  # convert ms to seconds
+            commands = self.watched()
+            if not commands:
+                continue
+
+            if not self.controller.lock.acquire(blocking=False):
+                self.stopping.wait(self.busy_retry / 1000)  # convert ms to seconds
+                continue
+
+            try:
+                events, unsettled = self.poll(commands)
+            finally:
+                self.controller.lock.release()
+
+            if events or unsettled:
+                self.interval = self.fast_interval
+            else:
+                self.interval = min(self.idle_interval, self.interval * self.backoff)
+
+            for event in events:
+                self.publish(event)
+
+    def poll(self, commands: list[CommandType]) -> tuple[list[InputEvent], bool]:
+        """
+        Reads each source once, holding the controller lock. Returns the new events and whether any input
+        change is still waiting to be confirmed.
+        """
+        events = []
+        unsettled = False
+        for command in commands:
+            response = self.controller.send_command(command)
+            if not response.success:
+                logger.debug("reading %s failed: %s", command.name, response)
+                continue
+
+            now = time.time()
+            word = response.status_word(command.value.address)
+            if command == CommandType.READ_QR_BUTTON:
+                if word.is_set(self.button_bit):
+                    self.acknowledge()
+                    if (now - self.last_press) * 1000 >= self.button_debounce:
+                        events.append(InputEvent(command, self.button_bit, True, now))
+                    self.last_press = now
+                continue
+
+            state = self.states[command]
+            if state.stable is None or word.bits == state.stable:
+                state.stable = word.bits
+                state.candidate = None
+                continue
+
+            if word.bits != state.candidate:
+                state.candidate = word.bits
+                state.count = 0
+            state.count += 1
+            if state.count < self.debounce:
+                unsettled = True
+                continue
+
+            changed = state.stable ^ word.bits
+            while changed:
+                low = changed & -changed
+                events.append(InputEvent(command, low.bit_length() - 1, word.bits & low != 0, now))
+                changed ^= low
+            state.stable = word.bits
+            state.candidate = None
+
+        return events, unsettled
+
+    def acknowledge(self) -> CommandResponse:
+        response = self.controller.send_command(CommandType.CLEAR_QR_BUTTON_STATUS)
+        if not response.success:
+            logger.warning("unable to clear the QR button status: %s", response)
+        return response
+
+    def publish(self, event: InputEvent):
+        with self.lock:
+            subscriptions = [subscription for subscription in self.subscriptions if subscription.wants(event)]
+
+        for subscription in subscriptions:
+            try:
+                subscription.callback(event)
+            except Exception as e:
+                logger.error("input event callback failed for %r: %s", event, e)
@@ -0,0 +1,59 @@
+import json
+import os
+import socket
+import struct
+import tempfile
+
+from pyhal.Common import ErrorCode, PortResponse
+
+# the daemon's socket lives in a directory only its user can enter, not straight in the shared temp directory
+SOCKET_DIRECTORY = os.path.join(tempfile.gettempdir(), f"pyhal-{os.getuid()}" if hasattr(os, "getuid") else "pyhal")
+# where the daemon listens unless told otherwise
+DEFAULT_SOCKET_PATH = os.path.join(SOCKET_DIRECTORY, "pyhal.sock")
+
+# every message is a big-endian length followed by that many bytes of UTF-8 JSON
+LENGTH = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class IpcError(Exception):
+    pass
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise IpcError("connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock: socket.socket, message: dict):
+    data = json.dumps(message, separators=(",", ":")).encode()
+    sock.sendall(LENGTH.pack(len(data)) + data)
+
+
+def receive_message(sock: socket.socket) -> dict:
+    (size,) = LENGTH.unpack(receive_exactly(sock, LENGTH.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise IpcError(f"message of {size} bytes is too large")
+    return json.loads(receive_exactly(sock, size))
+
+
+def encode_response(response: PortResponse) -> dict:
+    return {
+        "valid": response.response_valid,
+        "response": response.response,
+        "error": response.error.name if response.error is not None else None,
+    }
+
+
+def decode_response(data: dict) -> PortResponse:
+    return PortResponse(
+        response_valid=data["valid"],
+        response=data["response"],
+        raw_response=data["response"].encode() if data["response"] is not None else None,
+        error=ErrorCode[data["error"]] if data["error"] is not None else None,
+    )
@@ -0,0 +1,246 @@
+import json
+import threading
+from bisect import bisect_left
+
+from pyhal.Common import AddressSelector, ErrorCode
+
+# upper bounds in ms, from a single frame round trip up to the slowest moves
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; counts[i] holds the observations up to bounds[i], the last count everything above.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the q-th quantile (0..1), or None without observations.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ("+Inf",), self.counts)},
+        }
+
+
+class CommandStats:
+    """
+    Totals for one CommandType: end-to-end latency, including any status polling, and what it cost on the wire.
+    """
+
+    __slots__ = ("board", "latency", "errors", "timeouts", "retries", "polls", "bytes_sent", "bytes_received")
+
+    def __init__(self, board: AddressSelector):
+        self.board = board
+        self.latency = Histogram()
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.polls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "board": self.board.name,
+            "latency": self.latency.to_dict(),
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "polls": self.polls,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class BoardStats:
+    """
+    Totals for one board: the round-trip latency of every frame sent to it, selectors and status polls included.
+    """
+
+    __slots__ = ("latency", "frames", "polls", "errors", "timeouts", "bytes_sent", "bytes_received")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.frames = 0
+        self.polls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "latency": self.latency.to_dict(),
+            "frames": self.frames,
+            "polls": self.polls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class Metrics:
+    """
+    Per-command and per-board counters and latency histograms, all times in ms.
+    The port records every frame it exchanges, the controller every command; reading them costs nothing on the line.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands: dict[str, CommandStats] = {}
+        self.boards: dict[AddressSelector, BoardStats] = {}
+        # running totals, so a command's share can be taken as the difference around it
+        self.polls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def reset(self):
+        with self.lock:
+            self.commands.clear()
+            self.boards.clear()
+            self.polls = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def counters(self) -> tuple[int, int, int]:
+        """
+        Returns the running (polls, bytes sent, bytes received) totals.
+        """
+        return self.polls, self.bytes_sent, self.bytes_received
+
+    def record_frames(self, address: AddressSelector, elapsed: float, frames: int, sent: int, received: int, polls: int, error: ErrorCode):
+        """
+        Records one exchange with a board: frames written in one go, elapsed ms until the last response.
+        """
+        with self.lock:
+            stats = self.boards.get(address)
+            if stats is None:
+                stats = self.boards[address] = BoardStats()
+            stats.latency.observe(elapsed)
+            stats.frames += frames
+            stats.polls += polls
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            if error == ErrorCode.TIMEOUT:
+                stats.timeouts += 1
+            elif error is not None:
+                stats.errors += 1
+
+            self.polls += polls
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def command_stats(self, name: str, board: AddressSelector) -> CommandStats:
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats(board)
+        return stats
+
+    def record_command(self, name: str, board: AddressSelector, elapsed: float, error: ErrorCode, before: tuple[int, int, int]):
+        """
+        Records a finished command; before is counters() taken when it started.
+        """
+        with self.lock:
+            stats = self.command_stats(name, board)
+            stats.latency.observe(elapsed)
+            stats.polls += self.polls - before[0]
+            stats.bytes_sent += self.bytes_sent - before[1]
+            stats.bytes_received += self.bytes_received - before[2]
+            if error == ErrorCode.TIMEOUT:
+                stats.timeouts += 1
+            elif error is not None:
+                stats.errors += 1
+
+    def record_retry(self, name: str, board: AddressSelector):
+        with self.lock:
+            self.command_stats(name, board).retries += 1
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "commands": {name: stats.to_dict() for name, stats in self.commands.items()},
+                "boards": {address.name: stats.to_dict() for address, stats in self.boards.items()},
+                "polls": self.polls,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "pyhal") -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def histogram(name: str, help_text: str, series: list[tuple[str, Histogram]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for labels, h in series:
+                cumulative = 0
+                for bound, count in zip(h.bounds + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_{name}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{prefix}_{name}_count{{{labels}}} {h.count}")
+
+        def counter(name: str, help_text: str, series: list[tuple[str, int]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, value in series:
+                lines.append(f"{prefix}_{name}{{{labels}}} {value}")
+
+        with self.lock:
+            commands = [(f'command="{name}",board="{stats.board.name}"', stats) for name, stats in self.commands.items()]
+            boards = [(f'board="{address.name}"', stats) for address, stats in self.boards.items()]
+
+            histogram("command_latency_ms", "Command latency including status polling.", [(l, s.latency) for l, s in commands])
+            counter("command_errors_total", "Commands that failed.", [(l, s.errors) for l, s in commands])
+            counter("command_timeouts_total", "Commands that timed out.", [(l, s.timeouts) for l, s in commands])
+            counter("command_retries_total", "Command retries.", [(l, s.retries) for l, s in commands])
+            counter("command_polls_total", "Status polls sent while waiting for commands.", [(l, s.polls) for l, s in commands])
+            counter("command_sent_bytes_total", "Bytes written for commands.", [(l, s.bytes_sent) for l, s in commands])
+            counter("command_received_bytes_total", "Bytes read for commands.", [(l, s.bytes_received) for l, s in commands])
+
+            histogram("board_latency_ms", "Frame round-trip latency per board.", [(l, s.latency) for l, s in boards])
+            counter("board_frames_total", "Frames sent to the board.", [(l, s.frames) for l, s in boards])
+            counter("board_polls_total", "Status polls sent to the board.", [(l, s.polls) for l, s in boards])
+            counter("board_errors_total", "Frames that failed.", [(l, s.errors) for l, s in boards])
+            counter("board_timeouts_total", "Frames that timed out.", [(l, s.timeouts) for l, s in boards])
+            counter("board_sent_bytes_total", "Bytes written to the board.", [(l, s.bytes_sent) for l, s in boards])
+            counter("board_received_bytes_total", "Bytes read from the board.", [(l, s.bytes_received) for l, s in boards])
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,214 @@
+import logging
+from typing import TYPE_CHECKING, Iterable
+
+from pyhal import Protocol
+from pyhal.CommandType import CommandType
+from pyhal.Common import CommandResponse, ErrorCode
+from pyhal.Protocol import Operation, Pause, ProtocolState
+
+if TYPE_CHECKING:
+    from pyhal.Cancellation import CancellationToken
+    from pyhal.CompletionModel import CompletionModel
+
+logger = logging.getLogger(__name__)
+
+
+class Step:
+    __slots__ = ("name", "command", "args", "after", "operation_timeout")
+
+    def __init__(self, name: str, command: CommandType, args: tuple, after: tuple[str, ...], operation_timeout: int = None):
+        self.name = name
+        self.command = command
+        self.args = args
+        self.after = after
+        self.operation_timeout = operation_timeout
+
+
+class MotionPlan:
+    """
+    A set of commands and the order they depend on, e.g. for a vend:
+
+        plan = MotionPlan(operation_timeout=10000)
+        plan.add(CommandType.TRACK_OPEN)
+        plan.add(CommandType.VEND_DOOR_OPEN)
+        plan.add(CommandType.GRIPPER_EXTEND, after=["TRACK_OPEN"])
+        plan.add(CommandType.GRIPPER_CLOSE, after=["GRIPPER_EXTEND", "VEND_DOOR_OPEN"])
+        error, responses = controller.run_plan(plan)
+
+    Steps only depend on steps added before them, so a plan can never contain a cycle.
+    A move gives up after its step's operation_timeout (ms), else the plan's, else its command's move_timeout.
+    """
+
+    def __init__(self, operation_timeout: int = None):
+        self.steps: dict[str, Step] = {}
+        self.operation_timeout = operation_timeout
+
+    def add(self, command: CommandType, *args, name: str = None, after: Iterable[str] = (), operation_timeout: int = None) -> "MotionPlan":
+        """
+        Adds a step, named after its command unless name is given, that starts once every step in after has finished.
+        """
+        name = command.name if name is None else name
+        if name in self.steps:
+            raise ValueError(f"Duplicate step name: {name}")
+
+        after = tuple(after)
+        for dependency in after:
+            if dependency not in self.steps:
+                raise ValueError(f"Step {name} depends on unknown step {dependency}")
+
+        if command.value.command is None:
+            raise ValueError("Command cannot be None")
+
+        self.steps[name] = Step(name, command, tuple(args), after, operation_timeout)
+        return self
+
+
+class RunningStep:
+    __slots__ = ("step", "command", "start", "timeout", "schedule")
+
+    def __init__(self, step: Step, start: float, timeout: int, schedule):
+        self.step = step
+        self.command = step.command.value
+        self.start = start
+        self.timeout = timeout
+        self.schedule = schedule
+
+
+def poll_running(
+    state: ProtocolState,
+    running: dict[str, RunningStep],
+    finished: set[str],
+    responses: dict[str, CommandResponse],
+    completion_model: "CompletionModel" = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+) -> Operation:
+    """
+    Waits for the next poll, then polls every board with a running step once, moving the steps that have
+    completed from running to finished. Returns the error code that should stop the plan, or None.
+    """
+    now = state.clock()
+    pause = min(r.command.wait_pause_time if r.schedule is None else r.schedule((now - r.start) * 1000) for r in running.values())
+    if deadline is not None:
+        pause = max(0.0, min(pause, (deadline - now) * 1000))
+    yield Pause(pause, token)
+    if token is not None and token.cancelled:
+        return ErrorCode.CANCELLED
+
+    # start with the board that is already selected, saving a selector per iteration
+    addresses = sorted(dict.fromkeys(r.command.address for r in running.values()), key=lambda address: address != state.selected_address)
+    statuses = {}
+    for address in addresses:
+        status = yield from Protocol.read_status(state, address, max_age=pause)
+        if status.comm_error:
+            logger.warning("communication error polling %s", address.name)
+            return ErrorCode.COMMUNICATION_ERROR
+        statuses[address] = status
+
+    error = None
+    now = state.clock()
+    for name, r in list(running.items()):
+        if r.command.status_condition.matches(statuses[r.command.address]):
+            del running[name]
+            finished.add(name)
+            if completion_model is not None:
+                completion_model.record(r.command.name, (now - r.start) * 1000)
+        elif (now - r.start) * 1000 > r.timeout or (deadline is not None and now >= deadline):
+            logger.warning("plan step %s timed out", name)
+            responses[name].error = ErrorCode.TIMEOUT
+            error = ErrorCode.TIMEOUT
+            if completion_model is not None:
+                completion_model.record_timeout(r.command.name, (now - r.start) * 1000)
+
+    return error
+
+
+def reset_running(state: ProtocolState, running: dict[str, RunningStep]) -> Operation:
+    """
+    Sends the reset command of every move in running, then forgets them.
+    """
+    for r in list(running.values()):
+        yield from Protocol.reset(state, r.command)
+    running.clear()
+
+
+def execute_plan(
+    state: ProtocolState,
+    plan: MotionPlan,
+    completion_model: "CompletionModel" = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+    running: dict[str, RunningStep] = None,
+) -> Operation:
+    """
+    Runs the plan: every step starts as soon as its dependencies have finished, so independent moves on different
+    boards run together, and each board with a running move is polled once per iteration.
+    If a move times out (or the deadline, a state.clock time, passes), the line fails or token is cancelled, the moves
+    still running are reset, reported as CANCELLED unless they failed themselves, and no further steps are started.
+    running, if given, is kept up to date with the moves under way, so a caller abandoning the operation (e.g. a
+    cancelled task) can stop them with reset_running.
+    Returns the error code (None on success) and the response of every step that was started, by name.
+    """
+    pending = dict(plan.steps)
+    finished = set()
+    running = {} if running is None else running
+    responses: dict[str, CommandResponse] = {}
+    error = None
+
+    while True:
+        if token is not None and token.cancelled:
+            error = ErrorCode.CANCELLED
+
+        # start everything that has become ready
+        if error is None:
+            for name, step in list(pending.items()):
+                if any(dependency not in finished for dependency in step.after):
+                    continue
+                del pending[name]
+
+                command = step.command.value
+                frame = command.encode(*step.args)
+                start = state.clock()
+                response = state.outputs.get(command, frame)
+                if response is None:
+                    response = yield from Protocol.exchange(state, command.address, frame, command.command_wait)
+                    state.outputs.update(command, frame, response)
+                    state.status_cache.invalidate(command.address)
+                responses[name] = response
+
+                if response.comm_error:
+                    error = ErrorCode.COMMUNICATION_ERROR
+                    break
+                if command.status_bit is None:
+                    finished.add(name)
+                    continue
+
+                timeout = step.operation_timeout if step.operation_timeout is not None else plan.operation_timeout
+                if timeout is None:
+                    timeout = Protocol.move_timeout(command)
+                schedule = None
+                if completion_model is not None:
+                    timeout = completion_model.timeout(command.name, timeout)
+                    schedule = completion_model.schedule(command.name, command.wait_pause_time)
+                running[name] = RunningStep(step, start, timeout, schedule)
+
+            # finishing a step without a status bit may have readied others
+            if error is None and any(all(dependency in finished for dependency in step.after) for step in pending.values()):
+                continue
+
+        if running and error is None:
+            error = yield from poll_running(state, running, finished, responses, completion_model, token, deadline)
+
+        if error is not None:
+            # stop every move still under way, not just the one that failed
+            for name in running:
+                if responses[name].error is None:
+                    responses[name].error = ErrorCode.CANCELLED
+            yield from reset_running(state, running)
+            break
+
+        # every step depends only on earlier ones, so while steps are pending one of them is running or ready
+        if not running and not pending:
+            break
+
+    return error, responses
@@ -0,0 +1,106 @@
+import re
+from typing import TYPE_CHECKING
+
+from pyhal.Common import COMMAND_TERMINATOR, AddressSelector, PortResponse
+
+if TYPE_CHECKING:
+    from pyhal.CommandType import CommandTypeBase
+
+# O<n>/P<n> switch output n of the picker and aux boards on and off
+OUTPUT_SWITCH = re.compile(r"[OP]\d")
+# I/R/T/Z/W drive the side terminal's LEDs and back light, 1 = on, 2 = blink, 3 = off
+QR_INDICATOR = re.compile(r"[IRTZW][123]")
+# side terminal queries that leave the screen alone
+QR_QUERIES = frozenset({"J", "K", "Y", "c"})
+
+TEXT_CHANNEL = (AddressSelector.QR, "text")
+
+
+def output_channel(address: AddressSelector, command: str) -> tuple:
+    """
+    Returns the output a command sets, e.g. (PICKER, "O2") for both "O2" and "P2", or None if it sets none.
+    Commands on the same channel are alternative states of one output, so only the last one sent matters.
+    """
+    if command is None:
+        return None
+
+    if address in (AddressSelector.PICKER, AddressSelector.AUX) and OUTPUT_SWITCH.fullmatch(command):
+        return address, "O" + command[1]
+
+    if address == AddressSelector.QR:
+        if QR_INDICATOR.fullmatch(command):
+            return address, command[0]
+        if command == "S{0}":
+            return TEXT_CHANNEL
+
+    if address == AddressSelector.SERIAL and command in ("I", "J"):
+        return address, "audio"
+
+    return None
+
+
+class OutputState:
+    """
+    The last state sent to each output, so commands that would not change anything can be skipped.
+    Anything that may have reset a board (RESET, a reopen, a communication error) forgets it all.
+    """
+
+    def __init__(self):
+        self.outputs: dict[tuple, tuple[bytes, PortResponse]] = {}
+        self.skipped = 0
+        # bumped whenever everything is forgotten, so models of other device state (e.g. Display) can follow
+        self.generation = 0
+
+    def invalidate(self):
+        self.outputs.clear()
+        self.generation += 1
+
+    def get(self, command: "CommandTypeBase", frame: bytes) -> PortResponse:
+        """
+        Returns the response that set the output to frame if it is still in that state, otherwise None.
+        """
+        if command.output_channel is None:
+            return None
+
+        known = self.outputs.get(command.output_channel)
+        if known is None or known[0] != frame:
+            return None
+
+        self.skipped += 1
+        return known[1]
+
+    def update(self, command: "CommandTypeBase", frame: bytes, response: PortResponse):
+        """
+        Records the outcome of sending frame for command.
+        """
+        if response.comm_error:
+            self.invalidate()
+            return
+
+        channel = command.output_channel
+        if channel is None:
+            # anything else sent to the side terminal may redraw the screen
+            if command.address == AddressSelector.QR and command.command not in QR_QUERIES:
+                self.outputs.pop(TEXT_CHANNEL, None)
+            return
+
+        self.set(channel, frame, response)
+
+    def update_frame(self, address: AddressSelector, frame: bytes, response: PortResponse):
+        """
+        Records the outcome of a frame sent outside any command, e.g. "P1" resetting a move, which switches an
+        output all the same.
+        """
+        if response.comm_error:
+            self.invalidate()
+            return
+
+        channel = output_channel(address, frame.removesuffix(COMMAND_TERMINATOR).decode(errors="replace"))
+        if channel is not None:
+            self.set(channel, frame, response)
+
+    def set(self, channel: tuple, frame: bytes, response: PortResponse):
+        if response.success and b"ERR" not in response.raw_response:
+            self.outputs[channel] = (frame, response)
+        else:
+            self.outputs.pop(channel, None)
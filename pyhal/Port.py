@@ -1,50 +1,86 @@
+import logging
 import time
-from typing import Callable
+from typing import TYPE_CHECKING, Any
 
-import serial
+from pyhal.Cancellation import CancellationToken
+from pyhal.Common import COMMAND_TERMINATOR, ErrorCode, PortResponse
+from pyhal.Metrics import Metrics
+from pyhal.Protocol import STATUS_FRAME, Operation, ProtocolState, ResponseFramer, Transmit, TransmitBatch
 
-from pyhal.Common import ErrorCode, PortResponse
+if TYPE_CHECKING:
+    import serial
+
+logger = logging.getLogger(__name__)
+
+
+def serial_backend():
+    """
+    Returns pyserial, with pyhal's URL schemes registered. It is imported when the first port is created,
+    so tools that only need the command table or the daemon client never load it.
+    """
+    import serial
+
+    from pyhal import urlhandler  # noqa: F401, registers pyhal's serial URL schemes
+
+    return serial
 
 
 class Port:
-    port: serial.Serial
-    write_terminator: bytes
-    write_pause: int = 10
+    port: "serial.Serial"
+    write_terminator: bytes = COMMAND_TERMINATOR
+    frame_gap: int = 0
+    last_frame_time: float = 0.0
     read_timeout: int = None
     write_timeout: int = 5000
     open_pause: int = 3000
-    validate_response: Callable[[bytes], bool]
+    read_deadline_slack: int = 20
+    framer: ResponseFramer
+    state: ProtocolState
+    metrics: Metrics
 
     def __init__(self, port: str = "COM1", baudrate: int = 9600):
-        self.port = serial.Serial(
-            port=port,
+        self.framer = ResponseFramer()
+        self.state = ProtocolState()
+        self.metrics = Metrics()
+        # serial_for_url also accepts pyserial URLs such as loop:// besides plain device names;
+        # the device is only opened by open(), so the settle time is paid once per real (re)connect
+        serial = serial_backend()
+        self.port = serial.serial_for_url(
+            port,
             baudrate=baudrate,
             bytesize=8,
             parity=serial.PARITY_NONE,
             stopbits=1,
-            timeout=self.read_timeout,
-            write_timeout=self.write_timeout,
+            timeout=self.read_timeout / 1000 if self.read_timeout is not None else None,  # convert ms to seconds
+            write_timeout=self.write_timeout / 1000,  # convert ms to seconds
+            do_not_open=True,
         )
 
+    @property
+    def is_open(self) -> bool:
+        return self.port is not None and self.port.is_open
+
     def open(self):
         if self.port is None:
-            print("[Port] port is not initialized")
+            logger.error("port is not initialized")
             return False
 
         if self.port.is_open:
-            print("[Port] port is already open")
+            logger.debug("port %s is already open", self.port.name)
             return True
 
+        # whatever board was selected before, and its status, is unknown after a reopen
+        self.state.invalidate()
+
         try:
-            self.port.open()
-            self.port.timeout = self.read_timeout / 1000  # convert ms to seconds
-            self.port.write_timeout = self.write_timeout / 1000  # convert ms to seconds
+            # set before opening, so devices without modem lines (ptys) don't fail the open
             self.port.rts = True  # enable RTS (Request to Send)
             self.port.dtr = True  # enable DTR (Data Terminal Ready)
+            self.port.open()
             time.sleep(self.open_pause / 1000)  # convert ms to seconds
-            print(f"[Port] port {self.port.name} opened successfully")
-        except serial.SerialException as e:
-            print(f"[Port] error opening port: {e}")
+            logger.info("port %s opened successfully", self.port.name)
+        except serial_backend().SerialException as e:
+            logger.error("error opening port %s: %s", self.port.name, e)
             return False
 
         if self.reset_port_buffers(True):
@@ -55,74 +91,210 @@ class Port:
 
     def close(self):
         if self.port is None or not self.port.is_open:
-            print("[Port] port is not open")
+            logger.debug("close: port is not open")
             return False
 
+        self.state.invalidate()
+
         try:
-            self.port.rts = True
-            self.port.dtr = False
-            self.port.close()
-            print(f"[Port] port {self.port.name} closed successfully")
-        except serial.SerialException as e:
-            print(f"[Port] error closing port: {e}")
+            try:
+                self.port.rts = True
+                self.port.dtr = False
+            finally:
+                self.port.close()
+            logger.info("port %s closed successfully", self.port.name)
+        except (serial_backend().SerialException, OSError) as e:
+            logger.error("error closing port %s: %s", self.port.name, e)
             return False
 
         return True
 
     def reset_port_buffers(self, reset_out: bool = False) -> bool:
         if self.port is None or not self.port.is_open:
-            print("[Port] port is not open")
+            logger.debug("reset_port_buffers: port is not open")
             return False
 
         # clear input and output buffers
         self.port.reset_input_buffer()
         if reset_out:
             self.port.reset_output_buffer()
-        print("[Port] port buffers reset")
         return True
 
-    def read_inner(self, response: PortResponse, read_timeout: int = 5000) -> bytes:
-        # read until validate_response passes, timeout in ms
-        self.port.timeout = read_timeout / 1000  # convert ms to seconds
-        data = b""
+    def read_inner(self, read_timeout: int = 5000) -> PortResponse:
+        # read until the framer has a complete response or the deadline expires, timeout in ms
+        deadline = time.perf_counter() + read_timeout / 1000  # convert ms to seconds
+        slack = self.read_deadline_slack / 1000  # convert ms to seconds
+        armed = None
+        framer = self.framer
+        framer.reset()
+
         while True:
-            data += self.port.read(1)
-            if self.validate_response(data):
-                response.raw_response = data
-                response.response = data.decode()
-                response.response_valid = True
-                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return framer.timeout()
+
+            # re-arming the serial timeout reconfigures the device, so only do it once a blocking read could overrun the deadline
+            if armed is None or armed > remaining + slack:
+                armed = remaining
+                self.port.timeout = armed
+
+            # block for the first byte, then drain whatever else has already arrived in one call
+            chunk = self.port.read(max(1, self.port.in_waiting))
+            if not chunk:
+                continue
 
-    def on_send_recv(self, command: bytes, read_timeout: int = 5000) -> PortResponse:
+            response = framer.feed(chunk)
+            if response is not None:
+                return response
+
+    def on_send_recv(self, frame: bytes, read_timeout: int = 5000) -> PortResponse:
         response = PortResponse()
 
-        # first we write the command selector
+        # only wait out whatever part of the inter-frame gap has not already passed since the last response
+        if self.frame_gap > 0:
+            wait = self.frame_gap / 1000 - (time.perf_counter() - self.last_frame_time)  # convert ms to seconds
+            if wait > 0:
+                time.sleep(wait)
+
+        # the frame already carries its terminator, so it goes out in a single write
         try:
-            self.port.write(command)
-            if self.write_terminator != None:
-                self.port.write(self.write_terminator)
-            # wait for write_pause
-            time.sleep(self.write_pause / 1000)  # convert ms to seconds
+            self.port.write(frame)
         except Exception as e:
-            print(f"[Port] error sending command: {e}")
+            logger.error("error sending command: %s", e)
             response.error = ErrorCode.COMMUNICATION_ERROR
             return response
 
-        self.read_inner(response, read_timeout)
-        print(f"[Port] command response: {response.response}")
+        response = self.read_inner(read_timeout)
+        self.last_frame_time = time.perf_counter()
 
         return response
 
-    def send_recv(self, data: str, read_timeout: int = 5000) -> PortResponse:
+    def send_frame(self, frame: bytes, read_timeout: int = 5000) -> PortResponse:
+        """
+        Sends a pre-encoded, terminated frame and reads the response.
+        """
         self.reset_port_buffers()
         if not self.port.is_open:
-            print("[Port] send/recv: port is not open")
+            logger.warning("send/recv: port is not open")
             response = PortResponse()
             response.error = ErrorCode.COMMUNICATION_ERROR
             return response
 
-        response = self.on_send_recv(data.encode(), read_timeout)
-        print(f"[Port] Read {('ok' if not response.comm_error else 'timed out')}, bytes {len(response.response)}")
-        print(response.response)
+        response = self.on_send_recv(frame, read_timeout)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("sent %r, read %s: %r", frame, "ok" if response.success else response.error.name.lower(), response.raw_response)
 
         return response
+
+    def read_responses(self, count: int, read_timeout: int = 5000) -> list[PortResponse]:
+        # read up to count responses off the line, allowing read_timeout ms for each, stopping at the first timeout
+        slack = self.read_deadline_slack / 1000  # convert ms to seconds
+        framer = self.framer
+        framer.reset()
+        responses = []
+
+        while len(responses) < count:
+            deadline = time.perf_counter() + read_timeout / 1000  # convert ms to seconds
+            armed = None
+            while True:
+                response = framer.next_response()
+                if response is not None:
+                    break
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    response = framer.timeout()
+                    break
+
+                if armed is None or armed > remaining + slack:
+                    armed = remaining
+                    self.port.timeout = armed
+                framer.extend(self.port.read(max(1, self.port.in_waiting)))
+
+            responses.append(response)
+            if not response.success:
+                break
+
+        return responses
+
+    def send_frames(self, frames: tuple[bytes, ...], read_timeout: int = 5000) -> list[PortResponse]:
+        """
+        Writes several frames in one go and reads one response per frame, stopping at the first timeout.
+        """
+        self.reset_port_buffers()
+        response = PortResponse()
+        if not self.port.is_open:
+            logger.warning("send/recv: port is not open")
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return [response]
+
+        if self.frame_gap > 0:
+            wait = self.frame_gap / 1000 - (time.perf_counter() - self.last_frame_time)  # convert ms to seconds
+            if wait > 0:
+                time.sleep(wait)
+
+        try:
+            self.port.write(b"".join(frames))
+        except Exception as e:
+            logger.error("error sending commands: %s", e)
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return [response]
+
+        responses = self.read_responses(len(frames), read_timeout)
+        self.last_frame_time = time.perf_counter()
+        logger.debug("pipelined %d frames, %d responses", len(frames), len(responses))
+
+        return responses
+
+    def send_recv(self, data: str, read_timeout: int = 5000) -> PortResponse:
+        return self.send_frame(data.encode() + self.write_terminator, read_timeout)
+
+    def pause(self, duration: float, token: CancellationToken = None):
+        """
+        Waits between an operation's frames, duration in ms, returning early once token is cancelled.
+        Schedulers replace this to use the idle line.
+        """
+        if token is None:
+            time.sleep(duration / 1000)  # convert ms to seconds
+        else:
+            token.wait(duration / 1000)
+
+    def run(self, operation: Operation) -> Any:
+        """
+        Drives a protocol operation to completion over this port, returning its result.
+        """
+        metrics = self.metrics
+        try:
+            action = next(operation)
+            while True:
+                action_type = type(action)
+                if action_type is Transmit:
+                    start = time.perf_counter()
+                    result = self.send_frame(action.frame, action.read_timeout)
+                    metrics.record_frames(
+                        action.address,
+                        (time.perf_counter() - start) * 1000,
+                        1,
+                        len(action.frame),
+                        len(result.raw_response or b""),
+                        action.frame == STATUS_FRAME,
+                        result.error,
+                    )
+                elif action_type is TransmitBatch:
+                    start = time.perf_counter()
+                    result = self.send_frames(action.frames, action.read_timeout)
+                    metrics.record_frames(
+                        action.address,
+                        (time.perf_counter() - start) * 1000,
+                        len(action.frames),
+                        sum(len(frame) for frame in action.frames),
+                        sum(len(response.raw_response or b"") for response in result),
+                        sum(frame == STATUS_FRAME for frame in action.frames),
+                        next((response.error for response in result if response.error is not None), None),
+                    )
+                else:
+                    self.pause(action.duration, action.token)
+                    result = None
+                action = operation.send(result)
+        except StopIteration as e:
+            return e.value
@@ -0,0 +1,582 @@
+"""
+Transport-free core of the FME serial protocol.
+
+Operations are generators: they yield actions (Transmit a frame, Pause for a while) and receive the
+transport's result for each Transmit, finally returning their response. Port, AsyncPort or a simulator
+drive them, so framing, selector sequencing, status polling and reset-on-timeout live in one place.
+A driver owns the line while an operation runs, except during a Pause, when other operations may use it.
+"""
+
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, Generator, Iterable
+
+from pyhal.Common import AddressSelector, CommandResponse, ErrorCode, PortResponse, encode_frame
+from pyhal.OutputState import OutputState
+from pyhal.StatusCache import StatusCache, StatusCondition
+
+if TYPE_CHECKING:
+    from pyhal.Cancellation import CancellationToken
+    from pyhal.CommandType import CommandTypeBase
+    from pyhal.CompletionModel import CompletionModel
+
+RESPONSE_TERMINATORS = (b"OK", b"ERR")
+# a terminator split across two reads can start at most this many bytes before the new data
+RESPONSE_TERMINATOR_OVERLAP = max(len(terminator) for terminator in RESPONSE_TERMINATORS) - 1
+
+# the status poll is sent to whichever board a command is waiting on
+STATUS_FRAME = encode_frame("S")
+# sent to the serial board, resets every board
+RESET_FRAME = encode_frame("X")
+
+SELECTOR_TIMEOUT = 5000
+
+# how long a move may take when neither the call nor the command table gives it an operation_timeout
+DEFAULT_OPERATION_TIMEOUT = 30000
+
+logger = logging.getLogger(__name__)
+
+
+def validate_response(response: bytes, start: int = 0) -> bool:
+    """
+    Checks whether the response contains a terminator ("OK" or "ERR").
+    Only the bytes from start onwards are scanned, backing up far enough to catch a terminator split across reads.
+    """
+    start = max(0, start - RESPONSE_TERMINATOR_OVERLAP)
+    return any(response.find(terminator, start) != -1 for terminator in RESPONSE_TERMINATORS)
+
+
+def find_response_end(response: bytes, start: int = 0) -> int:
+    """
+    Returns the index just past the first terminator found from start onwards, or -1.
+    """
+    start = max(0, start - RESPONSE_TERMINATOR_OVERLAP)
+    end = -1
+    for terminator in RESPONSE_TERMINATORS:
+        index = response.find(terminator, start)
+        if index != -1 and (end == -1 or index + len(terminator) < end):
+            end = index + len(terminator)
+    return end
+
+
+class ResponseFramer:
+    """
+    Accumulates received bytes into a reusable buffer until they form a complete response.
+    """
+
+    validate: Callable[[bytearray, int], bool]
+
+    def __init__(self, validate: Callable[[bytearray, int], bool] = validate_response):
+        self.validate = validate
+        self.buffer = bytearray()
+        self.scanned = 0
+
+    def reset(self):
+        del self.buffer[:]
+        self.scanned = 0
+
+    def extend(self, data: bytes):
+        """
+        Adds received bytes without checking them, for use with next_response.
+        """
+        self.buffer += data
+
+    def next_response(self) -> PortResponse:
+        """
+        Splits the first complete response off the buffer, leaving later ones queued; None if there is none yet.
+        Used for pipelined frames, where several responses can arrive in one read.
+        """
+        end = find_response_end(self.buffer, self.scanned)
+        if end == -1:
+            self.scanned = len(self.buffer)
+            return None
+
+        response = PortResponse()
+        response.raw_response = bytes(self.buffer[:end])
+        response.response = response.raw_response.decode(errors="replace")
+        response.response_valid = True
+        del self.buffer[:end]
+        self.scanned = 0
+        return response
+
+    def feed(self, data: bytes) -> PortResponse:
+        """
+        Adds received bytes, returning the response once a terminator has arrived, otherwise None.
+        """
+        start = len(self.buffer)
+        self.buffer += data
+        # only the newly arrived bytes need to be scanned for the terminator
+        if not self.validate(self.buffer, start):
+            return None
+
+        response = PortResponse()
+        response.raw_response = bytes(self.buffer)
+        response.response = response.raw_response.decode(errors="replace")
+        response.response_valid = True
+        return response
+
+    def timeout(self) -> PortResponse:
+        """
+        Returns whatever partial data arrived, flagged as timed out.
+        """
+        response = PortResponse()
+        response.raw_response = bytes(self.buffer)
+        response.response = response.raw_response.decode(errors="replace")
+        response.error = ErrorCode.TIMEOUT
+        return response
+
+
+class Transmit:
+    """
+    Action: write the frame to the board at address and send back the PortResponse read within read_timeout ms.
+    """
+
+    __slots__ = ("frame", "read_timeout", "address")
+
+    def __init__(self, frame: bytes, read_timeout: int, address: AddressSelector = None):
+        self.frame = frame
+        self.read_timeout = read_timeout
+        self.address = address
+
+
+class TransmitBatch:
+    """
+    Action: write the frames back to back in one go and send back the list of PortResponses read,
+    allowing read_timeout ms per response. The list stops early at the first response that timed out.
+    """
+
+    __slots__ = ("frames", "read_timeout", "address")
+
+    def __init__(self, frames: tuple[bytes, ...], read_timeout: int, address: AddressSelector = None):
+        self.frames = frames
+        self.read_timeout = read_timeout
+        self.address = address
+
+
+class Pause:
+    """
+    Action: wait for duration ms before resuming the operation, returning early once token (if any) is cancelled.
+    """
+
+    __slots__ = ("duration", "token")
+
+    def __init__(self, duration: float, token: "CancellationToken" = None):
+        self.duration = duration
+        self.token = token
+
+
+Operation = Generator["Transmit | TransmitBatch | Pause", object, object]
+
+
+class ProtocolState:
+    """
+    Everything the protocol remembers about the line between operations.
+    """
+
+    selected_address: AddressSelector = None
+    selector_skips: int = 0
+    # ms to wait for a selector or status response
+    selector_timeout: int = SELECTOR_TIMEOUT
+    status_cache: StatusCache
+    outputs: OutputState
+    clock: Callable[[], float]
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.status_cache = StatusCache(clock)
+        self.outputs = OutputState()
+
+    def invalidate_selection(self):
+        """
+        Forgets the selected board so the next command sends its selector again.
+        """
+        self.selected_address = None
+
+    def invalidate(self):
+        """
+        Forgets the selection, every cached status and the known output states, e.g. after a reopen or reset.
+        """
+        self.invalidate_selection()
+        self.status_cache.invalidate()
+        self.outputs.invalidate()
+
+
+def move_timeout(command: "CommandTypeBase") -> int:
+    """
+    The command's operation timeout in ms, DEFAULT_OPERATION_TIMEOUT where the table leaves it at 0.
+    """
+    return command.operation_timeout or DEFAULT_OPERATION_TIMEOUT
+
+
+def select(state: ProtocolState, address: AddressSelector) -> Operation:
+    """
+    Selects the board unless it already is, returning an error response on failure and None otherwise.
+    """
+    if address == state.selected_address:
+        state.selector_skips += 1
+        return None
+
+    r = yield Transmit(address.frame, state.selector_timeout, address)
+    if not r.success:
+        logger.warning("selector %s failed with error: %s", address.name, r.error.name)
+        state.invalidate_selection()
+        response = CommandResponse()
+        response.error = ErrorCode.COMMUNICATION_ERROR
+        return response
+
+    state.selected_address = address if b"ERR" not in r.raw_response else None
+    return None
+
+
+def exchange(state: ProtocolState, address: AddressSelector, frame: bytes, read_timeout: int) -> Operation:
+    """
+    Selects the board, unless it already is, and sends one frame.
+    """
+    error = yield from select(state, address)
+    if error is not None:
+        return error
+
+    r = yield Transmit(frame, read_timeout, address)
+    # after a failed exchange we can no longer be sure which board is listening
+    if not r.success or b"ERR" in r.raw_response:
+        state.invalidate_selection()
+    if not r.success:
+        logger.warning("command %r to %s failed with error: %s", frame, address.name, r.error.name)
+        response = CommandResponse()
+        response.error = ErrorCode.COMMUNICATION_ERROR
+        return response
+
+    return r
+
+
+def pipeline(state: ProtocolState, address: AddressSelector, frames: list[bytes], read_timeout: int) -> Operation:
+    """
+    Selects the board once and writes all frames in one go, returning one response per frame.
+    Frames without a (successful) response are reported as communication errors.
+    """
+    error = yield from select(state, address)
+    if error is not None:
+        return [error] * len(frames)
+
+    received = yield TransmitBatch(tuple(frames), read_timeout, address)
+    state.status_cache.invalidate(address)
+
+    responses = []
+    for i in range(len(frames)):
+        r = received[i] if i < len(received) else None
+        if r is None or not r.success:
+            response = CommandResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            responses.append(response)
+        else:
+            responses.append(r)
+
+    # after a failed exchange we can no longer be sure which board is listening
+    if len(received) < len(frames) or any(not r.success or b"ERR" in r.raw_response for r in received):
+        state.invalidate_selection()
+
+    return responses
+
+
+def read_status(state: ProtocolState, address: AddressSelector, max_age: int = None) -> Operation:
+    """
+    Reads the status word of a board, reusing a cached one younger than max_age ms.
+    """
+    response = state.status_cache.get(address, max_age)
+    if response is not None:
+        return response
+
+    response = yield from exchange(state, address, STATUS_FRAME, state.selector_timeout)
+    if response.success:
+        # parse the word once here, every condition checked against the cached response shares it
+        response.status_word(address)
+        state.status_cache.put(address, response)
+
+    return response
+
+
+def wait_for_status(
+    state: ProtocolState,
+    conditions: Iterable[StatusCondition],
+    match_all: bool = False,
+    operation_timeout: int = None,
+    wait_pause_time: int = 50,
+    schedule: Callable[[float], float] = None,
+    start: float = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+) -> Operation:
+    """
+    Polls the boards behind the conditions until any (or all, with match_all) of them hold.
+    Each board is polled at most once per iteration no matter how many conditions refer to it.
+    operation_timeout (ms) defaults to DEFAULT_OPERATION_TIMEOUT.
+    schedule maps the elapsed ms since start (state.clock, defaults to now) to the pause before the next poll.
+    Waiting stops with CANCELLED as soon as token is cancelled, and with TIMEOUT at the deadline (state.clock time).
+    Returns the error code (None on success) and the conditions that held on the last poll.
+    """
+    conditions = list(conditions)
+    addresses = list(dict.fromkeys(condition.address for condition in conditions))
+    start = state.clock() if start is None else start
+    operation_timeout = DEFAULT_OPERATION_TIMEOUT if operation_timeout is None else operation_timeout
+    matched = []
+
+    while True:
+        pause = wait_pause_time if schedule is None else schedule((state.clock() - start) * 1000)
+        if deadline is not None:
+            pause = max(0.0, min(pause, (deadline - state.clock()) * 1000))
+        yield Pause(pause, token)
+        if token is not None and token.cancelled:
+            return ErrorCode.CANCELLED, matched
+
+        statuses = {}
+        for address in addresses:
+            response = yield from read_status(state, address, max_age=min(pause, wait_pause_time))
+            if response.comm_error:
+                logger.warning("communication error polling %s", address.name)
+                return ErrorCode.COMMUNICATION_ERROR, []
+            statuses[address] = response
+
+        matched = [condition for condition in conditions if condition.matches(statuses[condition.address])]
+        if (len(matched) == len(conditions)) if match_all else matched:
+            return None, matched
+
+        # check if we have passed operation timeout
+        now = state.clock()
+        if (now - start) * 1000 > operation_timeout or (deadline is not None and now >= deadline):
+            return ErrorCode.TIMEOUT, matched
+
+
+def wait_for_command(
+    state: ProtocolState,
+    command: "CommandTypeBase",
+    operation_timeout: int = None,
+    completion_model: "CompletionModel" = None,
+    start: float = None,
+    wait_pause_time: int = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+) -> Operation:
+    """
+    Waits for the command's status bit to clear, scheduling polls from the completion model when it has data.
+    operation_timeout defaults to the command's move_timeout, wait_pause_time to the command's own.
+    A move that times out is recorded in the completion model as lasting at least that long, a cancelled one
+    (e.g. halted) is not recorded.
+    """
+    start = state.clock() if start is None else start
+    operation_timeout = move_timeout(command) if operation_timeout is None else operation_timeout
+    wait_pause_time = command.wait_pause_time if wait_pause_time is None else wait_pause_time
+    schedule = None
+    if completion_model is not None:
+        operation_timeout = completion_model.timeout(command.name, operation_timeout)
+        schedule = completion_model.schedule(command.name, wait_pause_time)
+
+    error_code, _ = yield from wait_for_status(
+        state,
+        [command.status_condition],
+        operation_timeout=operation_timeout,
+        wait_pause_time=wait_pause_time,
+        schedule=schedule,
+        start=start,
+        token=token,
+        deadline=deadline,
+    )
+    if completion_model is not None and error_code is None:
+        completion_model.record(command.name, (state.clock() - start) * 1000)
+    elif completion_model is not None and error_code == ErrorCode.TIMEOUT:
+        completion_model.record_timeout(command.name, (state.clock() - start) * 1000)
+
+    return error_code
+
+
+def reset(state: ProtocolState, command: "CommandTypeBase") -> Operation:
+    """
+    Sends the command's reset frames (e.g. "K4" then "P1") to stop a move, keeping track of any output they switch.
+    """
+    for frame in command.reset_frames:
+        response = yield from exchange(state, command.address, frame, command.command_wait)
+        state.outputs.update_frame(command.address, frame, response)
+
+
+def resets_boards(command: "CommandTypeBase") -> bool:
+    return command.address == AddressSelector.SERIAL and command.frame == RESET_FRAME
+
+
+def reset_all(state: ProtocolState, commands: Iterable["CommandTypeBase"]) -> Operation:
+    """
+    Resets every one of the commands, e.g. the moves an abandoned operation left running.
+    """
+    for command in list(commands):
+        yield from reset(state, command)
+
+
+def execute(
+    state: ProtocolState,
+    command: "CommandTypeBase",
+    *args,
+    wait: bool = True,
+    operation_timeout: int = None,
+    completion_model: "CompletionModel" = None,
+    force: bool = False,
+    wait_pause_time: int = None,
+    read_timeout: int = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+) -> Operation:
+    """
+    Sends the command and, if it has a status bit, waits for it to clear, resetting the move on timeout.
+    An output command that would leave its output as it is gets the response that set it instead, unless force is set.
+    operation_timeout, wait_pause_time and read_timeout (ms) override the command's own for this call only.
+    Cancelling token stops the wait within one poll interval and resets the move, finishing with CANCELLED;
+    the deadline (state.clock time) does the same, finishing with TIMEOUT.
+    """
+    if token is not None and token.cancelled:
+        response = CommandResponse()
+        response.error = ErrorCode.CANCELLED
+        return response
+    if deadline is not None and state.clock() >= deadline:
+        response = CommandResponse()
+        response.error = ErrorCode.TIMEOUT
+        return response
+
+    frame = command.encode(*args)
+    if not force:
+        response = state.outputs.get(command, frame)
+        if response is not None:
+            logger.debug("%s skipped, output already in that state", command.name)
+            return response
+
+    start = state.clock()
+    response = yield from exchange(state, command.address, frame, command.command_wait if read_timeout is None else read_timeout)
+    state.outputs.update(command, frame, response)
+
+    # any status read before the command was sent no longer describes the board
+    state.status_cache.invalidate(command.address)
+
+    if response.comm_error or command.status_bit is None or not wait:
+        return response
+
+    response.error = yield from wait_for_command(state, command, operation_timeout, completion_model, start, wait_pause_time, token, deadline)
+    if response.error in (ErrorCode.TIMEOUT, ErrorCode.CANCELLED):
+        logger.warning("%s %s, sending its reset command", command.name, "timed out" if response.timeout else "cancelled")
+        yield from reset(state, command)
+    elif response.comm_error:
+        state.outputs.invalidate()
+
+    return response
+
+
+def wait_for_commands(
+    state: ProtocolState,
+    commands: Iterable["CommandTypeBase"],
+    operation_timeout: int = None,
+    token: "CancellationToken" = None,
+    deadline: float = None,
+) -> Operation:
+    """
+    Waits for several already started commands to finish together, resetting the ones still running on timeout
+    or cancellation. operation_timeout defaults to the longest move_timeout of the commands.
+    """
+    pending = {command.status_condition: command for command in commands if command.status_bit is not None}
+    if not pending:
+        return None
+
+    if operation_timeout is None:
+        operation_timeout = max(move_timeout(command) for command in pending.values())
+    wait_pause_time = min(command.wait_pause_time for command in pending.values())
+
+    error_code, matched = yield from wait_for_status(state, list(pending), True, operation_timeout, wait_pause_time, token=token, deadline=deadline)
+    if error_code in (ErrorCode.TIMEOUT, ErrorCode.CANCELLED):
+        for condition, command in pending.items():
+            if condition not in matched:
+                yield from reset(state, command)
+
+    return error_code
+
+
+def execute_batch(
+    state: ProtocolState,
+    commands: list[tuple["CommandTypeBase", tuple]],
+    pipelined: bool = True,
+    completion_model: "CompletionModel" = None,
+    force: bool = False,
+    token: "CancellationToken" = None,
+    operation_timeout: int = None,
+    wait_pause_time: int = None,
+    read_timeout: int = None,
+    deadline: float = None,
+    running: list["CommandTypeBase"] = None,
+) -> Operation:
+    """
+    Executes (command, args) pairs grouped by board, selecting each board once. Runs of commands without a
+    status bit are pipelined; status-bit commands are executed and waited for in between, as is RESET, after
+    which every board has to be selected again.
+    Output commands that would not change anything are skipped unless force is set.
+    operation_timeout, wait_pause_time and read_timeout (ms) override every command's own, as in execute.
+    Once token is cancelled the running move is reset and the commands not yet sent are CANCELLED; past the
+    deadline (state.clock time) they are TIMEOUT.
+    running, if given, holds the move under way, so a caller abandoning the operation can reset it.
+    Returns one response per command, in the order given.
+    """
+    groups: dict[AddressSelector, list[int]] = {}
+    for i, (command, _) in enumerate(commands):
+        groups.setdefault(command.address, []).append(i)
+
+    responses = [None] * len(commands)
+    # an output already switched earlier in the batch has no known state until the batch has run
+    switched = set()
+    for address, indices in groups.items():
+        run = []
+        for i in indices + [None]:
+            command = None if i is None else commands[i][0]
+            if command is not None and not force and command.output_channel not in switched:
+                responses[i] = state.outputs.get(command, command.encode(*commands[i][1]))
+                if responses[i] is not None:
+                    continue
+            if command is not None and command.output_channel is not None:
+                switched.add(command.output_channel)
+
+            if command is not None and pipelined and command.status_bit is None and not resets_boards(command):
+                run.append(i)
+                continue
+
+            # the output states were checked as the commands were queued, hence force below
+            expired = ErrorCode.CANCELLED if token is not None and token.cancelled else None
+            if deadline is not None and state.clock() >= deadline:
+                expired = expired or ErrorCode.TIMEOUT
+            if len(run) > 1 and expired is not None:
+                for j in run:
+                    responses[j] = CommandResponse()
+                    responses[j].error = expired
+            elif len(run) > 1:
+                frames = [commands[j][0].encode(*commands[j][1]) for j in run]
+                timeout = max(commands[j][0].command_wait for j in run) if read_timeout is None else read_timeout
+                for j, frame, response in zip(run, frames, (yield from pipeline(state, address, frames, timeout))):
+                    state.outputs.update(commands[j][0], frame, response)
+                    responses[j] = response
+            elif run:
+                responses[run[0]] = yield from execute(
+                    state, commands[run[0]][0], *commands[run[0]][1], force=True, read_timeout=read_timeout, token=token, deadline=deadline
+                )
+            run = []
+
+            if command is not None:
+                if running is not None and command.status_bit is not None:
+                    running.append(command)
+                responses[i] = yield from execute(
+                    state,
+                    command,
+                    *commands[i][1],
+                    operation_timeout=operation_timeout,
+                    completion_model=completion_model,
+                    force=True,
+                    wait_pause_time=wait_pause_time,
+                    read_timeout=read_timeout,
+                    token=token,
+                    deadline=deadline,
+                )
+                if running is not None:
+                    running.clear()
+                if resets_boards(command):
+                    state.invalidate()
+
+    return responses
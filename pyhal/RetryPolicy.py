@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+
+from pyhal.Common import AddressSelector, ErrorCode, PortResponse
+
+
+class RetryPolicy:
+    """
+    When and how soon to retry a failed command: up to retries more attempts, for the error codes in retry_on,
+    waiting an exponentially growing delay (ms) with +/- jitter (a fraction of the delay) in between.
+    """
+
+    __slots__ = ("retries", "retry_on", "backoff_initial", "backoff_max", "backoff_multiplier", "jitter", "random")
+
+    def __init__(
+        self,
+        retries: int = 2,
+        retry_on: frozenset = frozenset({ErrorCode.TIMEOUT}),
+        backoff_initial: int = 250,
+        backoff_max: int = 5000,
+        backoff_multiplier: float = 2.0,
+        jitter: float = 0.2,
+    ):
+        self.retries = retries
+        self.retry_on = frozenset(retry_on)
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.backoff_multiplier = backoff_multiplier
+        self.jitter = jitter
+        self.random = random.Random()
+
+    def should_retry(self, attempt: int, response: PortResponse) -> bool:
+        """
+        Whether to try again after attempt (0 for the first) ended with response.
+        """
+        return attempt < self.retries and response.error in self.retry_on
+
+    def delay(self, attempt: int) -> float:
+        """
+        The pause in ms before the attempt after attempt (0 for the first).
+        """
+        delay = min(self.backoff_max, self.backoff_initial * self.backoff_multiplier**attempt)
+        if self.jitter:
+            delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+
+# a single attempt, the default when a call gives no policy
+NO_RETRY = RetryPolicy(retries=0)
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive communication failures per board. After failure_threshold of them the board's circuit opens
+    and commands to it fail fast for reset_timeout ms; the next command after that is let through as a trial,
+    closing the circuit again if it gets through.
+    """
+
+    failure_threshold: int = 3
+    reset_timeout: int = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures: dict[AddressSelector, int] = {}
+        self.opened: dict[AddressSelector, float] = {}
+
+    def is_open(self, address: AddressSelector) -> bool:
+        return address in self.opened
+
+    def allow(self, address: AddressSelector) -> bool:
+        """
+        Returns False while the board's circuit is open.
+        """
+        with self.lock:
+            opened = self.opened.get(address)
+            if opened is None:
+                return True
+
+            if time.monotonic() - opened < self.reset_timeout / 1000:  # convert ms to seconds
+                return False
+
+            # half open: let one trial through, any failure re-opens the circuit straight away
+            self.failures[address] = self.failure_threshold - 1
+            del self.opened[address]
+            return True
+
+    def record(self, address: AddressSelector, response: PortResponse):
+        with self.lock:
+            if not response.comm_error:
+                self.failures.pop(address, None)
+                return
+
+            failures = self.failures.get(address, 0) + 1
+            self.failures[address] = failures
+            if failures >= self.failure_threshold:
+                self.opened[address] = time.monotonic()
+
+    def reset(self, address: AddressSelector = None):
+        with self.lock:
+            if address is None:
+                self.failures.clear()
+                self.opened.clear()
+            else:
+                self.failures.pop(address, None)
+                self.opened.pop(address, None)
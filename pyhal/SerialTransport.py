@@ -0,0 +1,102 @@
+import time
+import urllib.parse
+
+from serial.serialutil import PortNotOpenError, SerialBase, SerialException
+
+
+def parse_url(url: str, scheme: str, options: tuple[str, ...]) -> tuple[str, dict[str, str]]:
+    """
+    Splits a scheme://<path>?<option>=<value>&... URL into its path and options, rejecting unknown options.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != scheme:
+        raise SerialException(f"expected a {scheme}:// URL, not {url!r}")
+
+    values = {}
+    for option, value in urllib.parse.parse_qs(parts.query).items():
+        if option not in options:
+            raise SerialException(f"unknown {scheme} option: {option}")
+        values[option] = value[0]
+    return urllib.parse.unquote(parts.netloc + parts.path), values
+
+
+class ScheduledSerial(SerialBase):
+    """
+    Base for in-process pyserial transports (replay://, sim://): subclasses implement write() and queue the
+    bytes the other end sends back with schedule(), which become readable at the given time.perf_counter().
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.ready = bytearray()
+        # (release time, data) not readable yet, in release order
+        self.scheduled: list[tuple[float, bytes]] = []
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        self.ready.clear()
+        self.scheduled.clear()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def _reconfigure_port(self, *args, **kwargs):
+        # nothing to configure, every setting is ignored
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def schedule(self, release: float, data: bytes):
+        self.scheduled.append((release, data))
+
+    def release(self):
+        now = time.perf_counter()
+        while self.scheduled and self.scheduled[0][0] <= now:
+            self.ready += self.scheduled.pop(0)[1]
+
+    @property
+    def in_waiting(self) -> int:
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.release()
+        return len(self.ready)
+
+    def read(self, size: int = 1) -> bytes:
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        deadline = None if self._timeout is None else time.perf_counter() + self._timeout
+        while True:
+            self.release()
+            if len(self.ready) >= size or (self.ready and not self.scheduled):
+                break
+
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                break
+            if not self.scheduled and deadline is None:
+                # nothing more is coming; a blocking read would hang forever on a real line too
+                raise SerialException(f"{self._port}: read without a timeout and nothing left to receive")
+            wake = min(self.scheduled[0][0] if self.scheduled else deadline, deadline if deadline is not None else float("inf"))
+            time.sleep(max(0.0, wake - now))
+
+        data = bytes(self.ready[:size])
+        del self.ready[:size]
+        return data
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.ready.clear()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
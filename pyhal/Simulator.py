@@ -0,0 +1,419 @@
+import argparse
+import logging
+import os
+import random
+import re
+import select
+import threading
+import time
+from typing import Iterable
+
+from serial.serialutil import PortNotOpenError
+
+from pyhal.CommandTable import COMMANDS
+from pyhal.CommandType import CommandType
+from pyhal.Common import COMMAND_TERMINATOR, AddressSelector
+from pyhal.SerialTransport import ScheduledSerial, parse_url
+
+logger = logging.getLogger(__name__)
+
+# how long each move takes by default, in ms
+DEFAULT_DURATIONS = {
+    "GRIPPER_EXTEND": 400,
+    "GRIPPER_RETRACT": 400,
+    "GRIPPER_OPEN": 250,
+    "GRIPPER_CLOSE": 250,
+    "GRIPPER_RENT": 250,
+    "TRACK_OPEN": 600,
+    "TRACK_CLOSE": 600,
+    "ROLLER_TO_POS_1": 300,
+    "ROLLER_TO_POS_2": 300,
+    "ROLLER_TO_POS_3": 300,
+    "ROLLER_TO_POS_4": 300,
+    "ROLLER_TO_POS_5": 300,
+    "ROLLER_TO_POS_6": 300,
+    "VEND_DOOR_OPEN": 800,
+    "VEND_DOOR_CLOSE": 800,
+    "VEND_DOOR_RENT": 800,
+    "QLM_ENGAGE": 1500,
+    "QLM_DISENGAGE": 1500,
+}
+
+VERSIONS = {
+    CommandType.VERSION_SERIAL: "SIM SERIAL 1.0",
+    CommandType.VERSION_PICKER: "SIM PICKER 1.0",
+    CommandType.VERSION_AUX: "SIM AUX 1.0",
+    CommandType.SIDE_TERMINAL_VERSION: "SIM QR 1.0",
+    CommandType.TERMINAL_REVISION: "SIM QR 1.0",
+}
+
+SELECTORS = {address.value: address for address in AddressSelector if not address.is_none}
+OUTPUT_SWITCH = re.compile(r"[OP](\d)")
+
+
+class Move:
+    __slots__ = ("name", "bit", "duration")
+
+    def __init__(self, name: str, bit: int, duration: int):
+        self.name = name
+        self.bit = bit
+        self.duration = duration
+
+
+class SimulatedBoards:
+    """
+    The picker, aux, serial and QR boards' side of the protocol, built from the command table:
+    every known command is answered with OK, anything else with ERR, and a move sets its status bit for its
+    duration (ms, scaled by scale) or, for the move names in stuck, until its reset command is sent.
+    Tests can press the QR button and set input bits while the controller runs.
+    """
+
+    status_length: int = 24
+    input_length: int = 16
+
+    def __init__(self, durations: dict[str, int] = None, stuck: Iterable[str] = (), scale: float = 1.0, clock=time.perf_counter):
+        self.clock = clock
+        self.scale = scale
+        self.stuck = set(stuck)
+        self.lock = threading.Lock()
+        durations = {**DEFAULT_DURATIONS, **(durations or {})}
+
+        self.moves: dict[tuple[AddressSelector, str], Move] = {}
+        self.resets: dict[tuple[AddressSelector, str], list[int]] = {}
+        self.commands: set[tuple[AddressSelector, str]] = set()
+        self.patterns: list[tuple[AddressSelector, re.Pattern]] = []
+        self.versions = {(command.spec.address, command.spec.command): version for command, version in VERSIONS.items()}
+        for spec in COMMANDS:
+            if spec.parameterised:
+                self.patterns.append((spec.address, re.compile(re.escape(spec.prefix) + ".*")))
+                continue
+            resets = spec.reset_command.split(",") if spec.reset_command is not None else []
+            self.commands.add((spec.address, spec.command))
+            self.commands.update((spec.address, reset) for reset in resets)
+            if spec.status_bit is not None:
+                self.moves[(spec.address, spec.command)] = Move(spec.name, spec.status_bit, durations.get(spec.name, 500))
+                # the first reset frame stops the move, any others only tidy up (e.g. "K4,P1")
+                for reset in resets[:1]:
+                    self.resets.setdefault((spec.address, reset), []).append(spec.status_bit)
+
+        self.selected = AddressSelector.NONE
+        # (board, bit) of every move under way and when it finishes
+        self.moving: dict[tuple[AddressSelector, int], float] = {}
+        self.outputs: dict[tuple[AddressSelector, str], bool] = {}
+        self.inputs: dict[AddressSelector, int] = {AddressSelector.PICKER: 0, AddressSelector.AUX: 0}
+        self.button = False
+        self.text = ""
+        self.frames = 0
+        self.errors = 0
+
+    def press_button(self):
+        with self.lock:
+            self.button = True
+
+    def set_input(self, address: AddressSelector, bit: int, value: bool):
+        with self.lock:
+            if value:
+                self.inputs[address] |= 1 << bit
+            else:
+                self.inputs[address] &= ~(1 << bit)
+
+    def status(self, address: AddressSelector) -> int:
+        """
+        The status bits of a board right now.
+        """
+        with self.lock:
+            return self.status_bits(address)
+
+    def status_bits(self, address: AddressSelector) -> int:
+        now = self.clock()
+        bits = 0
+        for (board, bit), end in list(self.moving.items()):
+            if end <= now:
+                del self.moving[(board, bit)]
+            elif board == address:
+                bits |= 1 << bit
+        return bits
+
+    def bit_string(self, bits: int, length: int) -> bytes:
+        return "".join("1" if (bits >> i) & 1 else "0" for i in range(length)).encode()
+
+    def handle(self, frame: str) -> bytes:
+        """
+        Returns the response to one frame (without its terminator), OK or ERR included.
+        """
+        with self.lock:
+            self.frames += 1
+            response = self.respond(frame)
+            if response is None:
+                self.errors += 1
+                return b"ERR"
+            return response + b"OK"
+
+    def respond(self, frame: str) -> bytes:
+        # None for anything the board would reject
+        if frame in SELECTORS:
+            self.selected = SELECTORS[frame]
+            return b""
+
+        address = self.selected
+        if address.is_none or frame.startswith("H"):
+            return None
+
+        if address in (AddressSelector.PICKER, AddressSelector.AUX):
+            if frame == "S":
+                return self.bit_string(self.status_bits(address), self.status_length)
+            if frame == "R":
+                return self.bit_string(self.inputs[address], self.input_length)
+            switch = OUTPUT_SWITCH.fullmatch(frame)
+            if switch is not None:
+                self.outputs[(address, switch.group(1))] = frame[0] == "O"
+
+        if address == AddressSelector.QR:
+            if frame == "J":
+                return b"1" if self.button else b"0"
+            if frame == "K":
+                self.button = False
+            elif frame.startswith("S"):
+                self.text = frame[1:]
+
+        if address == AddressSelector.SERIAL and frame == CommandType.RESET.spec.command:
+            self.moving.clear()
+            self.outputs.clear()
+            self.button = False
+            self.selected = AddressSelector.NONE
+            return b""
+
+        version = self.versions.get((address, frame))
+        if version is not None:
+            return version.encode()
+
+        for bit in self.resets.get((address, frame), ()):
+            self.moving.pop((address, bit), None)
+
+        move = self.moves.get((address, frame))
+        if move is not None:
+            self.moving[(address, move.bit)] = float("inf") if move.name in self.stuck else self.clock() + move.duration * self.scale / 1000
+            return b""
+
+        if (address, frame) in self.commands or any(board == address and pattern.fullmatch(frame) for board, pattern in self.patterns):
+            return b""
+
+        return None
+
+
+class LineFaults:
+    """
+    What the line adds: latency ms (+/- jitter ms) before each response, the time the bytes take at baudrate
+    (None for none), per byte the probability of it being dropped or replaced by a random one (noise), and the
+    probability of a whole response going missing (lose). Byte faults hit frames and responses alike.
+    """
+
+    __slots__ = ("latency", "jitter", "noise", "drop", "lose", "baudrate", "random")
+
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        noise: float = 0,
+        drop: float = 0,
+        baudrate: int = None,
+        seed: int = None,
+        lose: float = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.drop = drop
+        self.lose = lose
+        self.baudrate = baudrate
+        self.random = random.Random(seed)
+
+    def delay(self, sent: int, received: int) -> float:
+        """
+        Seconds from writing sent bytes until the last of received response bytes has arrived.
+        """
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if self.baudrate:
+            # 10 bits per byte on the wire at 8N1
+            delay += (sent + received) * 10 * 1000 / self.baudrate
+        return max(0.0, delay) / 1000  # convert ms to seconds
+
+    def corrupt(self, data: bytes) -> bytes:
+        if not self.noise and not self.drop:
+            return data
+
+        out = bytearray()
+        for byte in data:
+            if self.drop and self.random.random() < self.drop:
+                continue
+            if self.noise and self.random.random() < self.noise:
+                byte = self.random.randrange(256)
+            out.append(byte)
+        return bytes(out)
+
+
+class SimulatedLine:
+    """
+    Joins the boards and the line faults: takes the bytes written to the port and returns (delay s, bytes) per response.
+    """
+
+    def __init__(self, boards: SimulatedBoards, faults: LineFaults):
+        self.boards = boards
+        self.faults = faults
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[tuple[float, bytes]]:
+        self.buffer += self.faults.corrupt(data)
+        responses = []
+        while COMMAND_TERMINATOR in self.buffer:
+            end = self.buffer.index(COMMAND_TERMINATOR)
+            frame = bytes(self.buffer[:end])
+            del self.buffer[: end + 1]
+            response = self.boards.handle(frame.decode(errors="replace"))
+            if self.faults.lose and self.faults.random.random() < self.faults.lose:
+                continue
+            responses.append((self.faults.delay(len(frame) + 1, len(response)), self.faults.corrupt(response)))
+        return responses
+
+
+class SimulatedSerial(ScheduledSerial):
+    """
+    In-process pyserial transport talking to SimulatedBoards, through the sim:// URL:
+
+        controller = FMEController(port="sim://?latency=2&stuck=GRIPPER_EXTEND")
+        controller.port.port.boards.press_button()
+
+    Options: latency and jitter (ms), noise and drop (probability per byte), lose (probability per response), stuck (comma separated move names),
+    scale (multiplies every move duration), seed, and wire=0 to leave out the time the bytes take at the baud rate.
+    The boards keep their state across reopens.
+    """
+
+    options = ("latency", "jitter", "noise", "drop", "lose", "stuck", "scale", "seed", "wire")
+
+    def __init__(self, *args, **kwargs):
+        self.boards: SimulatedBoards = None
+        self.line: SimulatedLine = None
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        super().open()
+        if self.line is not None:
+            return
+
+        _, options = parse_url(self._port, "sim", self.options)
+        stuck = [name for name in options.get("stuck", "").split(",") if name]
+        self.boards = SimulatedBoards(stuck=stuck, scale=float(options.get("scale", 1.0)))
+        faults = LineFaults(
+            latency=float(options.get("latency", 0)),
+            jitter=float(options.get("jitter", 0)),
+            noise=float(options.get("noise", 0)),
+            drop=float(options.get("drop", 0)),
+            lose=float(options.get("lose", 0)),
+            baudrate=self._baudrate if options.get("wire", "1") != "0" else None,
+            seed=int(options["seed"]) if "seed" in options else None,
+        )
+        self.line = SimulatedLine(self.boards, faults)
+
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        now = time.perf_counter()
+        for delay, response in self.line.feed(bytes(data)):
+            # responses to pipelined frames come back one after the other
+            release = max(now + delay, self.scheduled[-1][0] if self.scheduled else now)
+            self.schedule(release, response)
+        return len(data)
+
+
+class PtySimulator:
+    """
+    Serves SimulatedBoards on a pseudo terminal, for anything that needs a real device path (POSIX only):
+
+        simulator = PtySimulator(SimulatedBoards(), LineFaults(latency=2, baudrate=9600))
+        controller = FMEController(port=simulator.start())
+    """
+
+    def __init__(self, boards: SimulatedBoards = None, faults: LineFaults = None):
+        self.line = SimulatedLine(boards or SimulatedBoards(), faults or LineFaults())
+        self.master: int = None
+        self.slave: int = None
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+
+    @property
+    def boards(self) -> SimulatedBoards:
+        return self.line.boards
+
+    def start(self) -> str:
+        """
+        Opens the pty and starts answering on it, returning the device path to connect to.
+        """
+        import pty
+        import tty
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="pyhal-simulator", daemon=True)
+        self.thread.start()
+        return os.ttyname(self.slave)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def run(self):
+        pending: list[tuple[float, bytes]] = []
+        while not self.stopping.is_set():
+            now = time.perf_counter()
+            while pending and pending[0][0] <= now:
+                os.write(self.master, pending.pop(0)[1])
+
+            timeout = 0.1 if not pending else max(0.0, pending[0][0] - now)
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+
+            now = time.perf_counter()
+            for delay, response in self.line.feed(data):
+                pending.append((max(now + delay, pending[-1][0] if pending else now), response))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated FME boards on a pseudo terminal")
+    parser.add_argument("--latency", type=float, default=2, help="Response latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Latency jitter in ms")
+    parser.add_argument("--noise", type=float, default=0, help="Probability of a corrupted byte")
+    parser.add_argument("--drop", type=float, default=0, help="Probability of a dropped byte")
+    parser.add_argument("--lose", type=float, default=0, help="Probability of a lost response")
+    parser.add_argument("--baudrate", type=int, default=9600, help="Baud rate the wire time is based on, 0 for none")
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor applied to every move duration")
+    parser.add_argument("--stuck", type=str, default="", help="Comma separated moves that never finish, e.g. GRIPPER_EXTEND")
+    args = parser.parse_args()
+
+    boards = SimulatedBoards(stuck=[name for name in args.stuck.split(",") if name], scale=args.scale)
+    faults = LineFaults(args.latency, args.jitter, args.noise, args.drop, args.baudrate or None, lose=args.lose)
+    simulator = PtySimulator(boards, faults)
+    print(f"[HAL] Simulated boards on {simulator.start()}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import time
+from typing import Callable
+
+from pyhal.Common import AddressSelector, PortResponse
+
+
+class StatusCondition:
+    """
+    A single status bit on a board that is expected to be set or cleared.
+    """
+
+    __slots__ = ("address", "bit", "set", "mask")
+
+    def __init__(self, address: AddressSelector, bit: int, set: bool = False):
+        self.address = address
+        self.bit = bit
+        self.set = set
+        self.mask = 1 << bit
+
+    def matches(self, response: PortResponse) -> bool:
+        return (response.status_word(self.address).bits & self.mask != 0) == self.set
+
+    def __str__(self):
+        return f"{self.address.name} bit {self.bit} {'set' if self.set else 'cleared'}"
+
+
+class StatusCache:
+    """
+    Per-board cache of the last status word, shared by every waiter on the port.
+    """
+
+    freshness: int = 20
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.entries: dict[AddressSelector, tuple[float, PortResponse]] = {}
+        # called with (address, response) for every status word read, e.g. to record telemetry from it
+        self.listeners: list[Callable[[AddressSelector, PortResponse], None]] = []
+
+    def get(self, address: AddressSelector, max_age: int = None) -> PortResponse:
+        """
+        Returns the cached status for the board if it is younger than max_age ms, otherwise None.
+        """
+        entry = self.entries.get(address)
+        if entry is None:
+            return None
+
+        max_age = self.freshness if max_age is None else max_age
+        timestamp, response = entry
+        if (self.clock() - timestamp) * 1000 > max_age:
+            return None
+
+        return response
+
+    def put(self, address: AddressSelector, response: PortResponse):
+        self.entries[address] = (self.clock(), response)
+        for listener in self.listeners:
+            listener(address, response)
+
+    def invalidate(self, address: AddressSelector = None):
+        """
+        Drops the cached status for one board, or for every board when no address is given.
+        """
+        if address is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(address, None)
@@ -0,0 +1,97 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pyhal.Common import AddressSelector
+
+# maps every byte but "1" to "0", so a whole status response turns into binary digits in one pass
+BIT_TABLE = bytes(b"1"[0] if byte == b"1"[0] else b"0"[0] for byte in range(256))
+
+
+class StatusWord:
+    """
+    The status word of a board as an integer bitmask: bit n is set when character n of the response is "1".
+    Parsed once per response; the board's subclass (see define_status_bits) adds a property and a mask constant
+    per status bit in the CommandType table, e.g. word.track_open or word.any(word.TRACK_OPEN | word.TRACK_CLOSE).
+    """
+
+    __slots__ = ("bits",)
+
+    # status bit number by name, filled in per board by define_status_bits
+    BITS: dict[str, int] = {}
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @classmethod
+    def parse(cls, raw_response: bytes) -> "StatusWord":
+        if not raw_response:
+            return cls()
+        # reversed, so that the first character ends up as the least significant bit
+        return cls(int(raw_response.translate(BIT_TABLE)[::-1], 2))
+
+    @classmethod
+    def mask(cls, *bits) -> int:
+        """
+        Combines bit numbers or this board's bit names into a mask for any() and all().
+        """
+        mask = 0
+        for bit in bits:
+            mask |= 1 << (cls.BITS[bit] if isinstance(bit, str) else bit)
+        return mask
+
+    def is_set(self, bit: int) -> bool:
+        return (self.bits >> bit) & 1 == 1
+
+    def any(self, mask: int) -> bool:
+        return self.bits & mask != 0
+
+    def all(self, mask: int) -> bool:
+        return self.bits & mask == mask
+
+    def changed(self, other: "StatusWord") -> int:
+        """
+        The mask of bits that differ from other.
+        """
+        return self.bits ^ other.bits
+
+    def names(self) -> list[str]:
+        """
+        The names of the known status bits that are set.
+        """
+        return [name for name, bit in self.BITS.items() if (self.bits >> bit) & 1]
+
+    def __eq__(self, other):
+        return isinstance(other, StatusWord) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(self.names()) or hex(self.bits)})"
+
+
+# StatusWord subclass per board, see define_status_bits
+STATUS_WORD_TYPES: dict["AddressSelector", type] = {}
+
+
+def status_word_type(address: "AddressSelector" = None) -> type:
+    return STATUS_WORD_TYPES.get(address, StatusWord)
+
+
+def _bit_property(bit: int) -> property:
+    return property(lambda self: (self.bits >> bit) & 1 == 1)
+
+
+def define_status_bits(address: "AddressSelector", bits: dict[str, int]) -> type:
+    """
+    Creates (and registers) the StatusWord subclass for a board with a lower case property and an upper case
+    mask constant per named status bit. A bit is set while the move it is named after is still under way.
+    """
+    namespace = {"__slots__": (), "BITS": dict(bits)}
+    for name, bit in bits.items():
+        namespace[name.lower()] = _bit_property(bit)
+        namespace[name.upper()] = 1 << bit
+
+    word_type = type(f"{address.name.title()}StatusWord", (StatusWord,), namespace)
+    STATUS_WORD_TYPES[address] = word_type
+    return word_type
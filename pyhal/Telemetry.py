@@ -0,0 +1,285 @@
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from pyhal import Protocol
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector, CommandResponse, ErrorCode
+from pyhal.Protocol import STATUS_FRAME
+from pyhal.StatusWord import StatusWord, status_word_type
+
+logger = logging.getLogger(__name__)
+
+# samples keep the low 64 bits of a word, enough for every status and input response the boards send
+SAMPLE_MASK = (1 << 64) - 1
+
+# source command and the interval between its samples in ms
+DEFAULT_SOURCES = {
+    CommandType.STATUS_PICKER: 100,
+    CommandType.STATUS_AUX: 100,
+    CommandType.READ_PICKER_INPUTS: 250,
+    CommandType.AUX_SENSORS_READ: 250,
+}
+
+
+class SampleBuffer:
+    """
+    Fixed-size ring of (timestamp, bitmask) samples kept in two flat arrays, so storing a sample allocates nothing.
+    Timestamps are time.monotonic() values, so they only ever increase even if the wall clock is set back;
+    the oldest sample is overwritten once the ring is full.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("Q", bytes(8 * capacity))
+        # samples written so far; the next one goes to count % capacity
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp: float, bits: int):
+        with self.lock:
+            index = self.count % self.capacity
+            self.times[index] = timestamp
+            self.values[index] = bits & SAMPLE_MASK
+            self.count += 1
+
+    def latest(self) -> tuple[float, int]:
+        """
+        Returns the newest (timestamp, bits), or None before the first sample.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            index = (self.count - 1) % self.capacity
+            return self.times[index], self.values[index]
+
+    def window(self, since: float = None) -> tuple[array, array]:
+        """
+        Returns copies of the timestamps and bitmasks of the samples taken at or after since (all without), oldest first.
+        """
+        with self.lock:
+            if self.count <= self.capacity:
+                times, values = self.times[: self.count], self.values[: self.count]
+            else:
+                split = self.count % self.capacity
+                times = self.times[split:] + self.times[:split]
+                values = self.values[split:] + self.values[:split]
+
+        if since is not None:
+            start = bisect_left(times, since)
+            times, values = times[start:], values[start:]
+        return times, values
+
+    def edges(self, mask: int = SAMPLE_MASK, since: float = None) -> list[tuple[float, int, bool]]:
+        """
+        Returns (timestamp, bit, rose) for every bit in mask that changed between consecutive samples since then.
+        The first sample in the window only serves as the reference.
+        """
+        times, values = self.window(since)
+        edges = []
+        for i in range(1, len(values)):
+            changed = (values[i] ^ values[i - 1]) & mask
+            while changed:
+                low = changed & -changed
+                edges.append((times[i], low.bit_length() - 1, values[i] & low != 0))
+                changed ^= low
+        return edges
+
+
+class TelemetrySource:
+    __slots__ = ("command", "interval", "buffer", "due", "samples", "failures")
+
+    def __init__(self, command: CommandType, interval: int, capacity: int):
+        self.command = command
+        self.interval = interval
+        self.buffer = SampleBuffer(capacity)
+        self.due = 0.0
+        self.samples = 0
+        self.failures = 0
+
+
+class TelemetrySampler:
+    """
+    Samples status and input words in the background into per-source ring buffers, so diagnostics and dashboards
+    read history and latest values without adding traffic to the line:
+
+        sampler = TelemetrySampler(controller)
+        sampler.start()
+        timestamp, word = sampler.latest(CommandType.STATUS_PICKER)
+        sampler.edges(CommandType.STATUS_PICKER, word.TRACK_OPEN, seconds=60)
+
+    Each source is sampled every interval ms at most, and the sampler keeps its share of the line below
+    max_utilisation: after a sample that held the line for t, it stays off for t * (1 - max_utilisation) / max_utilisation.
+    It never queues behind a command: while another caller holds the controller lock it tries again busy_retry ms later.
+    Status words polled by anyone else, e.g. while waiting for a move, are recorded as samples too, so edges during
+    a move are not missed even though the sampler itself stays off the line until the move has finished.
+    """
+
+    max_utilisation: float = 0.2
+    busy_retry: int = 10
+
+    def __init__(self, controller, sources: dict[CommandType, int] = None, capacity: int = 4096):
+        self.controller = controller
+        self.sources: dict[CommandType, TelemetrySource] = {}
+        self.status_sources: dict[AddressSelector, TelemetrySource] = {}
+        for command, interval in (DEFAULT_SOURCES if sources is None else sources).items():
+            self.add_source(command, interval, capacity)
+        self.busy_skips = 0
+        # time.monotonic() before which the sampler leaves the line alone
+        self.idle_until = 0.0
+        self.stopping = threading.Event()
+        self.thread: threading.Thread = None
+
+    def add_source(self, command: CommandType, interval: int, capacity: int = 4096):
+        """
+        Samples command (which has to answer with a bit string, e.g. "S" or "R") every interval ms.
+        """
+        if command.value.command is None or command.value.frame is None:
+            raise ValueError(f"{command.name} cannot be sampled")
+        source = self.sources[command] = TelemetrySource(command, interval, capacity)
+        if command.value.frame == STATUS_FRAME:
+            self.status_sources[command.value.address] = source
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopping.clear()
+        self.controller.port.state.status_cache.listeners.append(self.observe)
+        self.thread = threading.Thread(target=self.run, name="pyhal-telemetry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        self.controller.port.state.status_cache.listeners.remove(self.observe)
+
+    def __enter__(self) -> "TelemetrySampler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def run(self):
+        while self.sources and not self.stopping.is_set():
+            source = min(self.sources.values(), key=lambda s: s.due)
+            now = time.monotonic()
+            pause = max(source.due, self.idle_until) - now
+            if pause > 0:
+                self.stopping.wait(pause)
+                continue
+
+            if not self.controller.lock.acquire(blocking=False):
+                self.busy_skips += 1
+                self.stopping.wait(self.busy_retry / 1000)  # convert ms to seconds
+                continue
+
+            try:
+                start = time.monotonic()
+                response = self.sample(source)
+                held = time.monotonic() - start
+            finally:
+                self.controller.lock.release()
+
+            source.due = start + source.interval / 1000  # convert ms to seconds
+            self.idle_until = start + held + held * (1 - self.max_utilisation) / self.max_utilisation
+            if response.success:
+                # status words were already recorded by observe on their way into the status cache
+                if source.command.value.frame != STATUS_FRAME:
+                    self.record(source, response)
+            else:
+                source.failures += 1
+                logger.debug("telemetry sample of %s failed: %s", source.command.name, response)
+
+    def record(self, source: TelemetrySource, response: CommandResponse):
+        source.samples += 1
+        source.buffer.append(time.monotonic(), response.status_word(source.command.value.address).bits)
+
+    def observe(self, address: AddressSelector, response: CommandResponse):
+        """
+        Status cache listener: records every status word read on the port, whoever polled it.
+        """
+        source = self.status_sources.get(address)
+        if source is not None:
+            self.record(source, response)
+            source.due = time.monotonic() + source.interval / 1000  # convert ms to seconds
+
+    def sample(self, source: TelemetrySource) -> CommandResponse:
+        """
+        Reads one sample; the caller holds the controller lock.
+        """
+        controller = self.controller
+        command = source.command.value
+        if not controller.connection.ensure():
+            response = CommandResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+            return response
+
+        if command.frame == STATUS_FRAME:
+            operation = Protocol.read_status(controller.port.state, command.address, max_age=source.interval)
+        else:
+            operation = Protocol.exchange(controller.port.state, command.address, command.frame, command.command_wait)
+
+        try:
+            response = controller.port.run(operation)
+        except Exception as e:
+            logger.error("error sampling %s: %s", source.command.name, e)
+            controller.port.state.invalidate_selection()
+            controller.port.state.outputs.invalidate()
+            response = CommandResponse()
+            response.error = ErrorCode.COMMUNICATION_ERROR
+
+        controller.connection.report(response)
+        return response
+
+    @staticmethod
+    def wall_clock_offset() -> float:
+        # added to a sample's time.monotonic() gives its time.time()
+        return time.time() - time.monotonic()
+
+    def latest(self, command: CommandType) -> tuple[float, StatusWord]:
+        """
+        Returns the time.time() and word of the newest sample of command, or None before the first one.
+        Status words come as their board's StatusWord subclass, input words as a plain StatusWord.
+        """
+        sample = self.sources[command].buffer.latest()
+        if sample is None:
+            return None
+        word_type = status_word_type(command.value.address) if command.value.frame == STATUS_FRAME else StatusWord
+        return sample[0] + self.wall_clock_offset(), word_type(sample[1])
+
+    def window(self, command: CommandType, seconds: float = None) -> tuple[array, array]:
+        """
+        Returns the time.time() timestamps and bitmasks of the samples of command from the last seconds (all without),
+        oldest first.
+        """
+        since = None if seconds is None else time.monotonic() - seconds
+        times, values = self.sources[command].buffer.window(since)
+        offset = self.wall_clock_offset()
+        return array("d", (timestamp + offset for timestamp in times)), values
+
+    def edges(self, command: CommandType, mask: int = SAMPLE_MASK, seconds: float = None) -> list[tuple[float, int, bool]]:
+        """
+        Returns (time.time(), bit, rose) for every change of a bit in mask over the last seconds (all without).
+        """
+        since = None if seconds is None else time.monotonic() - seconds
+        offset = self.wall_clock_offset()
+        return [(timestamp + offset, bit, rose) for timestamp, bit, rose in self.sources[command].buffer.edges(mask, since)]
+
+    def to_dict(self) -> dict:
+        return {
+            "busy_skips": self.busy_skips,
+            "sources": {
+                command.name: {"interval": source.interval, "samples": source.samples, "failures": source.failures, "stored": len(source.buffer)}
+                for command, source in self.sources.items()
+            },
+        }
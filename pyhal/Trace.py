@@ -0,0 +1,239 @@
+import logging
+import mmap
+import struct
+import threading
+import time
+from typing import Iterator
+
+import serial
+from serial.serialutil import PortNotOpenError, SerialException
+
+from pyhal.CommandTable import decode_frame
+from pyhal.Common import COMMAND_TERMINATOR, AddressSelector
+from pyhal.SerialTransport import ScheduledSerial, parse_url
+
+logger = logging.getLogger(__name__)
+
+# file header: magic, format version, time.time_ns() and time.monotonic_ns() when the trace was started
+TRACE_MAGIC = b"PHTR"
+TRACE_VERSION = 1
+HEADER = struct.Struct("<4sB3xQQ")
+# record header, followed by length bytes of data: time.monotonic_ns(), direction, board, length
+RECORD = struct.Struct("<QBBH")
+
+SENT = 0
+RECEIVED = 1
+
+BOARDS = tuple(AddressSelector)
+BOARD_CODES = {address: code for code, address in enumerate(BOARDS)}
+SELECTOR_FRAMES = {address.frame: address for address in AddressSelector if not address.is_none}
+
+
+class TraceWriter:
+    """
+    Appends records to a binary trace: a header, then per chunk written or read on the port
+    RECORD (monotonic ns, SENT or RECEIVED, board code, length) followed by the bytes themselves.
+    Appending to an existing trace keeps its header; timestamps are only compared between neighbouring records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time.time_ns(), time.monotonic_ns()))
+        self.records = 0
+
+    def write(self, direction: int, address: AddressSelector, data: bytes):
+        # chunks longer than a record can hold are split, the replay joins them up again
+        with self.lock:
+            now = time.monotonic_ns()
+            for start in range(0, len(data), 0xFFFF):
+                chunk = data[start : start + 0xFFFF]
+                self.file.write(RECORD.pack(now, direction, BOARD_CODES[address], len(chunk)))
+                self.file.write(chunk)
+                self.records += 1
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingSerial:
+    """
+    Wraps the serial object of a Port (or AsyncPort), writing everything sent and received to a TraceWriter.
+    Records are tagged with the board of the last selector frame written.
+    """
+
+    def __init__(self, port: serial.Serial, writer: TraceWriter):
+        object.__setattr__(self, "wrapped", port)
+        object.__setattr__(self, "writer", writer)
+        object.__setattr__(self, "address", AddressSelector.NONE)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        # timeout, rts and dtr are set by the port and belong to the wrapped device
+        setattr(self.wrapped, name, value)
+
+    def write(self, data: bytes) -> int:
+        address = SELECTOR_FRAMES.get(bytes(data))
+        if address is not None:
+            object.__setattr__(self, "address", address)
+        self.writer.write(SENT, self.address, bytes(data))
+        return self.wrapped.write(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self.wrapped.read(size)
+        if data:
+            self.writer.write(RECEIVED, self.address, data)
+        return data
+
+
+def record(port, path: str) -> TraceWriter:
+    """
+    Starts recording the traffic of port (a Port or AsyncPort) to the trace at path, appending if it exists.
+    """
+    stop_recording(port)
+    writer = TraceWriter(path)
+    port.port = RecordingSerial(port.port, writer)
+    logger.info("recording %s to %s", port.port.name, path)
+    return writer
+
+
+def stop_recording(port):
+    if isinstance(port.port, RecordingSerial):
+        writer = port.port.writer
+        port.port = port.port.wrapped
+        writer.close()
+
+
+def open_trace(path: str) -> mmap.mmap:
+    with open(path, "rb") as file:
+        trace = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(trace) < HEADER.size:
+        trace.close()
+        raise ValueError(f"{path} is not a trace")
+    magic, version, _, _ = HEADER.unpack_from(trace, 0)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        trace.close()
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace")
+    return trace
+
+
+def read_trace(path: str) -> Iterator[tuple[int, int, AddressSelector, bytes]]:
+    """
+    Yields (monotonic ns, direction, board, data) for every record of the trace at path.
+    """
+    trace = open_trace(path)
+    try:
+        offset = HEADER.size
+        while offset + RECORD.size <= len(trace):
+            timestamp, direction, board, length = RECORD.unpack_from(trace, offset)
+            offset += RECORD.size
+            yield timestamp, direction, BOARDS[board], trace[offset : offset + length]
+            offset += length
+    finally:
+        trace.close()
+
+
+def decode_trace(path: str) -> Iterator[tuple[int, AddressSelector, str, tuple[str, ...]]]:
+    """
+    Yields (monotonic ns, board, frame, command names) for every frame sent in the trace at path; the names are
+    every command the frame could be (several share some wire commands), none for selectors and unknown frames.
+    """
+    for timestamp, direction, address, data in read_trace(path):
+        if direction != SENT:
+            continue
+        for frame in bytes(data).split(COMMAND_TERMINATOR)[:-1]:
+            selector = frame + COMMAND_TERMINATOR in SELECTOR_FRAMES
+            yield timestamp, address, frame.decode(errors="replace"), () if selector else tuple(spec.name for spec in decode_frame(address, frame))
+
+
+class ReplaySerial(ScheduledSerial):
+    """
+    pyserial transport that plays a trace back: every write consumes the next SENT record, and the RECEIVED
+    records after it become readable as they did when recorded, each delay divided by speed, or straight away
+    with speed 0. Use it through the replay:// URL, e.g. FMEController(port="replay:///var/log/kiosk.trace?speed=0").
+    Writes that differ from the recorded frames are counted in mismatches and logged, and playback carries on.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.speed = 1.0
+        self.trace: mmap.mmap = None
+        self.offset = 0
+        self.mismatches = 0
+        self.frames = 0
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        super().open()
+        path, options = parse_url(self._port, "replay", ("speed",))
+        self.speed = float(options.get("speed", 1.0))
+        try:
+            self.trace = open_trace(path)
+        except (OSError, ValueError) as e:
+            self.is_open = False
+            raise SerialException(f"unable to open trace {path}: {e}")
+
+        # a reconnect carries on where the trace was, just like the recorded session did
+        if self.offset == 0:
+            self.offset = HEADER.size
+            # anything the boards sent before the first frame (e.g. a power-on banner) is waiting at once
+            self.schedule_responses(time.perf_counter(), None)
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+        super().close()
+
+    @property
+    def finished(self) -> bool:
+        return self.trace is None or self.offset + RECORD.size > len(self.trace)
+
+    def next_record(self) -> tuple[int, int, bytes]:
+        timestamp, direction, _, length = RECORD.unpack_from(self.trace, self.offset)
+        start = self.offset + RECORD.size
+        return timestamp, direction, self.trace[start : start + length]
+
+    def schedule_responses(self, now: float, sent: int):
+        # queue the RECEIVED records up to the next SENT one, relative to the SENT record at sent ns
+        while not self.finished:
+            timestamp, direction, data = self.next_record()
+            if direction == SENT:
+                return
+            self.offset += RECORD.size + len(data)
+            delay = 0.0 if sent is None or self.speed == 0 else (timestamp - sent) / 1e9 / self.speed
+            self.schedule(now + delay, data)
+
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        data = bytes(data)
+        now = time.perf_counter()
+        # a write recorded in several records (longer than one can hold) is matched against all of them
+        recorded = b""
+        sent = None
+        while len(recorded) < len(data) and not self.finished:
+            timestamp, direction, chunk = self.next_record()
+            if direction != SENT:
+                break
+            sent = timestamp
+            recorded += chunk
+            self.offset += RECORD.size + len(chunk)
+
+        self.frames += 1
+        if recorded != data:
+            self.mismatches += 1
+            logger.warning("replay: sent %r where the trace has %r", data, recorded)
+
+        self.schedule_responses(now, sent)
+        return len(data)
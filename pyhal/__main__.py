@@ -1,9 +1,14 @@
 import argparse
+import json
+import logging
+import sys
 import time
 
 from pyhal.CommandType import CommandType
 from pyhal.Common import TrackState
 from pyhal.FMEController import FMEController
+from pyhal.Fleet import HEALTH_CHECK, Fleet, load_script, parse_target
+from pyhal.Ipc import DEFAULT_SOCKET_PATH, IpcError
 
 
 def call_test_command(controller: FMEController, command_type: CommandType):
@@ -62,23 +67,62 @@ def test(args):
     # call_test_command(controller, CommandType.VERSION_AUX)
     # call_test_command(controller, CommandType.STATUS_PICKER)
     # call_test_command(controller, CommandType.STATUS_AUX)
+    print(controller.metrics.to_json(indent=2))
+
+
+def fleet(args):
+    print(f"[HAL] Running {'script ' + args.script if args.script else 'health check'} on {len(args.fleet)} ports")
+    targets = [parse_target(spec, args.baudrate) for spec in args.fleet]
+    script = load_script(args.script) if args.script else HEALTH_CHECK
+    reports = Fleet(targets, processes=args.processes).run(script, stop_on_error=args.stop_on_error)
+
+    for report in reports:
+        summary = report.summary()
+        latency = summary["latency"]
+        print(
+            f"{report.port:24} {'OK' if report.ok else 'FAILED':6} {summary['commands']:4} commands {summary['failed']:4} failed"
+            f" {report.elapsed:10.1f} ms total {latency['mean'] or 0:8.1f} ms mean {latency['max'] or 0:8.1f} ms max"
+        )
+        if report.error is not None:
+            print(f"    {report.error}")
+        for error, count in summary["errors"].items():
+            print(f"    {error}: {count}")
+    print(json.dumps([report.summary() for report in reports], indent=2))
+    return all(report.ok for report in reports)
 
 
 def main(args):
+    # Unix-domain sockets only, so the other modes keep working where there are none (Windows)
+    from pyhal.Daemon import serve
+
     print("[HAL] Starting HAL")
     controller = FMEController(port=args.port, baudrate=args.baudrate)
-    pass
+    print(f"[HAL] Serving {args.port} on {args.socket}")
+    try:
+        serve(controller, args.socket)
+    except IpcError as e:
+        print(f"[HAL] {e}", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="HAL")
     parser.add_argument("--port", type=str, default="COM1", help="Serial port to connect to")
     parser.add_argument("--baudrate", type=int, default=9600, help="Baud rate for serial communication")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Unix-domain socket the daemon listens on")
     parser.add_argument("--test", action="store_true", help="Run test commands")
+    parser.add_argument("--fleet", type=str, nargs="+", metavar="PORT[@BAUDRATE]", help="Run a health check or --script on all these ports at once")
+    parser.add_argument("--script", type=str, help="Command script for --fleet, one command and its arguments per line")
+    parser.add_argument("--processes", action="store_true", help="Run --fleet ports in separate processes instead of threads")
+    parser.add_argument("--stop-on-error", action="store_true", help="Stop a port's script at its first failed command")
+    parser.add_argument("--log-level", type=str, default="WARNING", help="Logging level, e.g. DEBUG to trace every frame")
 
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
 
-    if args.test:
+    if args.fleet:
+        sys.exit(0 if fleet(args) else 1)
+    elif args.test:
         test(args)
     else:
         main(args)
@@ -0,0 +1,5 @@
+import serial
+
+# lets serial_for_url find pyhal's own transports (protocol_<scheme> modules in this package), e.g. replay://
+if __name__ not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(__name__)
@@ -0,0 +1 @@
+from pyhal.Trace import ReplaySerial as Serial  # noqa: F401
@@ -0,0 +1 @@
+from pyhal.Simulator import SimulatedSerial as Serial  # noqa: F401
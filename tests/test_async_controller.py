@@ -0,0 +1,63 @@
+import asyncio
+
+from pyhal.AsyncFMEController import AsyncFMEController
+from pyhal.CommandType import CommandType
+from pyhal.MotionPlan import MotionPlan
+
+
+def simulated_controller(url: str = "sim://?wire=0&scale=1&seed=7") -> AsyncFMEController:
+    controller = AsyncFMEController(port=url, completion_model_path="")
+    controller.port.open_pause = 0
+    return controller
+
+
+async def cancel_after(coroutine, delay: float):
+    task = asyncio.create_task(coroutine)
+    await asyncio.sleep(delay)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        return True
+    return False
+
+
+def test_cancelled_plan_resets_its_moves():
+    async def run():
+        controller = simulated_controller()
+        try:
+            assert await controller.connection.ensure()
+            plan = MotionPlan()
+            plan.add(CommandType.TRACK_CLOSE)
+            plan.add(CommandType.VEND_DOOR_OPEN)
+
+            assert await cancel_after(controller.run_plan(plan), 0.1)
+            assert not controller.port.port.boards.moving
+        finally:
+            controller.close()
+
+    asyncio.run(run())
+
+
+def test_cancelled_batch_resets_its_move():
+    async def run():
+        controller = simulated_controller()
+        try:
+            assert await controller.connection.ensure()
+            assert await cancel_after(controller.send_batch([CommandType.RINGLIGHT_ON, CommandType.TRACK_CLOSE]), 0.1)
+            assert not controller.port.port.boards.moving
+        finally:
+            controller.close()
+
+    asyncio.run(run())
+
+
+def test_read_status_connects_first():
+    async def run():
+        controller = simulated_controller()
+        try:
+            assert (await controller.read_status(CommandType.STATUS_PICKER.value.address)).success
+        finally:
+            controller.close()
+
+    asyncio.run(run())
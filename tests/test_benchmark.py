@@ -0,0 +1,23 @@
+from pyhal import Benchmark
+
+
+def result(median: float) -> dict:
+    return {"unit": "us", "median": median}
+
+
+def test_compare_flags_cases_slower_than_the_threshold():
+    baseline = {"results": {"execute": {"status": result(100.0), "move": result(200.0)}, "retry": result(10.0), "gone": result(1.0)}}
+    current = {"results": {"execute": {"status": result(105.0), "move": result(300.0)}, "retry": result(5.0), "new": result(1.0)}}
+
+    rows = Benchmark.compare(baseline, current, threshold=0.1)
+    # only the cases in both result sets, sorted by name
+    assert [row[0] for row in rows] == ["execute/move", "execute/status", "retry"]
+    assert rows[0] == ("execute/move", 200.0, 300.0, 1.5, True)
+    assert rows[1][3] == 1.05 and not rows[1][4]
+    assert rows[2] == ("retry", 10.0, 5.0, 0.5, False)
+
+
+def test_compare_against_its_own_results_finds_no_regression():
+    current = Benchmark.run(["validate_response"])
+    assert Benchmark.flatten(current["results"])
+    assert not any(regressed for *_, regressed in Benchmark.compare(current, current))
@@ -0,0 +1,45 @@
+import json
+import time
+
+from pyhal.CompletionModel import CompletionModel
+
+
+def test_nothing_recorded_writes_nothing(tmp_path):
+    path = tmp_path / "model.json"
+    CompletionModel(str(path)).save()
+    assert not path.exists()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "model.json")
+    model = CompletionModel(path)
+    for elapsed in range(100, 300, 10):
+        model.record("TRACK_OPEN", elapsed)
+    model.record_timeout("TRACK_OPEN", 900)
+    model.save()
+
+    loaded = CompletionModel(path)
+    assert loaded.samples == model.samples
+    assert loaded.censored == {"TRACK_OPEN": [900.0]}
+    assert loaded.timeout("TRACK_OPEN", 30000) == 1800
+
+
+def test_autosave_runs_in_the_background(tmp_path):
+    path = tmp_path / "model.json"
+    model = CompletionModel(str(path))
+    for elapsed in range(model.autosave_every):
+        model.record("TRACK_OPEN", elapsed)
+
+    for _ in range(100):
+        if path.exists() and not model.autosaving:
+            break
+        time.sleep(0.01)
+    assert len(json.loads(path.read_text())["commands"]["TRACK_OPEN"]) == model.autosave_every
+
+
+def test_file_of_the_wrong_shape_is_ignored(tmp_path):
+    path = tmp_path / "model.json"
+    for content in ("[1, 2]", '"text"', '{"commands": {"TRACK_OPEN": 5}}', '{"commands": {"TRACK_OPEN": ["x"]}}', "{not json"):
+        path.write_text(content)
+        model = CompletionModel(str(path))
+        assert model.samples == {}
@@ -0,0 +1,47 @@
+import pytest
+
+from pyhal.CommandType import CommandType
+from pyhal.FMEController import FMEController
+
+
+def simulated_controller(url: str = "sim://?wire=0&scale=0&seed=7") -> FMEController:
+    controller = FMEController(port=url, completion_model_path="")
+    controller.port.open_pause = 0
+    return controller
+
+
+def test_invalid_arguments_raise_before_the_line_is_touched():
+    controller = simulated_controller()
+    try:
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                controller.send_command(CommandType.SEND_TEXT)
+        with pytest.raises(ValueError):
+            controller.send_batch([CommandType.RINGLIGHT_ON, CommandType.SEND_TEXT])
+
+        # the caller's mistakes neither trip the breaker nor cost a reconnect
+        assert controller.send_command(CommandType.SEND_TEXT, "HELLO").success
+        assert controller.connection.reconnect_count == 0
+    finally:
+        controller.close()
+
+
+def test_wait_for_status_defaults_to_a_real_timeout():
+    controller = simulated_controller("sim://?wire=0&scale=1&seed=7")
+    try:
+        assert controller.send_command(CommandType.GRIPPER_EXTEND, wait=False).success
+        condition = CommandType.GRIPPER_EXTEND.value.status_condition
+        error, matched = controller.wait_for_status([condition])
+        assert error is None
+        assert matched == [condition]
+    finally:
+        controller.close()
+
+
+def test_reset_in_a_batch_selects_the_board_again():
+    controller = simulated_controller()
+    try:
+        responses = controller.send_batch([CommandType.RESET, CommandType.AUDIO_ON])
+        assert all(response.success and b"ERR" not in response.raw_response for response in responses)
+    finally:
+        controller.close()
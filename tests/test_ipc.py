@@ -0,0 +1,53 @@
+import socket
+
+import pytest
+
+from pyhal import Ipc
+from pyhal.Common import ErrorCode, PortResponse
+
+
+def test_messages_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        messages = [{"command": "RINGLIGHT_ON", "args": []}, {"text": "héllo" * 1000}, {}]
+        for message in messages:
+            Ipc.send_message(a, message)
+        assert [Ipc.receive_message(b) for _ in messages] == messages
+
+
+def test_message_split_across_reads():
+    a, b = socket.socketpair()
+    with a, b:
+        data = b'{"ok":true}'
+        frame = Ipc.LENGTH.pack(len(data)) + data
+        for i in range(len(frame)):
+            a.send(frame[i : i + 1])
+        assert Ipc.receive_message(b) == {"ok": True}
+
+
+def test_oversized_message_is_refused():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(Ipc.LENGTH.pack(Ipc.MAX_MESSAGE_SIZE + 1))
+        with pytest.raises(Ipc.IpcError):
+            Ipc.receive_message(b)
+
+
+def test_closed_connection_raises():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(Ipc.LENGTH.pack(10) + b"{}")
+        a.close()
+        with pytest.raises(Ipc.IpcError):
+            Ipc.receive_message(b)
+
+
+def test_responses_round_trip():
+    for response in (PortResponse(True, "1OK", b"1OK"), PortResponse(error=ErrorCode.TIMEOUT)):
+        decoded = Ipc.decode_response(Ipc.encode_response(response))
+        assert (decoded.response_valid, decoded.response, decoded.raw_response, decoded.error) == (
+            response.response_valid,
+            response.response,
+            response.raw_response,
+            response.error,
+        )
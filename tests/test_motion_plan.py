@@ -0,0 +1,22 @@
+from pyhal.CommandType import CommandType
+from pyhal.FMEController import FMEController
+from pyhal.MotionPlan import MotionPlan
+
+
+def test_vend_plan_without_timeouts():
+    # no step or plan timeout: every move falls back to its command's move_timeout
+    controller = FMEController(port="sim://?wire=0&scale=0.2&seed=7", completion_model_path="")
+    controller.port.open_pause = 0
+    try:
+        plan = MotionPlan()
+        plan.add(CommandType.TRACK_OPEN)
+        plan.add(CommandType.VEND_DOOR_OPEN)
+        plan.add(CommandType.GRIPPER_EXTEND, after=["TRACK_OPEN"])
+        plan.add(CommandType.GRIPPER_CLOSE, after=["GRIPPER_EXTEND", "VEND_DOOR_OPEN"])
+
+        error, responses = controller.run_plan(plan)
+        assert error is None
+        assert list(responses) == ["TRACK_OPEN", "VEND_DOOR_OPEN", "GRIPPER_EXTEND", "GRIPPER_CLOSE"]
+        assert all(response.error is None for response in responses.values())
+    finally:
+        controller.close()
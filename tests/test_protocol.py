@@ -0,0 +1,115 @@
+from pyhal import Protocol
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector, PortResponse, encode_frame
+from pyhal.ExecutionOptions import ExecutionOptions
+from pyhal.FMEController import FMEController
+
+
+def simulated_controller(url: str) -> FMEController:
+    controller = FMEController(port=url, completion_model_path="")
+    controller.port.open_pause = 0
+    return controller
+
+
+def test_reset_frames_update_output_state():
+    # ROLLER_TO_POS_1 is reset with "K4,P1", and P1 switches the sensor bar off
+    controller = simulated_controller("sim://?wire=0&scale=0&seed=7&stuck=ROLLER_TO_POS_1")
+    try:
+        assert controller.send_command(CommandType.SENSOR_BAR_ON).success
+        # the simulated boards exist once the port is open
+        boards = controller.port.port.boards
+        assert boards.outputs[(AddressSelector.PICKER, "1")]
+
+        response = controller.send_command(CommandType.ROLLER_TO_POS_1, options=ExecutionOptions(operation_timeout=100))
+        assert response.timeout
+        assert not boards.outputs[(AddressSelector.PICKER, "1")]
+
+        skipped = controller.port.state.outputs.skipped
+        assert controller.send_command(CommandType.SENSOR_BAR_ON).success
+        assert controller.port.state.outputs.skipped == skipped
+        assert boards.outputs[(AddressSelector.PICKER, "1")]
+    finally:
+        controller.close()
+
+
+def run(operation, responses: list[bytes]) -> tuple[object, list[bytes]]:
+    """
+    Drives a protocol operation without a port, answering each frame with the next canned response.
+    Returns the operation's result and every frame it wrote.
+    """
+    written = []
+    responses = iter(responses)
+    reply = None
+    try:
+        while True:
+            action = operation.send(reply)
+            if isinstance(action, Protocol.Transmit):
+                written.append(action.frame)
+                reply = PortResponse(True, *canned(next(responses)))
+            elif isinstance(action, Protocol.TransmitBatch):
+                written.extend(action.frames)
+                reply = [PortResponse(True, *canned(next(responses))) for _ in action.frames]
+            else:
+                reply = None
+    except StopIteration as stop:
+        return stop.value, written
+
+
+def canned(raw: bytes) -> tuple[str, bytes]:
+    return raw.decode(), raw
+
+
+def test_framer_finds_a_terminator_split_across_reads():
+    framer = Protocol.ResponseFramer()
+    assert framer.feed(b"1234O") is None
+    response = framer.feed(b"K")
+    assert response.success
+    assert response.raw_response == b"1234OK"
+
+    framer.reset()
+    assert framer.feed(b"E") is None
+    assert framer.feed(b"R") is None
+    assert framer.feed(b"R").raw_response == b"ERR"
+
+
+def test_framer_splits_pipelined_responses():
+    framer = Protocol.ResponseFramer()
+    framer.extend(b"1OK2O")
+    assert framer.next_response().raw_response == b"1OK"
+    assert framer.next_response() is None
+    framer.extend(b"K")
+    assert framer.next_response().raw_response == b"2OK"
+    assert framer.next_response() is None
+
+
+def test_selector_is_skipped_until_the_selection_is_invalidated():
+    state = Protocol.ProtocolState()
+    frame = encode_frame("T")
+    selector = AddressSelector.PICKER.frame
+
+    response, written = run(Protocol.exchange(state, AddressSelector.PICKER, frame, 100), [b"OK", b"OK"])
+    assert response.success
+    assert written == [selector, frame]
+
+    _, written = run(Protocol.exchange(state, AddressSelector.PICKER, frame, 100), [b"OK"])
+    assert written == [frame]
+    assert state.selector_skips == 1
+
+    # another board needs its own selector
+    _, written = run(Protocol.exchange(state, AddressSelector.AUX, frame, 100), [b"OK", b"OK"])
+    assert written == [AddressSelector.AUX.frame, frame]
+
+    state.invalidate_selection()
+    _, written = run(Protocol.exchange(state, AddressSelector.AUX, frame, 100), [b"OK", b"OK"])
+    assert written == [AddressSelector.AUX.frame, frame]
+
+
+def test_error_response_invalidates_the_selection():
+    state = Protocol.ProtocolState()
+    frame = encode_frame("T")
+
+    run(Protocol.exchange(state, AddressSelector.PICKER, frame, 100), [b"OK", b"ERR"])
+    assert state.selected_address is None
+
+    _, written = run(Protocol.exchange(state, AddressSelector.PICKER, frame, 100), [b"OK", b"OK"])
+    assert written == [AddressSelector.PICKER.frame, frame]
@@ -0,0 +1,69 @@
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector, ErrorCode, PortResponse
+from pyhal.ExecutionOptions import ExecutionOptions
+from pyhal.FMEController import FMEController
+from pyhal.RetryPolicy import CircuitBreaker, RetryPolicy
+
+
+def simulated_controller(url: str) -> FMEController:
+    controller = FMEController(port=url, completion_model_path="")
+    controller.port.open_pause = 0
+    return controller
+
+
+def test_retry_policy_backs_off_up_to_the_maximum():
+    policy = RetryPolicy(retries=2, backoff_initial=100, backoff_max=300, jitter=0)
+    timeout = PortResponse(error=ErrorCode.TIMEOUT)
+    assert policy.should_retry(0, timeout)
+    assert policy.should_retry(1, timeout)
+    assert not policy.should_retry(2, timeout)
+    assert not policy.should_retry(0, PortResponse(error=ErrorCode.COMMUNICATION_ERROR))
+    assert [policy.delay(attempt) for attempt in range(4)] == [100, 200, 300, 300]
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker()
+    failure = PortResponse(error=ErrorCode.COMMUNICATION_ERROR)
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.record(AddressSelector.QR, failure)
+    # a success in between starts the count again
+    breaker.record(AddressSelector.QR, PortResponse(True, "OK", b"OK"))
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.record(AddressSelector.QR, failure)
+    assert breaker.allow(AddressSelector.QR)
+
+    breaker.record(AddressSelector.QR, failure)
+    assert not breaker.allow(AddressSelector.QR)
+    assert breaker.allow(AddressSelector.PICKER)
+
+    # half open after the reset timeout: one more failure opens it straight away
+    breaker.reset_timeout = 0
+    assert breaker.allow(AddressSelector.QR)
+    breaker.record(AddressSelector.QR, failure)
+    assert breaker.is_open(AddressSelector.QR)
+
+
+def test_controller_retries_a_timed_out_move():
+    controller = simulated_controller("sim://?wire=0&scale=0&seed=7&stuck=ROLLER_TO_POS_1")
+    try:
+        options = ExecutionOptions(operation_timeout=50, retry=RetryPolicy(retries=1, backoff_initial=1, jitter=0))
+        assert controller.send_command(CommandType.ROLLER_TO_POS_1, options=options).timeout
+        assert controller.metrics.to_dict()["commands"]["ROLLER_TO_POS_1"]["retries"] == 1
+    finally:
+        controller.close()
+
+
+def test_open_breaker_fails_fast_without_touching_the_line():
+    controller = simulated_controller("sim://?wire=0&scale=0&seed=7")
+    try:
+        assert controller.send_command(CommandType.TURN_OFF_GREEN_BUTTON_LED).success
+        for _ in range(controller.breaker.failure_threshold):
+            controller.breaker.record(AddressSelector.QR, PortResponse(error=ErrorCode.COMMUNICATION_ERROR))
+
+        sent = controller.metrics.bytes_sent
+        assert controller.send_command(CommandType.TURN_ON_GREEN_BUTTON_LED).error == ErrorCode.ARCUS_UNRESPONSIVE
+        assert controller.metrics.bytes_sent == sent
+        # other boards are unaffected
+        assert controller.send_command(CommandType.RINGLIGHT_ON).success
+    finally:
+        controller.close()
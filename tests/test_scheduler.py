@@ -0,0 +1,23 @@
+import time
+
+from pyhal.CommandScheduler import CommandScheduler
+from pyhal.CommandType import CommandType
+from pyhal.Common import ErrorCode
+from pyhal.FMEController import FMEController
+
+
+def test_halt_cancels_the_move_it_cuts_into():
+    controller = FMEController(port="sim://?wire=0&scale=1&seed=7", completion_model_path="")
+    controller.port.open_pause = 0
+    with CommandScheduler(controller) as scheduler:
+        move = scheduler.submit(CommandType.QLM_ENGAGE)
+        time.sleep(0.1)
+        halt = scheduler.submit(CommandType.QLM_HALT)
+
+        assert halt.result(5).success
+        assert move.result(5).error == ErrorCode.CANCELLED
+        assert "QLM_ENGAGE" not in controller.completion_model.samples
+
+        # a move on its own still completes
+        assert scheduler.send_command(CommandType.QLM_DISENGAGE).success
+    controller.close()
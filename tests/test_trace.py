@@ -0,0 +1,38 @@
+from pyhal import Trace
+from pyhal.CommandType import CommandType
+from pyhal.Common import AddressSelector
+from pyhal.FMEController import FMEController
+
+COMMANDS = (CommandType.RINGLIGHT_ON, CommandType.ROLLER_TO_POS_1, CommandType.TURN_ON_GREEN_BUTTON_LED, CommandType.RINGLIGHT_ON)
+
+
+def simulated_controller(url: str) -> FMEController:
+    controller = FMEController(port=url, completion_model_path="")
+    controller.port.open_pause = 0
+    return controller
+
+
+def run_session(controller: FMEController) -> list[tuple]:
+    try:
+        return [(response.error, response.response) for response in map(controller.send_command, COMMANDS)]
+    finally:
+        controller.close()
+
+
+def test_recorded_session_replays_without_mismatches(tmp_path):
+    path = str(tmp_path / "session.trace")
+    controller = simulated_controller("sim://?wire=0&scale=0&seed=7")
+    writer = Trace.record(controller.port, path)
+    recorded = run_session(controller)
+    Trace.stop_recording(controller.port)
+    assert writer.file.closed
+
+    frames = list(Trace.decode_trace(path))
+    assert ("O2", ("RINGLIGHT_ON",)) in [(frame, names) for _, _, frame, names in frames]
+    assert {address for _, address, _, _ in frames} >= {AddressSelector.PICKER, AddressSelector.QR}
+
+    controller = simulated_controller(f"replay://{path}?speed=0")
+    replay = controller.port.port
+    assert run_session(controller) == recorded
+    assert replay.mismatches == 0
+    assert replay.frames > 0